@@ -0,0 +1,70 @@
+"""Compare two benchmarks.suite result files and flag regressions.
+
+Run from the project root:
+    python -m benchmarks.compare baseline.json bench.json --tolerance 0.15
+
+Exits with status 1 if any throughput dropped, or any latency percentile
+rose, by more than the tolerance.
+"""
+import argparse
+import json
+import sys
+
+HIGHER_IS_BETTER = ("items_per_second",)
+LOWER_IS_BETTER = ("p50_ms", "p90_ms", "p99_ms")
+
+
+def flatten(results, prefix=""):
+    """Yield (path, summary) for every summary dict in a results tree."""
+    for key, value in sorted(results.items()):
+        if not isinstance(value, dict):
+            continue
+        if "items_per_second" in value:
+            yield prefix + key, value
+        else:
+            yield from flatten(value, f"{prefix}{key}.")
+
+
+def compare(baseline, current, tolerance):
+    """Return (rows, regressions); each row is (path, metric, old, new, relative change)."""
+    old = dict(flatten(baseline["results"]))
+    rows, regressions = [], []
+    for path, summary in flatten(current["results"]):
+        if path not in old:
+            continue
+        for metric in HIGHER_IS_BETTER + LOWER_IS_BETTER:
+            before, after = old[path].get(metric), summary.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            row = (path, metric, before, after, change)
+            rows.append(row)
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            if worse > tolerance:
+                regressions.append(row)
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows, regressions = compare(baseline, current, args.tolerance)
+
+    print(f"{baseline.get('commit')} -> {current.get('commit')}")
+    for path, metric, before, after, change in rows:
+        flag = "  REGRESSION" if (path, metric, before, after, change) in regressions else ""
+        print(f"{path:40} {metric:17} {before:12,.2f} -> {after:12,.2f} {change:+8.1%}{flag}")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
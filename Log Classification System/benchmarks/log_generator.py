@@ -0,0 +1,136 @@
+"""Synthetic log generator seeded from test.csv and the training dataset.
+
+Run from the project root:
+    python -m benchmarks.log_generator --lines 100000 --legacy-ratio 0.05 --duplicate-ratio 0.3 -o logs.csv
+    python -m benchmarks.log_generator --tier-weights regex=0.2,bert=0.75,llm=0.05 \
+        --source-weights ModernCRM=3,BillingSystem=1 -o logs.csv
+
+New lines are seed messages of the chosen source kind with their numbers
+re-drawn, so they share templates with real traffic; a `--duplicate-ratio`
+share of lines repeats an earlier line verbatim. `--tier-weights` sets the
+share of each tier: LegacyCRM lines (llm), and lines of the other sources
+drawn from seeds the shipped regex rules match (regex) or miss (bert). It
+replaces `--legacy-ratio`. `--source-weights` weighs the non-LegacyCRM
+sources, which are otherwise equally likely.
+"""
+import argparse
+import csv
+import random
+import re
+
+SEED_FILES = ("test.csv", "Training/dataset/synthetic_logs.csv")
+LEGACY_SOURCE = "LegacyCRM"
+TIERS = ("regex", "bert", "llm")
+
+_NUMBER = re.compile(r"\d+")
+
+
+def load_seeds(paths=SEED_FILES):
+    """Return (legacy_messages, other_messages, other_sources) from the seed CSVs."""
+    legacy, other, sources = set(), set(), set()
+    for path in paths:
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f, skipinitialspace=True):
+                source, message = row["source"].strip(), row["log_message"].strip()
+                if source == LEGACY_SOURCE:
+                    legacy.add(message)
+                else:
+                    other.add(message)
+                    sources.add(source)
+    return sorted(legacy), sorted(other), sorted(sources)
+
+
+def _redraw_numbers(message, rng):
+    # Keep the digit count so IDs, ports and timestamps keep their shape.
+    return _NUMBER.sub(lambda m: str(rng.randint(10 ** (len(m.group()) - 1) if len(m.group()) > 1 else 0,
+                                                 10 ** len(m.group()) - 1)), message)
+
+
+def split_by_regex(messages):
+    """(regex_hits, regex_misses) of `messages` under the shipped regex rules."""
+    from processor_regex import load_rules
+    engine = load_rules()
+    hits, misses = [], []
+    for message in messages:
+        (misses if engine.match(message) is None else hits).append(message)
+    return hits, misses
+
+
+def parse_weights(text):
+    """'regex=0.2,bert=0.75' -> {'regex': 0.2, 'bert': 0.75}"""
+    weights = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        weights[name.strip()] = float(weight)
+    return weights
+
+
+def generate(lines, legacy_ratio=0.05, duplicate_ratio=0.0, seed=0, seeds=None, tier_weights=None,
+             source_weights=None):
+    """Return `lines` (source, log_message) pairs.
+
+    `legacy_ratio` is the share of LegacyCRM lines (the LLM tier), the rest
+    is spread over the other sources; `duplicate_ratio` is the share of
+    lines that repeat an earlier line exactly. `tier_weights` ({"regex": w,
+    "bert": w, "llm": w}, missing tiers weigh 0) replaces `legacy_ratio`
+    and also sets how many of the other lines the regex rules match.
+    `source_weights` ({source: w}) weighs the non-LegacyCRM sources; sources
+    it leaves out are not drawn.
+    """
+    rng = random.Random(seed)
+    legacy, other, sources = seeds or load_seeds()
+    if tier_weights is None:
+        pools = {"llm": legacy, "other": other}
+        tier_weights = {"llm": legacy_ratio, "other": 1 - legacy_ratio}
+    else:
+        unknown = set(tier_weights) - set(TIERS)
+        if unknown:
+            raise ValueError(f"unknown tiers {sorted(unknown)}, expected some of {', '.join(TIERS)}")
+        pools = dict(zip(("regex", "bert"), split_by_regex(other)), llm=legacy)
+    tiers = [tier for tier, weight in tier_weights.items() if weight > 0]
+    for tier in tiers:
+        if not pools[tier]:
+            raise ValueError(f"no seed messages for the {tier} tier")
+    weights = [tier_weights[tier] for tier in tiers]
+    if source_weights is not None:
+        sources = [source for source, weight in source_weights.items() if weight > 0]
+        source_weights = [source_weights[source] for source in sources]
+    logs = []
+    for _ in range(lines):
+        if logs and rng.random() < duplicate_ratio:
+            logs.append(rng.choice(logs))
+            continue
+        tier = rng.choices(tiers, weights)[0]
+        if tier == "llm":
+            logs.append((LEGACY_SOURCE, _redraw_numbers(rng.choice(legacy), rng)))
+        else:
+            source = rng.choice(sources) if source_weights is None else rng.choices(sources, source_weights)[0]
+            logs.append((source, _redraw_numbers(rng.choice(pools[tier]), rng)))
+    return logs
+
+
+def write_csv(logs, path):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["source", "log_message"])
+        writer.writerows(logs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=10000)
+    parser.add_argument("--legacy-ratio", type=float, default=0.05)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0)
+    parser.add_argument("--tier-weights", type=parse_weights, help="e.g. regex=0.2,bert=0.75,llm=0.05")
+    parser.add_argument("--source-weights", type=parse_weights, help="e.g. ModernCRM=3,BillingSystem=1")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default="synthetic_logs.csv")
+    args = parser.parse_args()
+    logs = generate(args.lines, args.legacy_ratio, args.duplicate_ratio, args.seed,
+                    tier_weights=args.tier_weights, source_weights=args.source_weights)
+    write_csv(logs, args.output)
+    print(f"wrote {args.lines} lines to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
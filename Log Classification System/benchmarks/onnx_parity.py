@@ -0,0 +1,67 @@
+"""Accuracy-parity check and timing: ONNX Runtime encoder vs. SentenceTransformer.
+
+Run from the project root (exports the ONNX model first if needed):
+    python -m benchmarks.onnx_parity --csv test.csv --repeat 20
+
+Both backends encode the same log messages; the check fails if any pair of
+embeddings falls below --min-cosine or if the classifier on top assigns a
+different label to any message.
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import onnx_encoder
+from processor_bert import ENCODER_NAME, _predict
+
+
+def timed(encoder, messages, repeat):
+    encoder.encode(messages)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        embeddings = encoder.encode(messages)
+    return (time.perf_counter() - start) / repeat, np.asarray(embeddings, dtype=np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default="test.csv")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--min-cosine", type=float, default=0.98)
+    parser.add_argument("--fp32", action="store_true", help="check the unquantized export instead of int8")
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+
+    messages = pd.read_csv(args.csv)["log_message"].astype(str).tolist()
+    torch_time, reference = timed(SentenceTransformer(ENCODER_NAME, device="cpu"), messages, args.repeat)
+    onnx_time, candidate = timed(onnx_encoder.load(ENCODER_NAME, quantized=not args.fp32), messages, args.repeat)
+
+    cosine = (reference * candidate).sum(axis=1) / (
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1)
+    )
+    reference_labels = _predict(reference)
+    candidate_labels = _predict(candidate)
+    mismatches = [
+        (message, expected, got)
+        for message, expected, got in zip(messages, reference_labels, candidate_labels)
+        if expected != got
+    ]
+
+    print(f"messages   : {len(messages)}  backend: onnx-{'fp32' if args.fp32 else 'int8'}")
+    print(f"cosine     : min {cosine.min():.4f}  mean {cosine.mean():.4f}")
+    print(f"labels     : {len(messages) - len(mismatches)}/{len(messages)} identical")
+    print(f"torch      : {torch_time * 1000:8.1f} ms/pass")
+    print(f"onnx       : {onnx_time * 1000:8.1f} ms/pass  ({torch_time / onnx_time:.2f}x)")
+    for message, expected, got in mismatches:
+        print(f"  mismatch: {expected!r} -> {got!r}: {message}")
+
+    if mismatches or cosine.min() < args.min_cosine:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Micro-benchmark: compiled rule engine vs. the original per-call regex loop.
+
+Run from the project root:
+    python -m benchmarks.regex_engine --lines 200000 --extra-rules 200
+"""
+import argparse
+import random
+import re
+import time
+
+from processor_regex import RegexRuleEngine, load_rules
+
+
+def legacy_classify_with_regex(log_message, regex_patterns):
+    # The pre-engine implementation: one re.search per rule, every call.
+    for patern , label in regex_patterns.items():
+        if re.search(patern , log_message) :
+            return label
+    return None
+
+
+def synthetic_rules(count):
+    # Rules that never match the sample lines, to show how cost grows with rule count.
+    return [(rf"Service Svc{i:04d} (started|stopped) on node .*", "System Notification") for i in range(count)]
+
+
+def sample_lines(count, seed=0):
+    rng = random.Random(seed)
+    shapes = [
+        lambda: f"User User{rng.randint(1, 999)} logged {rng.choice(['in', 'out'])}.",
+        lambda: f"Backup started at 2025-05-{rng.randint(10, 28)} 0{rng.randint(1, 9)}:00:00.",
+        lambda: f"File data_{rng.randint(1000, 9999)}.csv uploaded successfully by user User{rng.randint(1, 999)}.",
+        lambda: f"Account with ID {rng.randint(1000, 9999)} created by Admin.",
+        lambda: f"IP 192.168.{rng.randint(0, 255)}.{rng.randint(0, 255)} blocked due to potential attack",
+        lambda: f"Admin access escalation detected for user {rng.randint(1000, 9999)}",
+        lambda: f"Multiple login failures occurred on user {rng.randint(1000, 9999)} account",
+    ]
+    return [rng.choice(shapes)() for _ in range(count)]
+
+
+def timed(fn, lines):
+    start = time.perf_counter()
+    labels = [fn(line) for line in lines]
+    return time.perf_counter() - start, labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=100000)
+    parser.add_argument("--extra-rules", type=int, default=0)
+    args = parser.parse_args()
+
+    base = load_rules()
+    rules = base.rules + synthetic_rules(args.extra_rules)
+    engine = RegexRuleEngine(rules)
+    patterns = dict(rules)
+    lines = sample_lines(args.lines)
+
+    legacy_time, legacy_labels = timed(lambda line: legacy_classify_with_regex(line, patterns), lines)
+    engine_time, engine_labels = timed(engine.match, lines)
+    assert legacy_labels == engine_labels, "engine and legacy loop disagree"
+
+    print(f"rules: {len(rules)}  lines: {len(lines)}")
+    print(f"legacy loop : {legacy_time:8.3f}s  {len(lines) / legacy_time:12,.0f} lines/s")
+    print(f"rule engine : {engine_time:8.3f}s  {len(lines) / engine_time:12,.0f} lines/s")
+    print(f"speedup     : {legacy_time / engine_time:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
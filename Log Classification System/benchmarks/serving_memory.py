@@ -0,0 +1,161 @@
+"""Startup time and memory of server.py with one worker and with N workers.
+
+Run from the project root (Linux, memory is read from /proc):
+    python -m benchmarks.serving_memory --workers 4 -o serving.json
+
+Each mode starts the server with 1 and with --workers workers:
+    uvicorn   uvicorn --workers N; every worker is a fresh interpreter that loads its own models
+    gunicorn  gunicorn -c gunicorn.conf.py; the master loads the models once and forks the workers
+
+Startup is the time until every worker has answered /ready with 200. Memory
+is summed over the whole process tree, after startup and again after some
+/classify/json traffic. RSS counts shared pages once per process, so it
+overstates the sharing modes; PSS splits each shared page between the
+processes that map it, and USS counts only the pages private to a process.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+from benchmarks.log_generator import generate
+from benchmarks.suite import _free_port, _post, git_commit
+from benchmarks.stub_llm_server import start_stub_server
+
+MODES = ("uvicorn", "gunicorn")
+
+
+def command(mode, workers, port):
+    if mode == "uvicorn":
+        args = [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"]
+        return args + (["--workers", str(workers)] if workers > 1 else [])
+    return [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-w", str(workers),
+            "-b", f"127.0.0.1:{port}", "--log-level", "warning", "server:app"]
+
+
+def process_tree(root):
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The parent pid is the second field after the parenthesized command.
+                parent = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+    pids, pending = [], [root]
+    while pending:
+        pid = pending.pop()
+        pids.append(pid)
+        pending.extend(children.get(pid, []))
+    return pids
+
+
+def memory(root):
+    """RSS, PSS and USS in MiB, summed over `root` and its descendants."""
+    totals = {"rss": 0, "pss": 0, "uss": 0}
+    pids = process_tree(root)
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/smaps_rollup") as f:
+                fields = {line.split(":")[0]: int(line.split()[1]) for line in f if line.split()[-1:] == ["kB"]}
+        except OSError:
+            continue
+        totals["rss"] += fields.get("Rss", 0)
+        totals["pss"] += fields.get("Pss", 0)
+        totals["uss"] += fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    result = {f"{name}_mib": round(kib / 1024, 1) for name, kib in totals.items()}
+    result["processes"] = len(pids)
+    return result
+
+
+def wait_ready(base, workers, process, timeout):
+    """Seconds until `workers` distinct worker processes have answered /ready with 200."""
+    ready, lock, stop = set(), threading.Lock(), threading.Event()
+    start = time.perf_counter()
+
+    def poll():
+        while not stop.is_set():
+            try:
+                with urllib.request.urlopen(f"{base}/ready", timeout=5) as response:
+                    pid = json.load(response)["pid"]
+                    with lock:
+                        ready.add(pid)
+            except OSError:
+                time.sleep(0.1)
+
+    # Concurrent polls, so every worker gets some of them.
+    threads = [threading.Thread(target=poll, daemon=True) for _ in range(2 * workers)]
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            with lock:
+                if len(ready) >= workers:
+                    return time.perf_counter() - start
+            if process.poll() is not None or time.perf_counter() - start > timeout:
+                raise RuntimeError("server did not become ready")
+            time.sleep(0.05)
+    finally:
+        stop.set()
+
+
+def run(mode, workers, logs, env, timeout):
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen(command(mode, workers, port), env=env)
+    try:
+        result = {"startup_seconds": round(wait_ready(base, workers, process, timeout), 2)}
+        result["after_ready"] = memory(process.pid)
+        for start in range(0, len(logs), 64):
+            records = [{"source": source, "log_message": message} for source, message in logs[start:start + 64]]
+            _post(f"{base}/classify/json", json.dumps(records).encode("utf-8"), "application/json")
+        result["after_traffic"] = memory(process.pid)
+        return result
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--modes", default=",".join(MODES), help=f"comma separated subset of {','.join(MODES)}")
+    parser.add_argument("--lines", type=int, default=2000, help="rows sent after startup")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("-o", "--output", default="serving.json")
+    args = parser.parse_args()
+
+    stub, stub_url = start_stub_server(latency=0.0)
+    # Caches off, so every run does the same work and no worker reuses another's SQLite files.
+    env = dict(os.environ, GROQ_BASE_URL=stub_url, GROQ_API_KEY=os.environ.get("GROQ_API_KEY", "stub"),
+               BERT_CACHE="0", LLM_CACHE="0", LLM_INDEX="0", MODEL_WATCH_INTERVAL="0")
+    logs = generate(args.lines, 0.05, 0.3, 0)
+
+    results = {}
+    for mode in args.modes.split(","):
+        for workers in sorted({1, args.workers}):
+            print(f"running {mode} with {workers} workers ...", flush=True)
+            results.setdefault(mode, {})[f"workers_{workers}"] = run(mode, workers, logs, env, args.timeout)
+    stub.shutdown()
+
+    report = {
+        "commit": git_commit(),
+        "cpus": os.cpu_count(),
+        "params": {k: v for k, v in vars(args).items() if k != "output"},
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(json.dumps(results, indent=2, sort_keys=True))
+    print(f"wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Local stand-in for the Groq chat completions API.
+
+Answers the single- and multi-message prompts of processor_llm with
+<category> tags picked by keyword, after a configurable delay, so the LLM tier
+can be exercised offline:
+
+    python -m benchmarks.stub_llm_server --port 8900 --latency 0.3
+    GROQ_BASE_URL=http://127.0.0.1:8900 GROQ_API_KEY=stub python classify.py ...
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEPRECATION_HINTS = ("deprecat", "no longer supported", "retired", "outdated", "discontinued", "will be removed")
+
+
+def stub_category(log_msg):
+    lowered = log_msg.lower()
+    return "Deprecation Warning" if any(hint in lowered for hint in DEPRECATION_HINTS) else "Workflow Error"
+
+
+def stub_answer(prompt):
+    if "Log messages:" in prompt:
+        lines = prompt.split("Log messages:", 1)[1].strip().splitlines()
+        messages = [re.sub(r"^\d+\.\s*", "", line) for line in lines]
+    else:
+        messages = [prompt.split("Log message:", 1)[-1].strip()]
+    return "\n".join(f"<category>{stub_category(message)}</category>" for message in messages)
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    error_rate = 0.0
+    requests_served = 0
+    _count_lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        time.sleep(self.latency)
+        with self._count_lock:
+            type(self).requests_served += 1
+        if random.random() < self.error_rate:
+            self._reply(503, {"error": {"message": "stub overloaded", "type": "server_error"}})
+            return
+        prompt = body["messages"][-1]["content"]
+        self._reply(200, {
+            "id": "stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": stub_answer(prompt)},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        })
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(port=0, latency=0.0, error_rate=0.0):
+    """Start the stub in a daemon thread; returns (server, base_url)."""
+    handler = type("ConfiguredStubLLMHandler", (StubLLMHandler,), {"latency": latency, "error_rate": error_rate})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    args = parser.parse_args()
+    server, url = start_stub_server(args.port, args.latency, args.error_rate)
+    print(f"stub LLM listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""Throughput and latency of each classification tier, written to a JSON file.
+
+Run from the project root:
+    python -m benchmarks.suite --lines 5000 --output bench.json
+    python -m benchmarks.suite --tiers regex,classify --server -o bench.json
+    python -m benchmarks.compare baseline.json bench.json
+
+The LLM tier, and the server in end-to-end runs, talk to the in-process stub
+from benchmarks/stub_llm_server.py, so no API key is needed. Caches are off
+unless --cache is given (which also keeps the LegacyCRM label index), so
+repeated runs measure the same work.
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.log_generator import LEGACY_SOURCE, generate, parse_weights
+from benchmarks.stub_llm_server import start_stub_server
+
+TIERS = ("regex", "bert", "llm", "classify")
+
+
+def summarize(latencies, items, seconds):
+    """Throughput over the whole run plus percentiles of the per-call latencies, in ms."""
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 3)
+
+    return {
+        "items": items,
+        "calls": len(ordered),
+        "seconds": round(seconds, 4),
+        "items_per_second": round(items / seconds, 1) if seconds else None,
+        "p50_ms": percentile(50),
+        "p90_ms": percentile(90),
+        "p99_ms": percentile(99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def run_calls(fn, inputs):
+    latencies = []
+    start = time.perf_counter()
+    for item in inputs:
+        call_start = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - call_start)
+    return latencies, time.perf_counter() - start
+
+
+def batches(items, size):
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+def bench_regex(logs, batch_size):
+    from processor_regex import classify_with_regex, classify_with_regex_batch
+    messages = [message for source, message in logs if source != LEGACY_SOURCE]
+    latencies, seconds = run_calls(classify_with_regex, messages)
+    single = summarize(latencies, len(messages), seconds)
+    latencies, seconds = run_calls(classify_with_regex_batch, batches(messages, batch_size))
+    return {"single": single, "batch": summarize(latencies, len(messages), seconds)}
+
+
+def bench_bert(logs, batch_size):
+    import model_registry
+    from processor_bert import classify_with_bert_batch
+    model_registry.warm_up(["encoder", "classifier", "bert_cache"])
+    messages = [message for source, message in logs if source != LEGACY_SOURCE]
+    latencies, seconds = run_calls(
+        lambda batch: classify_with_bert_batch(batch, batch_size=batch_size), batches(messages, batch_size)
+    )
+    return {"batch": summarize(latencies, len(messages), seconds)}
+
+
+def bench_llm(logs, batch_size):
+    from processor_llm import classify_with_llm_batch
+    messages = [message for source, message in logs if source == LEGACY_SOURCE]
+    if not messages:
+        return None
+    latencies, seconds = run_calls(classify_with_llm_batch, batches(messages, batch_size))
+    return {"batch": summarize(latencies, len(messages), seconds)}
+
+
+def bench_classify(logs, batch_size):
+    from classify import classify
+    report = {}
+    start = time.perf_counter()
+    classify(logs, batch_size=batch_size, report=report)
+    seconds = time.perf_counter() - start
+    result = {"end_to_end": summarize([seconds], len(logs), seconds)}
+    if "unique_templates" in report:
+        result["unique_templates"] = report["unique_templates"]
+    start = time.perf_counter()
+    classify(logs, batch_size=batch_size, mine_templates=False)
+    seconds = time.perf_counter() - start
+    result["without_templates"] = summarize([seconds], len(logs), seconds)
+    return result
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _multipart_csv(logs):
+    boundary = uuid.uuid4().hex
+    lines = ["source,log_message"] + [f'{source},"{message.replace(chr(34), chr(34) * 2)}"' for source, message in logs]
+    body = (
+        f"--{boundary}\r\n"
+        'Content-Disposition: form-data; name="file"; filename="bench.csv"\r\n'
+        "Content-Type: text/csv\r\n\r\n" + "\n".join(lines) + f"\r\n--{boundary}--\r\n"
+    ).encode("utf-8")
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def _post(url, body, content_type, timeout=600):
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": content_type})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.read()
+
+
+def bench_server(logs, json_requests, concurrency, env):
+    """Start server.py under uvicorn and time a CSV upload and concurrent /classify/json calls."""
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    try:
+        deadline = time.monotonic() + 300
+        while True:
+            try:
+                with urllib.request.urlopen(f"{base}/ready", timeout=5) as response:
+                    if response.status == 200:
+                        break
+            except OSError:
+                pass
+            if process.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("server did not become ready")
+            time.sleep(0.5)
+
+        result = {}
+        body, content_type = _multipart_csv(logs)
+        for stream in ("true", "false"):
+            start = time.perf_counter()
+            _post(f"{base}/classify/?stream={stream}", body, content_type)
+            seconds = time.perf_counter() - start
+            result[f"csv_stream_{stream}"] = summarize([seconds], len(logs), seconds)
+
+        records = [
+            json.dumps({"source": source, "log_message": message}).encode("utf-8")
+            for source, message in logs[:json_requests]
+        ]
+
+        def call(record):
+            call_start = time.perf_counter()
+            _post(f"{base}/classify/json", record, "application/json")
+            return time.perf_counter() - call_start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            latencies = list(pool.map(call, records))
+        result["json_single_record"] = summarize(latencies, len(records), time.perf_counter() - start)
+        result["json_concurrency"] = concurrency
+        return result
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=5000)
+    parser.add_argument("--legacy-ratio", type=float, default=0.05)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.3)
+    parser.add_argument("--tier-weights", type=parse_weights, help="e.g. regex=0.2,bert=0.75,llm=0.05")
+    parser.add_argument("--source-weights", type=parse_weights, help="e.g. ModernCRM=3,BillingSystem=1")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--tiers", default=",".join(TIERS), help=f"comma separated subset of {','.join(TIERS)}")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="stub LLM seconds per request")
+    parser.add_argument("--cache", action="store_true", help="keep the BERT and LLM caches on")
+    parser.add_argument("--server", action="store_true", help="also run end-to-end against server.py")
+    parser.add_argument("--json-requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("-o", "--output", default="bench.json")
+    args = parser.parse_args()
+
+    stub, stub_url = start_stub_server(latency=args.llm_latency)
+    # Set before the processors are imported, they read their settings once.
+    os.environ.update({"GROQ_BASE_URL": stub_url, "GROQ_API_KEY": os.environ.get("GROQ_API_KEY", "stub")})
+    if not args.cache:
+        os.environ.update({"BERT_CACHE": "0", "LLM_CACHE": "0", "LLM_INDEX": "0"})
+
+    logs = generate(args.lines, args.legacy_ratio, args.duplicate_ratio, args.seed,
+                    tier_weights=args.tier_weights, source_weights=args.source_weights)
+    benches = {"regex": bench_regex, "bert": bench_bert, "llm": bench_llm, "classify": bench_classify}
+    results = {}
+    for tier in args.tiers.split(","):
+        print(f"running {tier} ...", flush=True)
+        results[tier] = benches[tier](logs, args.batch_size)
+    if args.server:
+        print("running server ...", flush=True)
+        results["server"] = bench_server(logs, args.json_requests, args.concurrency, dict(os.environ))
+    stub.shutdown()
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "params": {k: v for k, v in vars(args).items() if k != "output"},
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(json.dumps(results, indent=2, sort_keys=True))
+    print(f"wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import logging
+import os
+import random
+import threading
+import time
+
+import joblib
+import numpy as np
+
+import metrics
+from embedding_cache import file_fingerprint
+
+RELOAD_FAILURES = metrics.counter(
+    "log_classifier_model_reload_failures_total", "Classifier file changes the watcher rejected"
+)
+
+log = logging.getLogger(__name__)
+
+
+class ClassifierVersion:
+    __slots__ = ("version", "fingerprint", "path", "model", "loaded_at", "smoke_accuracy")
+
+    def __init__(self, path, model, fingerprint, smoke_accuracy=None):
+        self.path = path
+        self.model = model
+        self.fingerprint = fingerprint
+        self.version = fingerprint[:12]
+        self.loaded_at = time.time()
+        self.smoke_accuracy = smoke_accuracy
+
+    def describe(self):
+        return {
+            "version": self.version,
+            "path": self.path,
+            "loaded_at": self.loaded_at,
+            "classes": [str(label) for label in self.model.classes_],
+            "smoke_accuracy": self.smoke_accuracy,
+        }
+
+
+class ModelValidationError(ValueError):
+    pass
+
+
+class ClassifierRegistry:
+    """Active BERT-tier classifier plus optional shadow versions, swappable at runtime.
+
+    `active` is replaced by a single reference assignment, so a request that
+    has already taken it keeps the version it started with and nothing in
+    flight is dropped. New versions are loaded and validated on a smoke
+    sample (embeddings of labeled training messages) before they are swapped
+    in; a version that fails to load or scores below `min_smoke_accuracy`
+    never serves. Shadow versions score a `shadow_rate` share of batches
+    next to the active one, without affecting the labels returned.
+    """
+
+    def __init__(self, path, smoke_sample=None, min_smoke_accuracy=0.0, shadow_rate=0.0, on_swap=None):
+        self.path = path
+        self._smoke_sample = smoke_sample
+        self.min_smoke_accuracy = min_smoke_accuracy
+        self.shadow_rate = shadow_rate
+        self._on_swap = on_swap
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._stop = threading.Event()
+        self.shadows = {}
+        self.active = self.load(path, validate=False)
+
+    def load(self, path, validate=True, min_accuracy=None):
+        """Load and (optionally) validate a classifier file without activating it."""
+        fingerprint = file_fingerprint(path)
+        model = joblib.load(path)
+        if not hasattr(model, "predict_proba") or not hasattr(model, "classes_"):
+            raise ModelValidationError(f"{path} is not a fitted probabilistic classifier")
+        if min_accuracy is None:
+            min_accuracy = self.min_smoke_accuracy
+        accuracy = self._smoke_test(model, min_accuracy) if validate else None
+        return ClassifierVersion(path, model, fingerprint, accuracy)
+
+    def _smoke_test(self, model, min_accuracy):
+        if self._smoke_sample is None:
+            return None
+        embeddings, labels = self._smoke_sample()
+        if not len(labels):
+            return None
+        try:
+            probabilities = model.predict_proba(embeddings)
+        except Exception as e:
+            raise ModelValidationError(f"predict_proba failed on the smoke sample: {e}") from e
+        if probabilities.shape != (len(labels), len(model.classes_)) or not np.isfinite(probabilities).all():
+            raise ModelValidationError("predict_proba returned malformed probabilities on the smoke sample")
+        predicted = model.classes_[probabilities.argmax(axis=1)]
+        accuracy = float(np.mean([str(p) == label for p, label in zip(predicted, labels)]))
+        if accuracy < min_accuracy:
+            raise ModelValidationError(f"smoke accuracy {accuracy:.3f} is below the minimum of {min_accuracy:.3f}")
+        return round(accuracy, 4)
+
+    def reload(self, path=None):
+        """Load `path` (default: the configured file), validate it and make it the active version."""
+        path = path or self.path
+        candidate = self.load(path)
+        with self._lock:
+            if candidate.fingerprint == self.active.fingerprint:
+                return self.active
+            self.active = candidate
+            # A version promoted from shadow no longer needs shadowing.
+            self.shadows = {version: shadow for version, shadow in self.shadows.items() if version != candidate.version}
+        if self._on_swap is not None:
+            self._on_swap(candidate)
+        return candidate
+
+    def add_shadow(self, path):
+        # Shadows are there to find out how well a candidate does, so only
+        # malformed output rejects one, not its accuracy.
+        candidate = self.load(path, min_accuracy=0.0)
+        with self._lock:
+            self.shadows = {**self.shadows, candidate.version: candidate}
+        return candidate
+
+    def remove_shadow(self, version):
+        with self._lock:
+            shadows = dict(self.shadows)
+            removed = shadows.pop(version, None)
+            self.shadows = shadows
+        return removed is not None
+
+    def sample_shadows(self):
+        """The shadow versions that should score the current batch (none most of the time)."""
+        shadows = self.shadows
+        if not shadows or random.random() >= self.shadow_rate:
+            return []
+        return list(shadows.values())
+
+    def describe(self):
+        return {
+            "active": self.active.describe(),
+            "shadows": [shadow.describe() for shadow in self.shadows.values()],
+            "shadow_rate": self.shadow_rate,
+        }
+
+    def watch(self, interval):
+        """Reload whenever the configured file changes, polled every `interval` seconds."""
+        if self._watcher is not None or interval <= 0:
+            return
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self, interval):
+        def stamp():
+            try:
+                stat = os.stat(self.path)
+                return stat.st_mtime_ns, stat.st_size
+            except FileNotFoundError:
+                return None
+
+        seen = stamp()
+        while not self._stop.wait(interval):
+            current = stamp()
+            if current is None or current == seen:
+                continue
+            # Wait until the file stops changing, so a copy in progress is not loaded.
+            time.sleep(interval / 2)
+            if stamp() != current:
+                continue
+            seen = current
+            try:
+                self.reload()
+            except Exception as e:
+                RELOAD_FAILURES.inc()
+                log.warning("model reload of %s rejected: %s", self.path, e)
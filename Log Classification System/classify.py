@@ -1,38 +1,366 @@
+import argparse
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
 
-from processor_bert import classify_with_bert
-from processor_llm import classify_with_llm
-from processor_regex import classify_with_regex
+import metrics
+import processor_bert
+from processor_bert import classify_with_bert, classify_with_bert_batch
+from processor_llm import classify_with_llm, classify_with_llm_batch
+from processor_regex import classify_with_regex, classify_with_regex_batch
+from template_miner import group_logs
 
+BATCH_SIZE = 64
+
+TEMPLATE_COPIES = metrics.counter(
+    "log_classifier_template_copies_total", "Rows labeled by copying the label of their template's representative"
+)
+DUPLICATE_COPIES = metrics.counter(
+    "log_classifier_duplicate_copies_total", "Rows labeled by copying the label of an identical (source, log_message) row"
+)
+DEDUPE_ROWS = metrics.counter(
+    "log_classifier_dedupe_rows_total", "Rows checked for identical copies (input) and the distinct ones (unique)",
+    ["kind"],
+)
+
+
+def _record_dedupe(rows, unique):
+    # On every path, streamed chunks and job chunks included: 1 - unique / input is the dedupe ratio.
+    DEDUPE_ROWS.inc(rows, kind="input")
+    DEDUPE_ROWS.inc(unique, kind="unique")
+    DUPLICATE_COPIES.inc(rows - unique)
+
+
+def _record_tier(tier, rows):
+    if rows:
+        metrics.ROWS.inc(rows, tier=tier)
+        metrics.BATCH_SIZE.observe(rows, tier=tier)
 
 
 def classify_logs(source , log_message):
     if source == "LegacyCRM":
+        _record_tier("llm", 1)
         return classify_with_llm(log_message)
     label = classify_with_regex(log_message)
-    if label is not None : 
+    if label is not None :
+        _record_tier("regex", 1)
         return label
+    _record_tier("bert", 1)
     return classify_with_bert(log_message)
 
 
 
-def classify(logs):
-    labels = []
-    for source , log_message in logs : 
-        labels.append(classify_logs(source , log_message))
+def route(source):
+    return "llm" if source == "LegacyCRM" else "regex_bert"
+
+
+
+def _classify_rows(logs, batch_size, deadline=None):
+    # Route every row to its tier up front, run each tier as a batch and
+    # write the labels, and the tier that produced each, back in the original row order.
+    labels = [None] * len(logs)
+    tiers = [None] * len(logs)
+
+    llm_rows = [i for i, (source, _) in enumerate(logs) if source == "LegacyCRM"]
+    other_rows = [i for i, (source, _) in enumerate(logs) if source != "LegacyCRM"]
+
+    if llm_rows:
+        _record_tier("llm", len(llm_rows))
+        llm_tiers = []
+        llm_labels = classify_with_llm_batch([logs[i][1] for i in llm_rows], tiers=llm_tiers, deadline=deadline)
+        for i, label, tier in zip(llm_rows, llm_labels, llm_tiers):
+            labels[i] = label
+            tiers[i] = tier
+
+    bert_rows = []
+    regex_labels = classify_with_regex_batch([logs[i][1] for i in other_rows])
+    for i, label in zip(other_rows, regex_labels):
+        if label is None:
+            bert_rows.append(i)
+        else:
+            labels[i] = label
+            tiers[i] = "regex"
+    _record_tier("regex", len(other_rows) - len(bert_rows))
+
+    if bert_rows:
+        _record_tier("bert", len(bert_rows))
+        bert_labels = classify_with_bert_batch([logs[i][1] for i in bert_rows], batch_size=batch_size)
+        for i, label in zip(bert_rows, bert_labels):
+            labels[i] = label
+            tiers[i] = "bert"
+
+    return labels, tiers
+
+
+
+def classify(logs, batch_size=BATCH_SIZE, mine_templates=True, report=None, tiers=None, deadline=None):
+    """Classify (source, log_message) pairs, returning labels in input order.
+
+    With `mine_templates` the rows are first grouped by log template and only
+    one representative per template goes through the tiers; its label is
+    copied to every member. Pass a dict as `report` to receive the row and
+    template counts, and a list as `tiers` to have it extended with the tier
+    that produced each label (regex, bert, or one of the LLM tier's, see
+    processor_llm.classify_with_llm_async). `deadline` (see
+    processor_llm.request_deadline) bounds the LLM tier; by default the call
+    gets an LLM_BUDGET of its own.
+    """
+    logs = list(logs)
+    if not mine_templates:
+        labels, row_tiers = _classify_rows(logs, batch_size, deadline)
+        template_counts = None
+    else:
+        representatives, assignments, template_counts = group_logs(logs, route)
+        representative_labels, representative_tiers = _classify_rows(representatives, batch_size, deadline)
+        labels = [representative_labels[group] for group in assignments]
+        row_tiers = [representative_tiers[group] for group in assignments]
+        TEMPLATE_COPIES.inc(len(logs) - len(representatives))
+    if tiers is not None:
+        tiers.extend(row_tiers)
+
+    if report is not None:
+        report["rows"] = len(logs)
+        if template_counts is not None:
+            report["templates"] = template_counts
+            report["unique_templates"] = sum(len(counts) for counts in template_counts.values())
     return labels
 
 
 
-def classify_csv(input_file):
+_pools = {}
+
+
+def _init_worker(threads, model_path):
+    # Runs once per worker process: load the encoder and the classifier here,
+    # not per shard, and keep torch (or ONNX Runtime) from oversubscribing the cores.
+    import model_registry
+    os.environ.setdefault("ONNX_THREADS", str(threads))
+    # The classifier the parent serves, which may have been reloaded from another file.
+    processor_bert.MODEL_PATH = model_path
+    model_registry.warm_up(["encoder", "classifier", "bert_cache"])
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def _classify_shard(args):
+    # The metrics recorded in the worker travel back with the labels.
+    logs, batch_size = args
+    tiers = []
+    return classify(logs, batch_size=batch_size, tiers=tiers), tiers, metrics.drain()
+
+
+def get_pool(workers):
+    # Workers load the classifier once, so a reload in this process replaces
+    # the pool; shards already running on the old one finish there.
+    version = processor_bert.model_version()
+    pool, pool_version = _pools.get(workers, (None, None))
+    if pool is not None and pool_version != version:
+        pool.shutdown(wait=False)
+        pool = None
+    if pool is None:
+        model_path = processor_bert.Model.get().active.path if version else processor_bert.MODEL_PATH
+        # spawn, not fork: forking a process that already runs torch threads can deadlock.
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(max(1, (os.cpu_count() or 1) // workers), model_path),
+        )
+        _pools[workers] = (pool, version)
+    return pool
+
+
+def shutdown_pools():
+    for pool, _ in _pools.values():
+        pool.shutdown()
+    _pools.clear()
+
+
+def classify_parallel(logs, workers, batch_size=BATCH_SIZE, shard_size=None, tiers=None, deadline=None):
+    """Like classify(), but shards the regex/BERT rows across `workers` processes.
+
+    LegacyCRM rows stay in this process: the LLM tier is I/O bound and its
+    rate limit has to be shared, not multiplied by the number of workers.
+    They are classified while the workers run, and all labels are merged
+    back in input order.
+    """
+    logs = list(logs)
+    if workers <= 1:
+        return classify(logs, batch_size=batch_size, tiers=tiers, deadline=deadline)
+
+    labels = [None] * len(logs)
+    row_tiers = [None] * len(logs)
+    llm_rows = [i for i, (source, _) in enumerate(logs) if route(source) == "llm"]
+    local_rows = [i for i, (source, _) in enumerate(logs) if route(source) != "llm"]
+
+    shard_size = shard_size or max(batch_size, -(-len(local_rows) // (workers * 4)))
+    shards = [local_rows[start:start + shard_size] for start in range(0, len(local_rows), shard_size)]
+    results = get_pool(workers).map(_classify_shard, [([logs[i] for i in shard], batch_size) for shard in shards])
+
+    if llm_rows:
+        llm_tiers = []
+        llm_labels = classify([logs[i] for i in llm_rows], batch_size=batch_size, tiers=llm_tiers, deadline=deadline)
+        for i, label, tier in zip(llm_rows, llm_labels, llm_tiers):
+            labels[i] = label
+            row_tiers[i] = tier
+    for shard, (shard_labels, shard_tiers, shard_metrics) in zip(shards, results):
+        metrics.merge(shard_metrics)
+        for i, label, tier in zip(shard, shard_labels, shard_tiers):
+            labels[i] = label
+            row_tiers[i] = tier
+    if tiers is not None:
+        tiers.extend(row_tiers)
+    return labels
+
+
+def dedupe_pairs(sources, messages):
+    """Factorize (source, message) pairs.
+
+    Returns the row index of the first occurrence of each distinct pair and,
+    for every row, the index of its pair among those.
+    """
+    import numpy as np
+    import pandas as pd
+    source_codes, _ = pd.factorize(np.asarray(sources, dtype=object), use_na_sentinel=False)
+    message_codes, message_uniques = pd.factorize(np.asarray(messages, dtype=object), use_na_sentinel=False)
+    inverse, _ = pd.factorize(source_codes.astype(np.int64) * len(message_uniques) + message_codes)
+    _, first = np.unique(inverse, return_index=True)
+    return first, inverse
+
+
+def classify_with_tiers(logs, workers=1, batch_size=BATCH_SIZE, dedupe=True, report=None, deadline=None):
+    """(labels, tiers) for (source, log_message) pairs; the classify_logs callback of columnar and jobs.
+
+    With `dedupe`, only the first copy of each exact (source, log_message)
+    pair is classified and its label is scattered back to the others. Pass
+    a dict as `report` to receive rows, unique_rows and dedupe_ratio (the
+    share of rows that were copies).
+    """
+    import numpy as np
+    logs = list(logs)
+    if not dedupe or len(logs) < 2:
+        unique = logs
+    else:
+        first, inverse = dedupe_pairs([source for source, _ in logs], [message for _, message in logs])
+        unique = [logs[i] for i in first]
+    if dedupe:
+        _record_dedupe(len(logs), len(unique))
+    tiers = []
+    labels = classify_parallel(unique, workers, batch_size=batch_size, tiers=tiers, deadline=deadline)
+    if len(unique) < len(logs):
+        labels = np.asarray(labels, dtype=object)[inverse].tolist()
+        tiers = np.asarray(tiers, dtype=object)[inverse].tolist()
+    if report is not None:
+        report["rows"] = len(logs)
+        report["unique_rows"] = len(unique)
+        report["dedupe_ratio"] = 1 - len(unique) / len(logs) if logs else 0.0
+    return labels, tiers
+
+
+def classify_frame(df, workers=1, batch_size=BATCH_SIZE, dedupe=True, deadline=None):
+    """Add target_label and label_tier to a frame with source and log_message columns.
+
+    The dedupe counts of classify_with_tiers end up in `df.attrs`.
+    """
+    import numpy as np
+    report = {}
+    if dedupe and len(df) > 1:
+        # Factorized straight from the columns, only the distinct rows become tuples.
+        first, inverse = dedupe_pairs(df["source"].to_numpy(dtype=object), df["log_message"].to_numpy(dtype=object))
+        unique = df.iloc[first]
+        labels, tiers = classify_with_tiers(
+            list(zip(unique["source"], unique["log_message"])), workers, batch_size=batch_size, dedupe=False,
+            deadline=deadline,
+        )
+        _record_dedupe(len(df), len(first))
+        df["target_label"] = np.asarray(labels, dtype=object)[inverse]
+        df["label_tier"] = np.asarray(tiers, dtype=object)[inverse]
+        report = {"rows": len(df), "unique_rows": len(first), "dedupe_ratio": 1 - len(first) / len(df)}
+    else:
+        df["target_label"], df["label_tier"] = classify_with_tiers(
+            list(zip(df["source"], df["log_message"])), workers, batch_size=batch_size, dedupe=False, report=report,
+            deadline=deadline,
+        )
+    df.attrs.update(report)
+    return df
+
+
+
+def classify_csv(input_file, batch_size=BATCH_SIZE, workers=1, output_file="output.csv", dedupe=True):
+    """Label a CSV, Parquet or Arrow IPC file; the formats are picked by file extension.
+
+    CSV to CSV keeps every input column. As soon as either side is Parquet or
+    Arrow the file goes through pyarrow batch by batch, reading only the
+    source and log_message columns. With `dedupe`, exact duplicate rows are
+    classified once (per batch for pyarrow).
+    """
+    import columnar
+    # Unknown extensions are read and written as CSV, as before.
+    input_format = columnar.format_for_path(input_file) or "csv"
+    output_format = columnar.format_for_path(output_file) or "csv"
+    if (input_format, output_format) != ("csv", "csv"):
+        return columnar.classify_file(
+            input_file, output_file,
+            lambda logs: classify_with_tiers(logs, workers, batch_size=batch_size, dedupe=dedupe),
+            input_format=input_format, output_format=output_format,
+        )
+
     import pandas as pd
     df = pd.read_csv(input_file)
 
     # Perform classification
-    df["target_label"] = classify(list(zip(df["source"], df["log_message"])))
+    classify_frame(df, workers, batch_size=batch_size, dedupe=dedupe)
 
     # Save the modified file
-    output_file = "output.csv"
     df.to_csv(output_file, index=False)
 
     return output_file
 
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify the log messages of a CSV file, or of a live log stream.")
+    parser.add_argument("input_file", help="CSV, Parquet or Arrow file with 'source' and 'log_message' columns; "
+                                           "with --stream a log file "
+                                           "to follow, a directory of rotated files, or - for stdin")
+    parser.add_argument("-o", "--output", help="where to write the labeled file, format by extension "
+                                               "(default output.csv), or the JSON lines with --stream (default stdout)")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes for the regex/BERT tiers")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--no-dedupe", action="store_true", help="classify every copy of duplicate rows")
+    stream = parser.add_argument_group("streaming")
+    stream.add_argument("--stream", action="store_true", help="classify lines as they arrive, writing JSON lines")
+    stream.add_argument("--max-wait", type=float, default=1.0, help="seconds before a partial batch is flushed")
+    stream.add_argument("--max-buffer", type=int, default=10000, help="lines read ahead before the reader blocks")
+    stream.add_argument("--from-start", action="store_true", help="read followed files from the start, not the end")
+    stream.add_argument("--pattern", default="*.log*", help="file pattern when following a directory")
+    stream.add_argument("--default-source", default="unknown", help="source of lines that do not name one")
+    stream.add_argument("--format", default="auto", choices=["auto", "csv", "json", "raw"], dest="record_format",
+                        help="how lines name their source: JSON objects, source,log_message CSV rows, "
+                             "raw messages, or auto (JSON, or CSV when the first field looks like a source name)")
+    args = parser.parse_args()
+    if args.stream:
+        import sys
+        from log_stream import run
+        output = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+        try:
+            run(args.input_file, output, batch_size=args.batch_size, max_wait=args.max_wait,
+                max_buffer=args.max_buffer, from_start=args.from_start, pattern=args.pattern,
+                default_source=args.default_source, record_format=args.record_format)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        return
+    try:
+        print(classify_csv(args.input_file, batch_size=args.batch_size, workers=args.workers, dedupe=not args.no_dedupe,
+                           output_file=args.output or "output.csv"))
+    finally:
+        shutdown_pools()
+
+if __name__ == "__main__":
+    main()
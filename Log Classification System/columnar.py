@@ -0,0 +1,255 @@
+"""Parquet and Arrow IPC input and output for the classifier (needs pyarrow).
+
+Only the `source` and `log_message` columns are read, batch by batch. The
+messages stay Arrow string arrays until a batch is handed to the tiers, and
+`target_label` and `label_tier` (the tier that produced the label) are
+written back dictionary-encoded, since they only take a handful of distinct
+values.
+"""
+import os
+
+COLUMNS = ["source", "log_message"]
+BATCH_ROWS = 65536
+
+FORMATS = {
+    ".csv": "csv",
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+    ".ipc": "arrow",
+    ".arrows": "arrow_stream",
+}
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+    "arrow_stream": "application/vnd.apache.arrow.stream",
+}
+EXTENSIONS = {"csv": ".csv", "parquet": ".parquet", "arrow": ".arrow", "arrow_stream": ".arrows"}
+
+
+def format_for_path(path):
+    """The file format implied by `path`'s extension, or None if it is not supported."""
+    return FORMATS.get(os.path.splitext(str(path))[1].lower())
+
+
+def format_for_media_type(accept):
+    """The first supported format named in an Accept header, or None."""
+    for part in (accept or "").split(","):
+        media_type = part.split(";")[0].strip().lower()
+        if media_type == "application/x-parquet":
+            return "parquet"
+        for fmt, known in MEDIA_TYPES.items():
+            if media_type == known:
+                return fmt
+    return None
+
+
+def iter_batches(source, fmt, batch_rows=BATCH_ROWS):
+    """Yield RecordBatches holding only the source and log_message columns of `source` (a path or file)."""
+    import pyarrow as pa
+
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        yield from pq.ParquetFile(source).iter_batches(batch_size=batch_rows, columns=COLUMNS)
+    elif fmt in ("arrow", "arrow_stream"):
+        import pyarrow.ipc as ipc
+        if fmt == "arrow":
+            try:
+                reader = ipc.open_file(source)
+                batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+            except pa.ArrowInvalid:
+                # Not the file format; an IPC stream is still accepted.
+                if hasattr(source, "seek"):
+                    source.seek(0)
+                batches = ipc.open_stream(source)
+        else:
+            batches = ipc.open_stream(source)
+        for batch in batches:
+            missing = [name for name in COLUMNS if name not in batch.schema.names]
+            if missing:
+                raise KeyError(f"missing columns: {', '.join(missing)}")
+            batch = batch.select(COLUMNS)
+            for offset in range(0, batch.num_rows, batch_rows):
+                yield batch.slice(offset, batch_rows)
+    elif fmt == "csv":
+        import pyarrow.csv as pcsv
+        reader = pcsv.open_csv(
+            source,
+            read_options=pcsv.ReadOptions(block_size=1 << 24),
+            convert_options=pcsv.ConvertOptions(
+                include_columns=COLUMNS, column_types={name: pa.string() for name in COLUMNS}
+            ),
+        )
+        for batch in reader:
+            for offset in range(0, batch.num_rows, batch_rows):
+                yield batch.slice(offset, batch_rows)
+    else:
+        raise ValueError(f"unsupported format: {fmt}")
+
+
+def label_batch(batch, classify_logs):
+    """Return (batch, labels, tiers) from `classify_logs` on the batch's (source, message) pairs.
+
+    `classify_logs` returns (labels, tiers), like classify.classify_with_tiers.
+    """
+    # The one place the strings become Python objects: the tiers work on str.
+    sources = batch.column("source").to_pylist()
+    messages = batch.column("log_message").to_pylist()
+    labels, tiers = classify_logs(list(zip(sources, messages)))
+    return batch, labels, tiers
+
+
+def output_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("source", pa.string()),
+        ("log_message", pa.string()),
+        ("target_label", pa.dictionary(pa.int32(), pa.string())),
+        ("label_tier", pa.dictionary(pa.int32(), pa.string())),
+    ])
+
+
+class _Writer:
+    """Writes labeled batches; target_label and label_tier each share one growing dictionary across batches.
+
+    Arrow IPC files allow a single dictionary per field, extended only by
+    deltas, so labels keep the index they got in the first batch they
+    appeared in and new ones are appended.
+    """
+
+    def __init__(self, sink, fmt):
+        import pyarrow as pa
+
+        self.fmt = fmt
+        self._vocabularies = ({}, {})
+        schema = output_schema()
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(sink, schema)
+        elif fmt in ("arrow", "arrow_stream"):
+            import pyarrow.ipc as ipc
+            options = ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+            open_writer = ipc.new_file if fmt == "arrow" else ipc.new_stream
+            self._writer = open_writer(sink, schema, options=options)
+        elif fmt == "csv":
+            import pyarrow.csv as pcsv
+            # The CSV writer has no dictionary support.
+            schema = schema.set(2, pa.field("target_label", pa.string()))
+            schema = schema.set(3, pa.field("label_tier", pa.string()))
+            self._writer = pcsv.CSVWriter(sink, schema)
+        else:
+            raise ValueError(f"unsupported format: {fmt}")
+        self._schema = schema
+
+    def _encode(self, values, vocabulary):
+        import pyarrow as pa
+
+        if self.fmt == "csv":
+            return pa.array(values, type=pa.string())
+        indices = [vocabulary.setdefault(value, len(vocabulary)) for value in values]
+        return pa.DictionaryArray.from_arrays(
+            pa.array(indices, type=pa.int32()), pa.array(list(vocabulary), type=pa.string())
+        )
+
+    def write(self, labeled):
+        import pyarrow as pa
+
+        batch, labels, tiers = labeled
+        # Parquet may hand back large_string or dictionary columns; write one schema.
+        columns = [batch.column(name).cast(pa.string()) for name in COLUMNS] + [
+            self._encode(values, vocabulary) for values, vocabulary in zip((labels, tiers), self._vocabularies)
+        ]
+        self._writer.write_batch(pa.RecordBatch.from_arrays(columns, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+def count_rows(path, fmt):
+    """Row count from the file metadata; for CSV an estimate from the line count."""
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).metadata.num_rows
+    if fmt == "arrow":
+        import pyarrow.ipc as ipc
+        reader = ipc.open_file(path)
+        return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+    if fmt == "csv":
+        lines = 0
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                lines += block.count(b"\n")
+        # Minus the header; quoted multi-line messages make this an overestimate.
+        return max(lines - 1, 0)
+    return None
+
+
+def classify_file(input_file, output_file, classify_logs, batch_rows=BATCH_ROWS,
+                  input_format=None, output_format=None, progress=None):
+    """Classify a CSV, Parquet or Arrow file batch by batch into another file, formats picked by extension.
+
+    `progress(rows)` is called with the number of rows of each batch written.
+    """
+    input_format = input_format or format_for_path(input_file)
+    output_format = output_format or format_for_path(output_file)
+    writer = _Writer(str(output_file), output_format)
+    try:
+        for batch in iter_batches(str(input_file), input_format, batch_rows):
+            writer.write(label_batch(batch, classify_logs))
+            if progress is not None:
+                progress(batch.num_rows)
+    finally:
+        writer.close()
+    return output_file
+
+
+class _ChunkSink:
+    """Write-only file object that collects what is written until drained."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_labeled(batches, classify_logs, output_format):
+    """Yield the encoded output piece by piece while `batches` are classified."""
+    import pyarrow as pa
+
+    sink = _ChunkSink()
+    writer = _Writer(pa.PythonFile(sink, mode="w"), output_format)
+    try:
+        for batch in batches:
+            writer.write(label_batch(batch, classify_logs))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
@@ -0,0 +1,202 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_message(log_message):
+    return " ".join(str(log_message).split())
+
+
+def message_key(log_message):
+    return hashlib.sha1(normalize_message(log_message).encode("utf-8")).hexdigest()
+
+
+def file_fingerprint(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def connect(path):
+    """SQLite connection for a cache or queue shared by threads and worker processes.
+
+    WAL lets readers go on while another process writes, and the busy
+    timeout makes a writer wait for the lock instead of failing at once.
+    """
+    db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA busy_timeout=30000")
+    return db
+
+
+class EmbeddingCache:
+    """Two-tier cache of BERT embeddings and labels keyed on the message hash.
+
+    The memory tier is an LRU bounded to `max_entries`; the disk tier is a
+    SQLite table that survives restarts, bounded to `disk_max_entries` rows
+    by dropping the ones least recently stored or read from disk. Embeddings are tied to the encoder
+    name and labels to the classifier file's content hash: when the encoder
+    changes the whole cache is dropped, when only the classifier changes the
+    labels are dropped and the embeddings kept, since re-running the
+    classifier on a cached embedding is cheap.
+    """
+
+    def __init__(self, path, encoder_name, model_path, max_entries=100000, disk_max_entries=200000):
+        self.path = path
+        self.max_entries = max_entries
+        self.disk_max_entries = disk_max_entries
+        self.hits = 0
+        self.misses = 0
+        self.label_hits = 0
+        self.evictions = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.encoder_name = encoder_name
+        self.model_fingerprint = file_fingerprint(model_path)
+        if path:
+            self._db = connect(path)
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, embedding BLOB NOT NULL, label TEXT, last_used REAL NOT NULL DEFAULT 0)"
+            )
+            # Caches written before the disk tier was bounded lack last_used.
+            if "last_used" not in [row[1] for row in self._db.execute("PRAGMA table_info(cache)")]:
+                self._db.execute("ALTER TABLE cache ADD COLUMN last_used REAL NOT NULL DEFAULT 0")
+            self._db.execute("CREATE INDEX IF NOT EXISTS cache_last_used ON cache (last_used)")
+            self._validate()
+
+    def _validate(self):
+        meta = dict(self._db.execute("SELECT name, value FROM meta"))
+        if meta.get("encoder") != self.encoder_name:
+            self._db.execute("DELETE FROM cache")
+        elif meta.get("model") != self.model_fingerprint:
+            self._db.execute("UPDATE cache SET label = NULL")
+        self._db.executemany(
+            "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+            [("encoder", self.encoder_name), ("model", self.model_fingerprint)],
+        )
+        self._db.commit()
+
+    def set_model(self, model_path):
+        """Point the cache at a new classifier file, dropping labels if its content changed."""
+        self.set_model_fingerprint(file_fingerprint(model_path))
+
+    def set_model_fingerprint(self, fingerprint):
+        with self._lock:
+            if fingerprint == self.model_fingerprint:
+                return
+            self.model_fingerprint = fingerprint
+            for entry in self._memory.values():
+                entry[1] = None
+            if self._db is not None:
+                self._validate()
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def lookup(self, log_messages):
+        """Return (keys, entries); each entry is [embedding, label] or None on a miss."""
+        keys = [message_key(log_message) for log_message in log_messages]
+        entries = [None] * len(keys)
+        with self._lock:
+            missing = {}
+            for i, key in enumerate(keys):
+                entry = self._memory.get(key)
+                if entry is not None:
+                    self._memory.move_to_end(key)
+                    entries[i] = entry
+                else:
+                    missing.setdefault(key, []).append(i)
+
+            if missing and self._db is not None:
+                pending = list(missing)
+                found = []
+                for start in range(0, len(pending), 500):
+                    chunk = pending[start:start + 500]
+                    rows = self._db.execute(
+                        f"SELECT key, embedding, label FROM cache WHERE key IN ({','.join('?' * len(chunk))})",
+                        chunk,
+                    )
+                    for key, blob, label in rows:
+                        entry = [np.frombuffer(blob, dtype=np.float32), label]
+                        self._remember(key, entry)
+                        found.append(key)
+                        for i in missing[key]:
+                            entries[i] = entry
+                if found:
+                    now = time.time()
+                    self._db.executemany("UPDATE cache SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+                    self._db.commit()
+
+            for entry in entries:
+                if entry is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                    if entry[1] is not None:
+                        self.label_hits += 1
+        return keys, entries
+
+    def store(self, keys, embeddings, labels, model_fingerprint=None):
+        """Remember embeddings and labels. Labels predicted by another classifier
+        than the current one (a swap happened mid-request) are not kept."""
+        rows = []
+        with self._lock:
+            if model_fingerprint is not None and model_fingerprint != self.model_fingerprint:
+                labels = [None] * len(keys)
+            for key, embedding, label in zip(keys, embeddings, labels):
+                embedding = np.asarray(embedding, dtype=np.float32)
+                self._remember(key, [embedding, label])
+                rows.append((key, embedding.tobytes(), label))
+            if self._db is not None and rows:
+                now = time.time()
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO cache (key, embedding, label, last_used) VALUES (?, ?, ?, ?)",
+                    [row + (now,) for row in rows],
+                )
+                overflow = self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.disk_max_entries
+                if overflow > 0:
+                    self._db.execute(
+                        "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY last_used LIMIT ?)",
+                        (overflow,),
+                    )
+                    self.evictions += overflow
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            disk_entries = self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0] if self._db is not None else 0
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "label_hits": self.label_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_entries": disk_entries,
+            "evictions": self.evictions,
+        }
+
+
+def cache_from_env(encoder_name, model_path):
+    if os.environ.get("BERT_CACHE", "1") == "0":
+        return None
+    return EmbeddingCache(
+        os.environ.get("BERT_CACHE_PATH", "Models/bert_cache.sqlite"),
+        encoder_name,
+        model_path,
+        max_entries=int(os.environ.get("BERT_CACHE_SIZE", "100000")),
+        disk_max_entries=int(os.environ.get("BERT_CACHE_MAX_ENTRIES", "200000")),
+    )
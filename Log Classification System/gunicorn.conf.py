@@ -0,0 +1,52 @@
+"""Preload-and-fork serving: several workers sharing one copy of the models.
+
+Run from the project root:
+    gunicorn -c gunicorn.conf.py -w 4 server:app
+
+The master imports server.py and loads the encoder and the classifier once
+before it forks the workers, so their weights are shared copy-on-write
+instead of loaded once per worker. Each worker then runs the usual warm-up
+(one dummy inference per model, which also loads the per-worker caches and
+clients) and answers /ready when it is done. `uvicorn --workers` spawns
+fresh interpreters and cannot share anything.
+
+Each worker holds its own classifier version. The /admin/models endpoints
+reach only the worker that gets the call; to switch every worker, replace
+the MODEL_PATH file and let each worker's watcher reload it.
+"""
+import gc
+import os
+
+preload_app = True
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = os.environ.get("BIND", "127.0.0.1:8000")
+# Loading the models in each worker is gone, but the warm-up still takes a while.
+timeout = 120
+
+# Only the weights are loaded in the master. The caches and the LLM index hold
+# SQLite connections, file handles and clients that each worker opens itself.
+PRELOAD_MODELS = ["encoder", "classifier"]
+
+
+def on_starting(server):
+    import model_registry
+    import processor_bert
+
+    # ONNX Runtime starts its thread pools with the session, and those do not survive a fork.
+    names = [name for name in PRELOAD_MODELS if name != "encoder" or not processor_bert.BACKEND.startswith("onnx")]
+    model_registry.preload(names)
+    # Keep the garbage collector from writing to (and so un-sharing) the pages
+    # of everything loaded so far.
+    gc.freeze()
+    server.log.info(f"preloaded {', '.join(names)}")
+
+
+def post_fork(server, worker):
+    # Like classify._init_worker: split the cores between the workers.
+    threads = max(1, (os.cpu_count() or 1) // server.cfg.workers)
+    os.environ.setdefault("ONNX_THREADS", str(threads))
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
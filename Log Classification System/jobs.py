@@ -0,0 +1,219 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import columnar
+
+CHUNK_ROWS = 5000
+
+
+class JobQueue:
+    """Background classification jobs for uploads too large to wait on.
+
+    Each job gets its own directory under `root` holding the uploaded input
+    and, once done, the labeled output. A SQLite table records status and
+    progress, so a restarted server still answers for earlier jobs and picks
+    up the ones that had not finished. `workers` jobs run at a time; finished
+    jobs are removed `ttl` seconds after they completed. `classify_logs` maps
+    (source, log_message) pairs to (labels, tiers), like classify.classify_with_tiers.
+    """
+
+    def __init__(self, root, classify_logs, workers=1, ttl=24 * 3600, chunk_rows=CHUNK_ROWS, job_classifier=None):
+        self.root = root
+        self.classify_logs = classify_logs
+        # Called when a job starts for the classify_logs of that job, so state
+        # such as the LLM deadline spans all of its chunks.
+        self.job_classifier = job_classifier or (lambda: self.classify_logs)
+        self.ttl = ttl
+        self.chunk_rows = chunk_rows
+        os.makedirs(root, exist_ok=True)
+        # Jobs marked running since before this are left over from an earlier
+        # server. Forked workers (see gunicorn.conf.py) all inherit the master's value.
+        self._created = time.time()
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_pid = None
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="classify-job")
+        self._stop = threading.Event()
+        self._cleaner = None
+
+    def _connection(self):
+        # Opened on first use in each process, since a connection must not cross a fork.
+        if self._db_pid != os.getpid():
+            self._db = sqlite3.connect(os.path.join(self.root, "jobs.sqlite"), check_same_thread=False, timeout=30)
+            self._db_pid = os.getpid()
+            # Every worker process polls this file; with WAL their reads do not block a claim.
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, filename TEXT NOT NULL, dir TEXT NOT NULL, "
+                "input_format TEXT NOT NULL, output_format TEXT NOT NULL, rows_total INTEGER, "
+                "rows_done INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL, started REAL, finished REAL, error TEXT)"
+            )
+            self._db.commit()
+        return self._db
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            db = self._connection()
+            cursor = db.execute(sql, params)
+            rows = cursor.fetchall()
+            db.commit()
+            return rows if cursor.description is not None else cursor.rowcount
+
+    def start(self):
+        # Jobs cut short by a restart run again from the start. With several
+        # server workers each one queues them, and the first to claim a job runs it.
+        self._execute(
+            "UPDATE jobs SET status = 'queued', rows_done = 0, started = NULL WHERE status = 'running' AND started < ?",
+            (self._created,),
+        )
+        for (job_id,) in self._execute("SELECT id FROM jobs WHERE status = 'queued'"):
+            self._pool.submit(self._run, job_id)
+        self._cleaner = threading.Thread(target=self._clean_periodically, daemon=True)
+        self._cleaner.start()
+
+    def stop(self):
+        self._stop.set()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, upload, filename, input_format, output_format):
+        """Store the upload in a new job directory and queue the job; returns the job id."""
+        job_id = uuid.uuid4().hex
+        job_dir = tempfile.mkdtemp(prefix=f"job-{job_id[:8]}-", dir=self.root)
+        with open(os.path.join(job_dir, "input" + columnar.EXTENSIONS[input_format]), "wb") as f:
+            shutil.copyfileobj(upload, f, 1 << 20)
+        self._execute(
+            "INSERT INTO jobs (id, status, filename, dir, input_format, output_format, created) "
+            "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+            (job_id, filename, job_dir, input_format, output_format, time.time()),
+        )
+        self._pool.submit(self._run, job_id)
+        return job_id
+
+    def _paths(self, job):
+        return (
+            os.path.join(job["dir"], "input" + columnar.EXTENSIONS[job["input_format"]]),
+            os.path.join(job["dir"], "output" + columnar.EXTENSIONS[job["output_format"]]),
+        )
+
+    def _run(self, job_id):
+        job = self.get(job_id)
+        if job is None or job["status"] != "queued":
+            return
+        input_path, output_path = self._paths(job)
+        claimed = self._execute(
+            "UPDATE jobs SET status = 'running', started = ? WHERE id = ? AND status = 'queued'", (time.time(), job_id)
+        )
+        if not claimed:
+            return
+        try:
+            classify_logs = self.job_classifier()
+            rows_total = columnar.count_rows(input_path, job["input_format"])
+            self._execute("UPDATE jobs SET rows_total = ? WHERE id = ?", (rows_total, job_id))
+
+            def progress(rows):
+                self._execute("UPDATE jobs SET rows_done = rows_done + ? WHERE id = ?", (rows, job_id))
+
+            if (job["input_format"], job["output_format"]) == ("csv", "csv"):
+                self._classify_csv(input_path, output_path, progress, classify_logs)
+            else:
+                columnar.classify_file(
+                    input_path, output_path, classify_logs, batch_rows=self.chunk_rows,
+                    input_format=job["input_format"], output_format=job["output_format"], progress=progress,
+                )
+            os.remove(input_path)
+            # The estimate for CSV is replaced by the real count.
+            self._execute(
+                "UPDATE jobs SET status = 'done', finished = ?, rows_total = rows_done WHERE id = ?",
+                (time.time(), job_id),
+            )
+        except Exception as e:
+            self._execute(
+                "UPDATE jobs SET status = 'failed', finished = ?, error = ? WHERE id = ?",
+                (time.time(), f"{type(e).__name__}: {e}", job_id),
+            )
+
+    def _classify_csv(self, input_path, output_path, progress, classify_logs):
+        # Like the /classify/ CSV path: every input column is kept.
+        import pandas as pd
+        header = True
+        with open(output_path, "w", newline="", encoding="utf-8") as out:
+            for chunk in pd.read_csv(input_path, chunksize=self.chunk_rows):
+                if "source" not in chunk.columns or "log_message" not in chunk.columns:
+                    raise ValueError("CSV must contain 'source' and 'log_message' columns")
+                chunk["target_label"], chunk["label_tier"] = classify_logs(
+                    list(zip(chunk["source"], chunk["log_message"]))
+                )
+                chunk.to_csv(out, index=False, header=header)
+                header = False
+                progress(len(chunk))
+
+    def get(self, job_id):
+        with self._lock:
+            cursor = self._connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            row = cursor.fetchone()
+            names = [column[0] for column in cursor.description]
+        return dict(zip(names, row)) if row is not None else None
+
+    def status(self, job_id):
+        """Public view of a job: state, progress, throughput and ETA."""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        now = time.time()
+        elapsed = ((job["finished"] or now) - job["started"]) if job["started"] else 0.0
+        rate = job["rows_done"] / elapsed if elapsed > 0 else None
+        eta = None
+        if job["status"] == "running" and rate and job["rows_total"] is not None:
+            eta = max(job["rows_total"] - job["rows_done"], 0) / rate
+        return {
+            "job_id": job["id"],
+            "status": job["status"],
+            "filename": job["filename"],
+            "output_format": job["output_format"],
+            "rows_done": job["rows_done"],
+            "rows_total": job["rows_total"],
+            "rows_per_second": round(rate, 1) if rate else None,
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "created": job["created"],
+            "started": job["started"],
+            "finished": job["finished"],
+            "expires": job["finished"] + self.ttl if job["finished"] else None,
+            "error": job["error"],
+        }
+
+    def result_path(self, job_id):
+        job = self.get(job_id)
+        if job is None or job["status"] != "done":
+            return None
+        return self._paths(job)[1]
+
+    def delete(self, job_id):
+        """Forget a job and remove its files. A job that is already running finishes first."""
+        job = self.get(job_id)
+        if job is None:
+            return False
+        if job["status"] == "running":
+            return False
+        self._execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        shutil.rmtree(job["dir"], ignore_errors=True)
+        return True
+
+    def clean_expired(self):
+        expired = self._execute(
+            "SELECT id, dir FROM jobs WHERE status IN ('done', 'failed') AND finished < ?", (time.time() - self.ttl,)
+        )
+        for job_id, job_dir in expired:
+            self._execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            shutil.rmtree(job_dir, ignore_errors=True)
+        return len(expired)
+
+    def _clean_periodically(self):
+        while not self._stop.wait(min(60.0, max(self.ttl / 10, 1.0))):
+            self.clean_expired()
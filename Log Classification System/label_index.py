@@ -0,0 +1,258 @@
+import csv
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, run a single process there.
+    fcntl = None
+
+
+class LabelIndex:
+    """Nearest-neighbor index of labeled messages over normalized embeddings.
+
+    The embeddings live in a float32 matrix memory-mapped from
+    `<path>/embeddings.f32`, grown by doubling; the labels and the row count
+    are kept next to it. Queries are one matrix product per batch: a message
+    gets a label when its `k` nearest neighbors all have a cosine similarity
+    of at least `threshold` and all carry that label. The index is tied to
+    the encoder name and starts over empty when the encoder changes.
+
+    Processes can share one index directory: appends take a file lock and
+    first pick up the rows the other processes added, and queries pick them
+    up whenever meta.json has changed.
+    """
+
+    def __init__(self, path, encoder_name, dim, k=3, threshold=0.9, duplicate_threshold=0.99):
+        self.path = path
+        self.encoder_name = encoder_name
+        self.dim = dim
+        self.k = k
+        self.threshold = threshold
+        # Examples this close to one with the same label add nothing.
+        self.duplicate_threshold = duplicate_threshold
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self._matrix_path = os.path.join(path, "embeddings.f32")
+        self._meta_path = os.path.join(path, "meta.json")
+        self._labels_path = os.path.join(path, "labels.jsonl")
+        self._lock_path = os.path.join(path, "lock")
+        self._meta_stamp = None
+        with self._file_lock():
+            self._load()
+
+    @contextmanager
+    def _file_lock(self):
+        # Several processes (gunicorn workers) share one index directory.
+        # Every write happens under this lock, after catching up with what the
+        # others wrote, so rows and labels always line up.
+        with open(self._lock_path, "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def _read_meta(self):
+        try:
+            stat = os.stat(self._meta_path)
+            with open(self._meta_path) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None, {}
+        return (stat.st_ino, stat.st_mtime_ns), meta
+
+    def _read_labels(self, start, end):
+        if end <= start or not os.path.exists(self._labels_path):
+            return []
+        with open(self._labels_path, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start)
+        return [json.loads(line) for line in data.decode("utf-8").splitlines() if line.strip()]
+
+    def _load(self):
+        # Called with the file lock held.
+        stamp, meta = self._read_meta()
+        if meta.get("encoder") != self.encoder_name or meta.get("dim") != self.dim:
+            meta = {"encoder": self.encoder_name, "dim": self.dim, "count": 0, "labels_bytes": 0}
+            for stale in (self._matrix_path, self._labels_path):
+                if os.path.exists(stale):
+                    os.remove(stale)
+        labels_size = os.path.getsize(self._labels_path) if os.path.exists(self._labels_path) else 0
+        labels = self._read_labels(0, meta.get("labels_bytes", labels_size))
+        # The count in meta.json is written last, so a torn append is cut off here.
+        self.count = min(meta["count"], len(labels))
+        self.labels = labels[:self.count]
+        data = "".join(json.dumps(label) + "\n" for label in self.labels).encode("utf-8")
+        self._labels_bytes = len(data)
+        if self._labels_bytes != labels_size:
+            # Drop the tail of a torn append (or convert an index from before
+            # labels_bytes), so the next append starts right after row `count`.
+            with open(self._labels_path, "wb") as f:
+                f.write(data)
+        self._open(max(1024, self.count))
+        self._write_meta()
+
+    def _refresh(self, locked=False):
+        """Catch up with rows other processes appended since this one last looked."""
+        stamp, meta = self._read_meta()
+        if stamp == self._meta_stamp:
+            return
+        count = meta.get("count", 0)
+        if meta.get("encoder") != self.encoder_name or count < self.count or "labels_bytes" not in meta:
+            # Reset or rewritten by another process; only safe to reload under the lock.
+            if locked:
+                self._load()
+            return
+        # meta.json is replaced only after the rows and labels it counts are written.
+        new = self._read_labels(self._labels_bytes, meta["labels_bytes"])
+        if len(new) != count - self.count:
+            if locked:
+                self._load()
+            return
+        if count > self._matrix.shape[0]:
+            # Another process grew the file past this mapping.
+            self._matrix.flush()
+            del self._matrix
+            self._open(max(count, os.path.getsize(self._matrix_path) // (self.dim * 4)))
+        self.labels.extend(new)
+        self.count = count
+        self._labels_bytes = meta["labels_bytes"]
+        self._meta_stamp = stamp
+
+    def _open(self, capacity):
+        size = capacity * self.dim * 4
+        with open(self._matrix_path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        self._matrix = np.memmap(self._matrix_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def _write_meta(self):
+        tmp = self._meta_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({
+                "encoder": self.encoder_name,
+                "dim": self.dim,
+                "count": self.count,
+                "labels_bytes": self._labels_bytes,
+            }, f)
+        os.replace(tmp, self._meta_path)
+        self._meta_stamp = self._read_meta()[0]
+
+    @staticmethod
+    def _normalize(embeddings):
+        embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.clip(norms, 1e-12, None)
+
+    def search(self, embeddings, k=None):
+        """Top-k (similarities, row indices) for each query, most similar first."""
+        k = min(k or self.k, self.count)
+        queries = self._normalize(embeddings)
+        if k == 0:
+            empty = np.zeros((len(queries), 0))
+            return empty, empty.astype(np.int64)
+        scores = queries @ self._matrix[:self.count].T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take_along_axis(top_scores, order, axis=1), np.take_along_axis(top, order, axis=1)
+
+    def lookup(self, embeddings):
+        """A label per query where the neighbors agree, else None."""
+        with self._lock:
+            self._refresh()
+            if self.count < self.k:
+                self.misses += len(embeddings)
+                return [None] * len(embeddings)
+            scores, rows = self.search(embeddings)
+            labels = []
+            for query_scores, query_rows in zip(scores, rows):
+                neighbor_labels = {self.labels[row] for row in query_rows}
+                if query_scores[-1] >= self.threshold and len(neighbor_labels) == 1:
+                    labels.append(neighbor_labels.pop())
+                else:
+                    labels.append(None)
+            hits = sum(label is not None for label in labels)
+            self.hits += hits
+            self.misses += len(labels) - hits
+            return labels
+
+    def nearest(self, embeddings, threshold):
+        """The label of each query's nearest neighbor if it is at least `threshold` similar, else None.
+
+        A looser answer than `lookup`, for when there is nothing better to ask.
+        """
+        with self._lock:
+            self._refresh()
+            if self.count == 0:
+                return [None] * len(embeddings)
+            scores, rows = self.search(embeddings, k=1)
+            return [self.labels[row[0]] if score[0] >= threshold else None for score, row in zip(scores, rows)]
+
+    def add(self, embeddings, labels):
+        """Append labeled examples, skipping near-duplicates of ones already indexed with the same label."""
+        if not len(labels):
+            return 0
+        vectors = self._normalize(embeddings)
+        with self._lock, self._file_lock():
+            self._refresh(locked=True)
+            keep = []
+            if self.count:
+                scores, rows = self.search(vectors, k=1)
+                for i, label in enumerate(labels):
+                    if not (scores[i, 0] >= self.duplicate_threshold and self.labels[rows[i, 0]] == label):
+                        keep.append(i)
+            else:
+                keep = list(range(len(labels)))
+            # Duplicates within the batch itself.
+            similar = vectors[keep] @ vectors[keep].T >= self.duplicate_threshold
+            kept = []
+            for a, i in enumerate(keep):
+                if not any(similar[a, b] and labels[keep[b]] == labels[i] for b in kept):
+                    kept.append(a)
+            seen = [keep[a] for a in kept]
+            if not seen:
+                return 0
+            end = self.count + len(seen)
+            if end > self._matrix.shape[0]:
+                self._matrix.flush()
+                del self._matrix
+                self._open(max(end, 2 * self.count))
+            self._matrix[self.count:end] = vectors[seen]
+            self._matrix.flush()
+            data = "".join(json.dumps(labels[i]) + "\n" for i in seen).encode("utf-8")
+            with open(self._labels_path, "ab") as f:
+                # Anything past labels_bytes is a torn append that meta.json never counted.
+                f.truncate(self._labels_bytes)
+                f.write(data)
+            self.labels.extend(labels[i] for i in seen)
+            self.count = end
+            self._labels_bytes += len(data)
+            self._write_meta()
+            return len(seen)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": self.count,
+        }
+
+
+def training_examples(path, source, labels):
+    """(message, label) pairs of `source` in the training CSV whose label is one of `labels`."""
+    if not os.path.exists(path):
+        return []
+    with open(path, newline="", encoding="utf-8") as f:
+        return [
+            (row["log_message"], row["target_label"])
+            for row in csv.DictReader(f)
+            if row["source"] == source and row["target_label"] in labels
+        ]
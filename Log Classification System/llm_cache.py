@@ -0,0 +1,108 @@
+import hashlib
+import os
+import threading
+import time
+
+from embedding_cache import connect
+from template_miner import mask_variables
+
+
+class LLMResponseCache:
+    """SQLite cache of LLM categories keyed on prompt version, model and masked message.
+
+    Messages are masked with the template miner's rules first, so lines that
+    differ only in IDs, file names or timestamps share one entry. Entries
+    older than `ttl` seconds are treated as misses and purged; once the table
+    holds more than `max_entries` rows the least recently used ones go.
+    """
+
+    def __init__(self, path, prompt_version, model, ttl=7 * 24 * 3600, max_entries=100000):
+        self.prompt_version = prompt_version
+        self.model = model
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, category TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._db.commit()
+
+    def key(self, log_msg):
+        text = f"{self.prompt_version}\x1f{self.model}\x1f{' '.join(mask_variables(str(log_msg)).split())}"
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        """Return {key: category} for the keys that are cached and fresh."""
+        unique = list(dict.fromkeys(keys))
+        now = time.time()
+        found = {}
+        stale = False
+        with self._lock:
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT key, category, created FROM responses WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+                for key, category, created in rows:
+                    if self.ttl and now - created > self.ttl:
+                        self.expired += 1
+                        stale = True
+                    else:
+                        found[key] = category
+            if found:
+                self._db.executemany("UPDATE responses SET last_used = ? WHERE key = ?", [(now, k) for k in found])
+            if stale:
+                self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            self._db.commit()
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, items):
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO responses (key, category, created, last_used) VALUES (?, ?, ?, ?)",
+                [(key, category, now, now) for key, category in items],
+            )
+            overflow = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                    (overflow,),
+                )
+                self.evictions += overflow
+            self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "entries": entries,
+        }
+
+
+def cache_from_env(prompt_version, model):
+    if os.environ.get("LLM_CACHE", "1") == "0":
+        return None
+    return LLMResponseCache(
+        os.environ.get("LLM_CACHE_PATH", "Models/llm_cache.sqlite"),
+        prompt_version,
+        model,
+        ttl=float(os.environ.get("LLM_CACHE_TTL", str(7 * 24 * 3600))),
+        max_entries=int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "100000")),
+    )
@@ -0,0 +1,238 @@
+"""Classify a live stream of log lines and write the labels as JSON lines.
+
+The pipeline is a chain of generators:
+
+    source lines -> parse_records -> bounded queue -> batches -> classify -> JSON lines
+
+The source (stdin, a followed file or a directory of rotated files) runs in
+a reader thread that fills a bounded queue, so a slow classifier blocks the
+reader instead of buffering without limit. Batches are flushed when they are
+full or when their oldest record has waited `max_wait` seconds.
+"""
+import csv
+import glob
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import time
+
+from classify import BATCH_SIZE, classify
+
+# Yielded by the followers when there is no new data, so that a partial
+# batch can still be flushed on time.
+IDLE = None
+_END = object()
+
+
+def read_lines(stream):
+    for line in stream:
+        yield line
+
+
+def _open_at(path, from_start):
+    f = open(path, "r", encoding="utf-8", errors="replace", newline="")
+    if not from_start:
+        f.seek(0, os.SEEK_END)
+    return f, os.fstat(f.fileno()).st_ino
+
+
+def follow_file(path, from_start=False, poll=0.25, stop=None):
+    """tail -F: yield lines appended to `path`, reopening it when it is rotated or truncated."""
+    while not os.path.exists(path):
+        yield IDLE
+        time.sleep(poll)
+    f, inode = _open_at(path, from_start)
+    partial = ""
+    try:
+        while stop is None or not stop.is_set():
+            line = f.readline()
+            if line:
+                partial += line
+                if partial.endswith("\n"):
+                    yield partial
+                    partial = ""
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                stat = None
+            if stat is not None and (stat.st_ino != inode or stat.st_size < f.tell()):
+                # Rotated (new inode) or truncated: drain what was written to the
+                # old handle before the switch, then start over on the new file.
+                for line in (partial + f.read()).splitlines(keepends=True):
+                    yield line
+                partial = ""
+                f.close()
+                f, inode = _open_at(path, from_start=True)
+                continue
+            yield IDLE
+            time.sleep(poll)
+    finally:
+        f.close()
+    if partial:
+        yield partial
+
+
+def follow_directory(directory, pattern="*.log*", from_start=False, poll=0.25, stop=None):
+    """Read the rotated files in `directory` oldest first, then follow the newest one.
+
+    When another file becomes the newest (the writer moved on), the current
+    one is drained and the new one is followed from its start.
+    """
+    def by_age():
+        paths = [p for p in glob.glob(os.path.join(directory, pattern)) if os.path.isfile(p)]
+        return sorted(paths, key=os.path.getmtime)
+
+    paths = by_age()
+    while not paths:
+        yield IDLE
+        time.sleep(poll)
+        paths = by_age()
+    if from_start:
+        for path in paths[:-1]:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                yield from read_lines(f)
+
+    current, start = paths[-1], from_start
+    while stop is None or not stop.is_set():
+        switch = threading.Event()
+        for line in follow_file(current, from_start=start, poll=poll, stop=switch):
+            if line is IDLE:
+                newest = by_age()[-1:]
+                if newest and newest[0] != current:
+                    switch.set()
+                if stop is not None and stop.is_set():
+                    return
+            yield line
+        current, start = by_age()[-1], True
+
+
+RECORD_FORMATS = ("auto", "csv", "json", "raw")
+
+# What a source name looks like ("LegacyCRM", "billing-system", "api.v2"), as
+# opposed to the start of a plain message that happens to contain a comma.
+_SOURCE_NAME = re.compile(r"[A-Za-z][A-Za-z0-9_.\-]*")
+
+
+def _json_record(line, default_source):
+    try:
+        record = json.loads(line)
+        return str(record.get("source", default_source)), str(record["log_message"])
+    except (ValueError, KeyError, AttributeError):
+        return None
+
+
+def _csv_record(line, any_source):
+    row = next(csv.reader([line], skipinitialspace=True))
+    if len(row) < 2 or not (any_source or _SOURCE_NAME.fullmatch(row[0])):
+        return None
+    return row[0], ",".join(row[1:])
+
+
+def parse_records(lines, default_source="unknown", record_format="auto"):
+    """Turn lines into (source, log_message) pairs.
+
+    With record_format "json" or "csv" every line is a JSON object with
+    `source` and `log_message` keys or a CSV row `source,log_message`; "raw"
+    takes every line as a message from `default_source`. "auto" accepts
+    both record forms, a CSV row only when its first field looks like a
+    source name, so "User 12 logged in, session 5" stays one message. Lines
+    that do not parse are taken as messages from `default_source`. Blank
+    lines and a CSV header are skipped. IDLE passes through.
+    """
+    if record_format not in RECORD_FORMATS:
+        raise ValueError(f"record_format must be one of {', '.join(RECORD_FORMATS)}")
+    for line in lines:
+        if line is IDLE:
+            yield IDLE
+            continue
+        line = line.strip()
+        if not line or (record_format in ("auto", "csv") and line == "source,log_message"):
+            continue
+        record = None
+        if record_format in ("auto", "json") and line.startswith("{"):
+            record = _json_record(line, default_source)
+        if record is None and record_format in ("auto", "csv"):
+            record = _csv_record(line, any_source=record_format == "csv")
+        yield record if record is not None else (default_source, line)
+
+
+def buffered(items, max_buffer, poll=0.25):
+    """Run `items` in a reader thread behind a queue of at most `max_buffer` entries.
+
+    The reader blocks while the queue is full (backpressure). When nothing
+    arrives for `poll` seconds the consumer gets IDLE.
+    """
+    q = queue.Queue(maxsize=max_buffer)
+    errors = []
+
+    def reader():
+        try:
+            for item in items:
+                if item is not IDLE:
+                    q.put(item)
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            q.put(_END)
+
+    threading.Thread(target=reader, daemon=True).start()
+    while True:
+        try:
+            item = q.get(timeout=poll)
+        except queue.Empty:
+            yield IDLE
+            continue
+        if item is _END:
+            break
+        yield item
+    if errors:
+        raise errors[0]
+
+
+def batches(records, batch_size=BATCH_SIZE, max_wait=1.0):
+    """Group records into lists of at most `batch_size`, flushed after `max_wait` seconds at the latest."""
+    batch = []
+    first_at = None
+    for record in records:
+        if record is not IDLE:
+            if not batch:
+                first_at = time.monotonic()
+            batch.append(record)
+        if batch and (len(batch) >= batch_size or time.monotonic() - first_at >= max_wait):
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def label_batches(record_batches, batch_size=BATCH_SIZE):
+    for batch in record_batches:
+        tiers = []
+        # A single line has no template to share.
+        labels = classify(batch, batch_size=batch_size, mine_templates=len(batch) > 1, tiers=tiers)
+        yield [
+            {"source": source, "log_message": log_message, "target_label": label, "label_tier": tier}
+            for (source, log_message), label, tier in zip(batch, labels, tiers)
+        ]
+
+
+def open_source(path, from_start=False, pattern="*.log*", poll=0.25):
+    if path == "-":
+        return read_lines(sys.stdin)
+    if os.path.isdir(path):
+        return follow_directory(path, pattern=pattern, from_start=from_start, poll=poll)
+    return follow_file(path, from_start=from_start, poll=poll)
+
+
+def run(path, output, batch_size=BATCH_SIZE, max_wait=1.0, max_buffer=10000, from_start=False,
+        pattern="*.log*", default_source="unknown", poll=0.25, record_format="auto"):
+    """Classify `path` ("-" for stdin, a file or a directory) until it ends, writing JSON lines to `output`."""
+    lines = open_source(path, from_start, pattern, poll)
+    records = buffered(parse_records(lines, default_source, record_format), max_buffer, poll)
+    for labeled in label_batches(batches(records, batch_size, max_wait), batch_size):
+        output.write("".join(json.dumps(record) + "\n" for record in labeled))
+        output.flush()
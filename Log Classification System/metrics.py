@@ -0,0 +1,205 @@
+"""Process-wide counters, gauges and histograms, rendered in the Prometheus text format.
+
+Updates take one lock acquisition each, and the tiers record whole batches
+at a time (`inc(n)`, `observe_many`), so the instrumentation can stay on
+under load. Worker processes hand their numbers back with `drain()`, and the
+parent folds them in with `merge()`.
+"""
+import bisect
+import threading
+
+_lock = threading.Lock()
+_metrics = {}
+_collectors = []
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+def _format_labels(labelnames, key, extra=()):
+    pairs = list(zip(labelnames, key)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(self.labelnames, labels), 0)
+
+    def _samples(self):
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+    def _drain(self):
+        values, self._values = self._values, {}
+        return values
+
+    def _merge(self, values):
+        for key, value in values.items():
+            self._values[key] = self._values.get(key, 0) + value
+
+
+class Gauge:
+    type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def set(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with _lock:
+            self._values[key] = value
+
+    def clear(self):
+        with _lock:
+            self._values = {}
+
+    def value(self, **labels):
+        return self._values.get(_label_key(self.labelnames, labels))
+
+    def _samples(self):
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+    def _drain(self):
+        # A gauge describes the process that renders it; worker values are not carried over.
+        return {}
+
+    def _merge(self, values):
+        pass
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        # label key -> [per-bucket counts (last one is +Inf), sum, count]
+        self._values = {}
+
+    def _series(self, key):
+        series = self._values.get(key)
+        if series is None:
+            series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        return series
+
+    def observe(self, value, **labels):
+        self.observe_many([value], **labels)
+
+    def observe_many(self, values, **labels):
+        key = _label_key(self.labelnames, labels)
+        values = list(values)
+        positions = [bisect.bisect_left(self.buckets, value) for value in values]
+        total = float(sum(values))
+        with _lock:
+            series = self._series(key)
+            for position in positions:
+                series[0][position] += 1
+            series[1] += total
+            series[2] += len(positions)
+
+    def _samples(self):
+        for key, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', le)])} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+    def _drain(self):
+        values, self._values = self._values, {}
+        return values
+
+    def _merge(self, values):
+        for key, (counts, total, count) in values.items():
+            series = self._series(key)
+            series[0] = [a + b for a, b in zip(series[0], counts)]
+            series[1] += total
+            series[2] += count
+
+
+def _register(metric):
+    # Re-importing a module (e.g. in a spawned worker) returns the existing metric.
+    with _lock:
+        return _metrics.setdefault(metric.name, metric)
+
+
+def counter(name, documentation, labelnames=()):
+    return _register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=()):
+    return _register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name, documentation, buckets, labelnames=()):
+    return _register(Histogram(name, documentation, buckets, labelnames))
+
+
+def collector(fn):
+    """Register `fn` to run before every render(), to refresh gauges that mirror
+    numbers kept elsewhere (cache hit counts, index sizes). Usable as a decorator."""
+    with _lock:
+        _collectors.append(fn)
+    return fn
+
+
+def render():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    for fn in list(_collectors):
+        try:
+            fn()
+        except Exception:
+            # A stat that cannot be read right now must not take /metrics down.
+            pass
+    lines = []
+    with _lock:
+        for metric in _metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric._samples())
+    return "\n".join(lines) + "\n"
+
+
+def drain():
+    """Take and reset everything recorded so far, as a picklable dict."""
+    with _lock:
+        return {name: metric._drain() for name, metric in _metrics.items()}
+
+
+def merge(state):
+    with _lock:
+        for name, values in state.items():
+            metric = _metrics.get(name)
+            if metric is not None:
+                metric._merge(values)
+
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096)
+
+ROWS = counter("log_classifier_rows_total", "Rows labeled, by the tier that labeled them", ["tier"])
+BATCH_SIZE = histogram("log_classifier_batch_size", "Rows per tier batch", BATCH_SIZE_BUCKETS, ["tier"])
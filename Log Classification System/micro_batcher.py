@@ -0,0 +1,78 @@
+import asyncio
+
+
+class MicroBatcher:
+    """Gathers records from concurrent callers into batches for one blocking handler.
+
+    A batch is closed when it holds `max_batch_size` records or `max_wait`
+    seconds after its first record arrived, whichever comes first. The
+    handler runs in the default executor so the event loop keeps accepting
+    requests meanwhile; each caller's future resolves to the labels of its
+    own records, in order. One caller's records are never split across
+    batches, so a single large request may exceed `max_batch_size`.
+    """
+
+    def __init__(self, handler, max_batch_size=64, max_wait=0.005):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = None
+        self._task = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, records):
+        records = list(records)
+        if not records:
+            return []
+        if self._task is None:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((records, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        size = len(batch[0][0])
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            records = [record for request, _ in batch for record in request]
+            try:
+                labels = await loop.run_in_executor(None, self.handler, records)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            start = 0
+            for request, future in batch:
+                # The caller may have gone away (client disconnect) meanwhile.
+                if not future.done():
+                    future.set_result(labels[start:start + len(request)])
+                start += len(request)
@@ -0,0 +1,75 @@
+import threading
+import time
+
+
+class LazyModel:
+    """Handle to a model that is loaded on first use, exactly once, from any thread."""
+
+    def __init__(self, name, loader, warm_up=None):
+        self.name = name
+        self._loader = loader
+        self._warm_up = warm_up
+        self._lock = threading.Lock()
+        self._value = None
+        self.loaded = False
+        self.load_seconds = None
+
+    def get(self):
+        if not self.loaded:
+            with self._lock:
+                if not self.loaded:
+                    start = time.perf_counter()
+                    self._value = self._loader()
+                    self.load_seconds = time.perf_counter() - start
+                    self.loaded = True
+        return self._value
+
+    def warm_up(self):
+        value = self.get()
+        if self._warm_up is not None and value is not None:
+            self._warm_up(value)
+
+
+_models = {}
+_ready = threading.Event()
+
+
+def register(name, loader, warm_up=None):
+    model = _models.get(name)
+    if model is None:
+        model = _models[name] = LazyModel(name, loader, warm_up)
+    return model
+
+
+def get(name):
+    return _models[name].get()
+
+
+def warm_up(names=None):
+    """Load the given models (all registered ones by default) and run one dummy inference on each."""
+    for name in names or list(_models):
+        _models[name].warm_up()
+    if names is None:
+        _ready.set()
+
+
+def preload(names):
+    """Load the given models without running them.
+
+    Meant for a server's master process before it forks its workers (see
+    gunicorn.conf.py): the loaded weights are then shared copy-on-write. No
+    inference runs here, so no thread pool exists yet at the fork.
+    """
+    for name in names:
+        _models[name].get()
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def status():
+    return {
+        name: {"loaded": model.loaded, "load_seconds": model.load_seconds}
+        for name, model in _models.items()
+    }
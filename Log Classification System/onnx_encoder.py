@@ -0,0 +1,122 @@
+"""ONNX Runtime backend for the sentence encoder, with dynamic int8 quantization.
+
+Export once (needs torch and sentence-transformers):
+    python onnx_encoder.py --export
+
+At inference time only onnxruntime and tokenizers are used. The transformer
+runs in ONNX Runtime; mean pooling and L2 normalization are applied here the
+same way the SentenceTransformer pipeline of all-MiniLM-L6-v2 does.
+"""
+import argparse
+import os
+
+import numpy as np
+
+ONNX_DIR = 'Models/onnx'
+
+
+def model_dir(encoder_name, root=ONNX_DIR):
+    return os.path.join(root, encoder_name.replace('/', '__'))
+
+
+def export(encoder_name, root=ONNX_DIR):
+    """Export the encoder's transformer to ONNX and write an int8 dynamically quantized copy."""
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer
+
+    target = model_dir(encoder_name, root)
+    os.makedirs(target, exist_ok=True)
+    encoder = SentenceTransformer(encoder_name, device='cpu')
+    transformer = encoder[0].auto_model.eval()
+    encoder.tokenizer.save_pretrained(target)
+    with open(os.path.join(target, 'max_seq_length'), 'w') as f:
+        f.write(str(encoder.max_seq_length))
+
+    sample = encoder.tokenizer(["warm-up"], return_tensors='pt')
+    inputs = ('input_ids', 'attention_mask', 'token_type_ids')
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in inputs}
+    dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+    fp32_path = os.path.join(target, 'model.onnx')
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[name] for name in inputs),
+            fp32_path,
+            input_names=list(inputs),
+            output_names=['last_hidden_state'],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+        )
+    quantize_dynamic(fp32_path, os.path.join(target, 'model.int8.onnx'), weight_type=QuantType.QInt8)
+    return target
+
+
+class OnnxEncoder:
+    """Drop-in for SentenceTransformer.encode on CPU, backed by ONNX Runtime."""
+
+    def __init__(self, path, quantized=True, threads=None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(path, 'max_seq_length')) as f:
+            max_seq_length = int(f.read())
+        self.tokenizer = Tokenizer.from_file(os.path.join(path, 'tokenizer.json'))
+        self.tokenizer.enable_truncation(max_seq_length)
+        self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        model_file = 'model.int8.onnx' if quantized else 'model.onnx'
+        self.session = ort.InferenceSession(
+            os.path.join(path, model_file), options, providers=['CPUExecutionProvider']
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _encode_batch(self, sentences):
+        encodings = self.tokenizer.encode_batch(sentences)
+        feeds = {
+            'input_ids': np.array([e.ids for e in encodings], dtype=np.int64),
+            'attention_mask': np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            'token_type_ids': np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+        # Mean pooling over the real tokens, then L2 normalization.
+        mask = feeds['attention_mask'][:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def encode(self, sentences, batch_size=32):
+        if isinstance(sentences, str):
+            return self._encode_batch([sentences])[0]
+        sentences = list(sentences)
+        if not sentences:
+            return np.zeros((0, self.session.get_outputs()[0].shape[-1]), dtype=np.float32)
+        return np.vstack([
+            self._encode_batch(sentences[start:start + batch_size])
+            for start in range(0, len(sentences), batch_size)
+        ]).astype(np.float32)
+
+
+def load(encoder_name, quantized=True, root=ONNX_DIR):
+    path = model_dir(encoder_name, root)
+    model_file = 'model.int8.onnx' if quantized else 'model.onnx'
+    if not os.path.exists(os.path.join(path, model_file)):
+        export(encoder_name, root)
+    return OnnxEncoder(path, quantized=quantized, threads=int(os.environ.get('ONNX_THREADS', "0")) or None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--export', action='store_true', help="export and quantize the encoder")
+    parser.add_argument('--encoder', default='all-MiniLM-L6-v2')
+    args = parser.parse_args()
+    if args.export:
+        print(f"exported to {export(args.encoder)}")
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,233 @@
-import joblib
-from sentence_transformers import SentenceTransformer
-Encoder = SentenceTransformer('all-MiniLM-L6-v2')
-Model = joblib.load('Models/log_classifier.joblib')
+import csv
+import logging
+import numpy as np
+import os
+import random
+import metrics
+import model_registry
+from classifier_registry import ClassifierRegistry
+from embedding_cache import cache_from_env
+
+ENCODER_NAME = 'all-MiniLM-L6-v2'
+MODEL_PATH = os.environ.get('MODEL_PATH', 'Models/log_classifier.joblib')
+TRAINING_DATA = 'Training/dataset/synthetic_logs.csv'
+
+# A new classifier file only goes live if it labels this share of a sample of
+# the BERT-tier training rows correctly.
+MIN_SMOKE_ACCURACY = float(os.environ.get('MODEL_MIN_SMOKE_ACCURACY', "0.8"))
+SMOKE_SAMPLE_SIZE = 64
+# Share of batches that the shadow classifiers (see /admin/models/shadow) also score.
+SHADOW_SAMPLE_RATE = float(os.environ.get('SHADOW_SAMPLE_RATE', "0.1"))
+
+# "torch" runs SentenceTransformer; "onnx" runs the int8 quantized export
+# through ONNX Runtime (see onnx_encoder.py), "onnx-fp32" the unquantized one.
+BACKEND = os.environ.get('BERT_BACKEND', "torch")
+
+BATCH_SIZE = 64
+CONFIDENCE_THRESHOLD = 0.5
+
+
+def _load_encoder():
+    if BACKEND.startswith("onnx"):
+        import onnx_encoder
+        return onnx_encoder.load(ENCODER_NAME, quantized=BACKEND != "onnx-fp32")
+    # Imported here so that importing this module never pulls in torch.
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(ENCODER_NAME)
+
+
+def _cache_encoder_name():
+    # Quantized embeddings differ slightly, so each backend gets its own cache entries.
+    return ENCODER_NAME if BACKEND == "torch" else f"{ENCODER_NAME}+{BACKEND}"
+
+
+Encoder = model_registry.register("encoder", _load_encoder, warm_up=lambda encoder: encoder.encode(["warm-up"]))
+
+
+_smoke_sample = None
+
+
+def _load_smoke_sample():
+    # Embedded once per process and reused for every candidate classifier.
+    global _smoke_sample
+    if _smoke_sample is None:
+        rows = []
+        if os.path.exists(TRAINING_DATA):
+            with open(TRAINING_DATA, newline="", encoding="utf-8") as f:
+                rows = [(row["log_message"], row["target_label"]) for row in csv.DictReader(f)
+                        if row.get("complexity") == "bert"]
+        rows = random.Random(0).sample(rows, min(SMOKE_SAMPLE_SIZE, len(rows)))
+        embeddings = Encoder.get().encode([message for message, _ in rows]) if rows else np.zeros((0, 0))
+        _smoke_sample = (embeddings, [label for _, label in rows])
+    return _smoke_sample
+
+
+MODEL_INFO = metrics.gauge("log_classifier_model_info", "Version of the active BERT-tier classifier", ["version"])
+PREDICTIONS = metrics.counter(
+    "log_classifier_bert_predictions_total", "Fresh BERT predictions, by classifier version", ["version"]
+)
+SHADOW_PREDICTIONS = metrics.counter(
+    "log_classifier_shadow_predictions_total", "Predictions made by shadow classifiers, by version", ["version"]
+)
+SHADOW_DISAGREEMENTS = metrics.counter(
+    "log_classifier_shadow_disagreements_total",
+    "Shadow predictions that differ from the active classifier's label, by shadow version", ["version"],
+)
+SHADOW_FAILURES = metrics.counter(
+    "log_classifier_shadow_failures_total", "Batches a shadow classifier failed to score, by version", ["version"]
+)
+
+log = logging.getLogger(__name__)
+
+
+def _on_swap(active):
+    MODEL_INFO.clear()
+    MODEL_INFO.set(1, version=active.version)
+    # Cached labels came from the previous classifier; the embeddings stay valid.
+    if Cache.loaded and Cache.get() is not None:
+        Cache.get().set_model_fingerprint(active.fingerprint)
+
+
+def _load_classifier():
+    registry = ClassifierRegistry(
+        MODEL_PATH, smoke_sample=_load_smoke_sample, min_smoke_accuracy=MIN_SMOKE_ACCURACY,
+        shadow_rate=SHADOW_SAMPLE_RATE, on_swap=_on_swap,
+    )
+    MODEL_INFO.set(1, version=registry.active.version)
+    return registry
+
+
+def _load_cache():
+    cache = cache_from_env(_cache_encoder_name(), MODEL_PATH)
+    if cache is not None:
+        # Match the classifier actually serving, in case the file changed since it was loaded.
+        cache.set_model_fingerprint(Model.get().active.fingerprint)
+    return cache
+
+
+Model = model_registry.register(
+    "classifier",
+    _load_classifier,
+    warm_up=lambda registry: registry.active.model.predict_proba(
+        np.zeros((1, registry.active.model.n_features_in_), dtype=np.float32)
+    ),
+)
+Cache = model_registry.register("bert_cache", _load_cache)
+
+
+CONFIDENCE = metrics.histogram(
+    "log_classifier_bert_confidence", "Top class probability of fresh BERT predictions",
+    (0.1, 0.2, 0.3, 0.4, CONFIDENCE_THRESHOLD, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99),
+)
+UNKNOWN = metrics.counter(
+    "log_classifier_bert_unknown_total", f"BERT predictions below the {CONFIDENCE_THRESHOLD} confidence threshold"
+)
+
 
 def classify_with_bert(log_message):
-    embeddings = Encoder.encode([log_message])
-    probabilities = Model.predict_proba(embeddings)[0]
-    if max(probabilities) < 0.5 : 
-        return "Unknown"
-    return Model.predict(embeddings)[0]
+    return classify_with_bert_batch([log_message])[0]
+
+
+def _scores(embeddings, version=None):
+    # One predict_proba pass; the argmax of the probabilities gives the same
+    # label as the classifier's predict would.
+    model = (version or Model.get().active).model
+    probabilities = model.predict_proba(embeddings)
+    return model.classes_[probabilities.argmax(axis=1)], probabilities.max(axis=1)
+
+
+def _predict(embeddings, version=None):
+    version = version or Model.get().active
+    predicted, confidences = _scores(embeddings, version)
+    CONFIDENCE.observe_many(confidences.tolist())
+    UNKNOWN.inc(int((confidences < CONFIDENCE_THRESHOLD).sum()))
+    PREDICTIONS.inc(len(predicted), version=version.version)
+    labels = [
+        "Unknown" if confidence < CONFIDENCE_THRESHOLD else str(label)
+        for label, confidence in zip(predicted, confidences)
+    ]
+    for shadow in Model.get().sample_shadows():
+        _shadow_score(shadow, embeddings, labels)
+    return labels
+
+
+def _shadow_score(shadow, embeddings, labels):
+    # Shadow labels are only counted, never returned, and a failing shadow never fails the batch.
+    try:
+        predicted, confidences = _scores(embeddings, shadow)
+    except Exception as e:
+        SHADOW_FAILURES.inc(version=shadow.version)
+        log.warning("shadow classifier %s failed: %s", shadow.version, e)
+        return
+    SHADOW_PREDICTIONS.inc(len(labels), version=shadow.version)
+    SHADOW_DISAGREEMENTS.inc(sum(
+        ("Unknown" if confidence < CONFIDENCE_THRESHOLD else str(label)) != active_label
+        for label, confidence, active_label in zip(predicted, confidences, labels)
+    ), version=shadow.version)
+
+
+def _classify_chunk(log_messages, batch_size):
+    # The whole chunk is labeled by the version active when it started, even if a reload lands meanwhile.
+    version = Model.get().active
+    cache = Cache.get()
+    if cache is None:
+        return _predict(Encoder.get().encode(log_messages, batch_size=batch_size), version)
+
+    keys, entries = cache.lookup(log_messages)
+    labels = [entry[1] if entry is not None else None for entry in entries]
+    unlabeled = [i for i, label in enumerate(labels) if label is None]
+    if not unlabeled:
+        return labels
+
+    # Only messages with no cached embedding go through the encoder.
+    to_encode = [i for i in unlabeled if entries[i] is None]
+    embeddings = {}
+    if to_encode:
+        encoded = Encoder.get().encode([log_messages[i] for i in to_encode], batch_size=batch_size)
+        embeddings.update(zip(to_encode, encoded))
+    for i in unlabeled:
+        if entries[i] is not None:
+            embeddings[i] = entries[i][0]
+
+    predicted = _predict(np.vstack([embeddings[i] for i in unlabeled]), version)
+    for i, label in zip(unlabeled, predicted):
+        labels[i] = label
+    cache.store([keys[i] for i in unlabeled], [embeddings[i] for i in unlabeled], predicted, version.fingerprint)
+    return labels
+
+
+def classify_with_bert_batch(log_messages, batch_size=BATCH_SIZE):
+    labels = []
+    for start in range(0, len(log_messages), batch_size):
+        labels.extend(_classify_chunk(list(log_messages[start:start + batch_size]), batch_size))
+    return labels
+
+
+def classify_with_bert_confidence(log_messages, batch_size=BATCH_SIZE):
+    """(label, confidence) per message, before the "Unknown" threshold and bypassing the cache."""
+    if not len(log_messages):
+        return []
+    predicted, confidences = _scores(Encoder.get().encode(list(log_messages), batch_size=batch_size))
+    return [(str(label), float(confidence)) for label, confidence in zip(predicted, confidences)]
+
+
+def model_version():
+    """Version of the active classifier, or None while it has not been loaded."""
+    return Model.get().active.version if Model.loaded else None
+
+
+def cache_stats():
+    cache = Cache.get() if Cache.loaded else None
+    return cache.stats() if cache is not None else None
+
+
+CACHE_STATS = metrics.gauge(
+    "log_classifier_bert_cache", "Embedding cache hits, label hits, misses, hit rate, entries and evictions", ["stat"]
+)
+
 
+@metrics.collector
+def _collect_cache_stats():
+    stats = cache_stats()
+    for name, value in (stats or {}).items():
+        CACHE_STATS.set(value, stat=name)
@@ -1,39 +1,599 @@
 from dotenv import load_dotenv
-from groq import Groq
+import asyncio
+import collections
+import random
 import re
 import os
+import threading
+import time
+import metrics
+import model_registry
+from llm_cache import cache_from_env
 
 
 load_dotenv()
 
-groq = Groq(
-    api_key = os.environ.get('GROQ_API_KEY')
+LLM_MODEL = os.environ.get('LLM_MODEL', "openai/gpt-oss-120b")
+# GROQ_BASE_URL lets the tier be pointed at a local stub server, see benchmarks/stub_llm_server.py
+LLM_BASE_URL = os.environ.get('GROQ_BASE_URL') or None
+LLM_CONCURRENCY = int(os.environ.get('LLM_CONCURRENCY', "8"))
+LLM_REQUESTS_PER_SECOND = float(os.environ.get('LLM_REQUESTS_PER_SECOND', "10"))
+LLM_MESSAGES_PER_REQUEST = int(os.environ.get('LLM_MESSAGES_PER_REQUEST', "10"))
+LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', "3"))
+# Seconds one API call may take, and that the LLM tier may spend on one batch
+# (0: no budget). Messages left without an answer fall back, see _fallback.
+LLM_CALL_TIMEOUT = float(os.environ.get('LLM_CALL_TIMEOUT', "15"))
+LLM_BUDGET = float(os.environ.get('LLM_BUDGET', "60"))
+# The circuit breaker opens after this many failed calls in a row and lets
+# one trial call through once the cooldown has passed.
+LLM_BREAKER_FAILURES = int(os.environ.get('LLM_BREAKER_FAILURES', "5"))
+LLM_BREAKER_COOLDOWN = float(os.environ.get('LLM_BREAKER_COOLDOWN', "30"))
+# Fallback: the nearest indexed message's label if at least this similar, else BERT.
+LLM_FALLBACK_THRESHOLD = float(os.environ.get('LLM_FALLBACK_THRESHOLD', "0.75"))
+
+# Bump when the prompts or their parsing change, so cached answers are not reused.
+PROMPT_VERSION = 2
+CATEGORIES = '(1) Workflow Error, (2) Deprecation Warning.'
+LABELS = ("Workflow Error", "Deprecation Warning")
+
+# Nearest-neighbor index of labeled LegacyCRM messages that answers before the LLM.
+LLM_INDEX = os.environ.get('LLM_INDEX', "1") != "0"
+LLM_INDEX_PATH = os.environ.get('LLM_INDEX_PATH', "Models/legacycrm_index")
+LLM_INDEX_K = int(os.environ.get('LLM_INDEX_K', "3"))
+LLM_INDEX_THRESHOLD = float(os.environ.get('LLM_INDEX_THRESHOLD', "0.9"))
+TRAINING_DATA = 'Training/dataset/synthetic_logs.csv'
+
+
+def retryable_errors():
+    # groq (and httpx/pydantic behind it) is only imported once the tier is used.
+    from groq import APIConnectionError, InternalServerError, RateLimitError
+    return (APIConnectionError, InternalServerError, RateLimitError)
+
+
+REQUEST_SECONDS = metrics.histogram(
+    "log_classifier_llm_request_seconds", "Latency of single LLM API calls, retries counted separately",
+    (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32),
+)
+ERRORS = metrics.counter("log_classifier_llm_errors_total", "Failed LLM API calls, by exception type", ["error"])
+RETRIES = metrics.counter("log_classifier_llm_retries_total", "LLM API calls retried after a retryable error")
+INDEX_HITS = metrics.counter(
+    "log_classifier_llm_index_hits_total", "LegacyCRM messages labeled by the nearest-neighbor index"
+)
+MALFORMED = metrics.counter(
+    "log_classifier_llm_malformed_answers_total", "Multi-message answers without one category per message"
+)
+BREAKER_OPEN = metrics.gauge("log_classifier_llm_breaker_open", "1 while the LLM circuit breaker is open")
+FALLBACKS = metrics.counter(
+    "log_classifier_llm_fallback_total", "LegacyCRM messages labeled without the LLM, by fallback tier", ["tier"]
 )
 
-def classify_with_llm(log_msg):
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class BudgetExceededError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    """Stops calling the LLM after `failures` failed calls in a row.
+
+    While open, calls fail at once. After `cooldown` seconds one trial call
+    goes through: its success closes the breaker, its failure re-opens it.
+    Only API errors and per-call timeouts are failures; a call cut off by its
+    own batch's budget says nothing about the LLM and is just released.
+    Shared by every batch of the process, so it is thread-safe rather than
+    tied to one event loop.
     """
-    Generate a variant of the input sentence. For example,
-    If input sentence is "User session timed out unexpectedly, user ID: 9250.",
-    variant would be "Session timed out for user 9251"
+
+    def __init__(self, failures=LLM_BREAKER_FAILURES, cooldown=LLM_BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._consecutive = 0
+        self._opened_at = None
+        self._trial = False
+
+    def is_open(self):
+        with self._lock:
+            return self._opened_at is not None and (self._trial or time.monotonic() - self._opened_at < self.cooldown)
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial or time.monotonic() - self._opened_at < self.cooldown:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive = 0
+            self._opened_at = None
+            self._trial = False
+        BREAKER_OPEN.set(0)
+
+    def release(self):
+        """End a call that neither succeeded nor failed, so another caller can take the trial."""
+        with self._lock:
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self._trial or self._consecutive >= self.failures:
+                self._opened_at = time.monotonic()
+                self._trial = False
+                opened = True
+            else:
+                opened = False
+        if opened:
+            BREAKER_OPEN.set(1)
+
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if self._trial or time.monotonic() - self._opened_at >= self.cooldown else "open"
+
+
+BREAKER = CircuitBreaker()
+
+
+class TokenBucket:
+    """Async token bucket: `rate` requests per second with bursts up to `capacity`.
+
+    Thread-safe, so one bucket can be shared by every event loop of the
+    process (each batch run outside the server loop gets a loop of its own).
     """
-    prompt = f'''Classify the log message into one of these categories: 
-    (1) Workflow Error, (2) Deprecation Warning.
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    async def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            await asyncio.sleep(wait)
+
+
+class ConcurrencyLimit:
+    """Async semaphore of `limit` slots shared by every event loop and thread of the process."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiters = collections.deque()
+
+    async def __aenter__(self):
+        with self._lock:
+            if self._active < self.limit and not self._waiters:
+                self._active += 1
+                return self
+            loop = asyncio.get_running_loop()
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except BaseException:
+            with self._lock:
+                try:
+                    self._waiters.remove(waiter)
+                    handed_over = False
+                except ValueError:
+                    handed_over = True
+            # A slot handed to a caller that went away goes to the next one.
+            if handed_over:
+                self._release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._release()
+
+    def _release(self):
+        with self._lock:
+            while self._waiters:
+                # The slot passes straight to the oldest waiter, on its own loop.
+                loop, future = self._waiters.popleft()
+                try:
+                    loop.call_soon_threadsafe(_resolve, future)
+                    return
+                except RuntimeError:
+                    # Its loop is closed, so the waiter is gone.
+                    continue
+            self._active -= 1
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+# Shared by every batch of the process, like BREAKER: concurrent uploads, jobs
+# and micro-batches split LLM_CONCURRENCY and LLM_REQUESTS_PER_SECOND.
+CONCURRENCY = ConcurrencyLimit(LLM_CONCURRENCY)
+RATE_LIMIT = TokenBucket(LLM_REQUESTS_PER_SECOND)
+
+
+def build_prompt(log_msg):
+    return f'''Classify the log message into one of these categories:
+    {CATEGORIES}
     If you can't figure out a category, use "Unclassified".
-    Put the category inside <category> </category> tags. 
+    Put the category inside <category> </category> tags.
     Log message: {log_msg}'''
 
-    chat_completion = groq.chat.completions.create(
-        messages=[{"role": "user", "content": prompt}],
-        model="openai/gpt-oss-120b",
-        temperature=0.5
-    )
 
-    content = chat_completion.choices[0].message.content
+def build_multi_prompt(log_msgs):
+    numbered = "\n".join(f"{i}. {log_msg}" for i, log_msg in enumerate(log_msgs, start=1))
+    return f'''Classify each of the following {len(log_msgs)} log messages into one of these categories:
+    {CATEGORIES}
+    If you can't figure out a category for a message, use "Unclassified".
+    Answer with exactly {len(log_msgs)} lines, one per message and in the same order,
+    each line putting the category inside <category> </category> tags.
+    Log messages:
+{numbered}'''
+
+
+def parse_category(content):
     match = re.search(r'<category>(.*)<\/category>', content, flags=re.DOTALL)
     category = "Unclassified"
     if match:
-        category = match.group(1)
-
+        category = match.group(1).strip()
     return category
 
 
+def parse_categories(content, expected):
+    categories = [c.strip() for c in re.findall(r'<category>(.*?)<\/category>', content, flags=re.DOTALL)]
+    return categories if len(categories) == expected else None
+
+
+class LLMTier:
+    """One batch run of the LLM tier: bounded concurrency, rate limit, retries and deadlines.
+
+    The concurrency limit and the rate limit default to the process-wide
+    CONCURRENCY and RATE_LIMIT, so batches running at the same time share them.
+
+    Each call may take `call_timeout` seconds. The whole run ends at
+    `deadline` (a time.monotonic() value, or None); messages whose group has
+    not been answered by then, failed, or met an open `breaker` come back
+    as None.
+    """
+
+    def __init__(self, client, concurrency=CONCURRENCY, rate_limit=RATE_LIMIT, max_retries=LLM_MAX_RETRIES,
+                 model=LLM_MODEL, call_timeout=LLM_CALL_TIMEOUT, deadline=None, breaker=BREAKER):
+        self.client = client
+        self.model = model
+        self.max_retries = max_retries
+        self.call_timeout = call_timeout
+        self.deadline = deadline
+        self.breaker = breaker
+        self._retryable = retryable_errors() + (asyncio.TimeoutError,)
+        self._semaphore = concurrency
+        self._bucket = rate_limit
+
+    def _remaining(self):
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    async def _complete(self, prompt):
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._semaphore:
+                    await self._bucket.acquire()
+                    remaining = self._remaining()
+                    if remaining is not None and remaining <= 0:
+                        raise BudgetExceededError("the LLM budget of this batch is used up")
+                    if not self.breaker.allow():
+                        raise CircuitOpenError("LLM circuit breaker is open")
+                    budget_bound = remaining is not None and remaining < self.call_timeout
+                    start = time.perf_counter()
+                    try:
+                        chat_completion = await asyncio.wait_for(
+                            self.client.chat.completions.create(
+                                messages=[{"role": "user", "content": prompt}],
+                                model=self.model,
+                                temperature=0,
+                                top_p=1,
+                                seed=0,
+                            ),
+                            timeout=remaining if budget_bound else self.call_timeout,
+                        )
+                    except asyncio.TimeoutError:
+                        if not budget_bound:
+                            self.breaker.record_failure()
+                            raise
+                        # Cut off by this batch's budget, not by a slow LLM.
+                        self.breaker.release()
+                        raise BudgetExceededError("the LLM budget of this batch ran out during a call") from None
+                    except Exception:
+                        self.breaker.record_failure()
+                        raise
+                    except BaseException:
+                        # Cancelled because the batch ran out of budget (or
+                        # interrupted): release a trial call instead of
+                        # counting it, or it would hold the breaker open.
+                        self.breaker.release()
+                        raise
+                    finally:
+                        REQUEST_SECONDS.observe(time.perf_counter() - start)
+                    self.breaker.record_success()
+                return chat_completion.choices[0].message.content or ""
+            except (CircuitOpenError, BudgetExceededError):
+                raise
+            except Exception as e:
+                ERRORS.inc(error=type(e).__name__)
+                if not isinstance(e, self._retryable) or attempt == self.max_retries:
+                    raise
+                # Exponential backoff with full jitter, if the budget leaves room for another try.
+                backoff = random.uniform(0, min(8.0, 0.5 * 2 ** attempt))
+                remaining = self._remaining()
+                if remaining is not None and remaining <= backoff:
+                    raise
+                RETRIES.inc()
+                await asyncio.sleep(backoff)
+
+    async def classify_one(self, log_msg):
+        return parse_category(await self._complete(build_prompt(log_msg)))
+
+    async def classify_group(self, log_msgs):
+        if len(log_msgs) == 1:
+            return [await self.classify_one(log_msgs[0])]
+        categories = parse_categories(await self._complete(build_multi_prompt(log_msgs)), len(log_msgs))
+        if categories is None:
+            # The model did not answer one tag per message; ask one at a time.
+            MALFORMED.inc()
+            categories = await asyncio.gather(*(self.classify_one(log_msg) for log_msg in log_msgs))
+        return list(categories)
+
+    async def classify(self, log_msgs, messages_per_request=LLM_MESSAGES_PER_REQUEST):
+        groups = [log_msgs[i:i + messages_per_request] for i in range(0, len(log_msgs), messages_per_request)]
+        tasks = [asyncio.ensure_future(self.classify_group(group)) for group in groups]
+        remaining = self._remaining()
+        _, pending = await asyncio.wait(tasks, timeout=max(remaining, 0) if remaining is not None else None)
+        # Out of budget: stop waiting for the groups still running.
+        if pending:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        categories = []
+        out_of_budget = 0
+        for group, task in zip(groups, tasks):
+            if task.cancelled() or task.exception() is not None:
+                # Counted once per group here, whether the budget cut a call
+                # short or the group was still waiting for its turn.
+                out_of_budget += task.cancelled() or isinstance(task.exception(), BudgetExceededError)
+                categories.extend([None] * len(group))
+            else:
+                categories.extend(task.result())
+        if out_of_budget:
+            ERRORS.inc(out_of_budget, error="BudgetExceeded")
+        return categories
+
+
+def make_client():
+    from groq import AsyncGroq
+    return AsyncGroq(api_key=os.environ.get('GROQ_API_KEY'), base_url=LLM_BASE_URL, max_retries=0)
+
+
+Cache = model_registry.register("llm_cache", lambda: cache_from_env(PROMPT_VERSION, LLM_MODEL))
+
+
+def _encode(log_msgs):
+    import processor_bert
+    return processor_bert.Encoder.get().encode(list(log_msgs), batch_size=processor_bert.BATCH_SIZE)
+
+
+def _load_index():
+    if not LLM_INDEX:
+        return None
+    import processor_bert
+    from label_index import LabelIndex, training_examples
+    index = LabelIndex(
+        LLM_INDEX_PATH,
+        processor_bert._cache_encoder_name(),
+        _encode(["dimension probe"]).shape[1],
+        k=LLM_INDEX_K,
+        threshold=LLM_INDEX_THRESHOLD,
+    )
+    if index.count == 0:
+        examples = training_examples(TRAINING_DATA, "LegacyCRM", LABELS)
+        if examples:
+            index.add(_encode([message for message, _ in examples]), [label for _, label in examples])
+    return index
+
+
+Index = model_registry.register("llm_index", _load_index)
+
+
+async def _classify_with_llm_api(log_msgs, messages_per_request, **tier_options):
+    """LLM answers in order, None where the budget, an error or the breaker left a message unanswered."""
+    breaker = tier_options.get("breaker", BREAKER)
+    if breaker.is_open():
+        return [None] * len(log_msgs)
+    async with make_client() as client:
+        return await LLMTier(client, **tier_options).classify(list(log_msgs), messages_per_request)
+
+
+def _fallback(log_msgs, embeddings, index):
+    """(category, tier) for messages the LLM did not answer: a close indexed label, else BERT."""
+    import processor_bert
+    results = [None] * len(log_msgs)
+    if index is not None:
+        for i, category in enumerate(index.nearest(embeddings, LLM_FALLBACK_THRESHOLD)):
+            if category is not None:
+                results[i] = (category, "fallback_index")
+    rest = [i for i, result in enumerate(results) if result is None]
+    if rest:
+        for i, label in zip(rest, processor_bert.classify_with_bert_batch([log_msgs[i] for i in rest])):
+            results[i] = (label, "fallback_bert")
+    for tier in ("fallback_index", "fallback_bert"):
+        FALLBACKS.inc(sum(result[1] == tier for result in results), tier=tier)
+    return results
+
+
+async def _classify_uncached(log_msgs, messages_per_request, **tier_options):
+    """(categories, tiers) for messages the cache did not answer.
+
+    Messages whose nearest labeled neighbors agree skip the LLM; what the
+    LLM answers with a known category is added to the index; what it leaves
+    unanswered falls back.
+    """
+    log_msgs = list(log_msgs)
+    index = await asyncio.to_thread(Index.get)
+    embeddings = None
+    if index is None:
+        categories = [None] * len(log_msgs)
+        tiers = [None] * len(log_msgs)
+    else:
+        embeddings = await asyncio.to_thread(_encode, log_msgs)
+        categories = index.lookup(embeddings)
+        INDEX_HITS.inc(sum(category is not None for category in categories))
+        tiers = ["llm_index" if category is not None else None for category in categories]
+
+    todo = [i for i, category in enumerate(categories) if category is None]
+    if todo:
+        answers = await _classify_with_llm_api([log_msgs[i] for i in todo], messages_per_request, **tier_options)
+        for i, category in zip(todo, answers):
+            if category is not None:
+                categories[i], tiers[i] = category, "llm"
+        confirmed = [i for i, category in zip(todo, answers) if category in LABELS]
+        if confirmed and index is not None:
+            await asyncio.to_thread(index.add, embeddings[confirmed], [categories[i] for i in confirmed])
+
+    unanswered = [i for i, category in enumerate(categories) if category is None]
+    if unanswered:
+        fallback_embeddings = embeddings[unanswered] if embeddings is not None else None
+        fallbacks = await asyncio.to_thread(_fallback, [log_msgs[i] for i in unanswered], fallback_embeddings, index)
+        for i, (category, tier) in zip(unanswered, fallbacks):
+            categories[i], tiers[i] = category, tier
+    return categories, tiers
+
+
+async def classify_with_llm_async(log_msgs, messages_per_request=LLM_MESSAGES_PER_REQUEST, tiers=None,
+                                  budget=LLM_BUDGET, **tier_options):
+    """Categories of `log_msgs`. Pass a list as `tiers` to have it extended with the tier that
+    answered each message: llm, llm_cache, llm_index, fallback_index or fallback_bert."""
+    log_msgs = list(log_msgs)
+    if not log_msgs:
+        return []
+    if budget and "deadline" not in tier_options:
+        tier_options["deadline"] = time.monotonic() + budget
+    cache = Cache.get()
+    if cache is None:
+        categories, answered_by = await _classify_uncached(log_msgs, messages_per_request, **tier_options)
+        if tiers is not None:
+            tiers.extend(answered_by)
+        return categories
+
+    keys = [cache.key(log_msg) for log_msg in log_msgs]
+    categories = cache.get_many(keys)
+    answered_by = {key: "llm_cache" for key in categories}
+    # Identical misses in one batch become a single LLM call.
+    pending = {}
+    for key, log_msg in zip(keys, log_msgs):
+        if key not in categories and key not in pending:
+            pending[key] = log_msg
+    if pending:
+        answers, answer_tiers = await _classify_uncached(list(pending.values()), messages_per_request, **tier_options)
+        fresh = dict(zip(pending, answers))
+        answered_by.update(zip(pending, answer_tiers))
+        # "Unclassified" is also what a malformed answer parses to, and a
+        # fallback is only a stand-in; don't pin either.
+        cache.put_many([
+            (key, category) for key, category in fresh.items()
+            if category != "Unclassified" and answered_by[key] in ("llm", "llm_index")
+        ])
+        categories.update(fresh)
+    if tiers is not None:
+        tiers.extend(answered_by[key] for key in keys)
+    return [categories[key] for key in keys]
+
+
+def cache_stats():
+    cache = Cache.get() if Cache.loaded else None
+    return cache.stats() if cache is not None else None
+
+
+CACHE_STATS = metrics.gauge(
+    "log_classifier_llm_cache", "LLM response cache hits, misses, hit rate, expirations, evictions and entries",
+    ["stat"],
+)
+
+
+@metrics.collector
+def _collect_cache_stats():
+    stats = cache_stats()
+    for name, value in (stats or {}).items():
+        CACHE_STATS.set(value, stat=name)
+
+
+def index_stats():
+    index = Index.get() if Index.loaded else None
+    return index.stats() if index is not None else None
+
+
+INDEX_STATS = metrics.gauge(
+    "log_classifier_llm_index", "Nearest-neighbor index hits, misses, hit rate and entries", ["stat"]
+)
+
+
+@metrics.collector
+def _collect_index_stats():
+    stats = index_stats()
+    for name, value in (stats or {}).items():
+        INDEX_STATS.set(value, stat=name)
+
+
+def _run(coro):
+    # classify() is also called from inside FastAPI's event loop, where
+    # asyncio.run is not allowed; run on a private loop in a helper thread then.
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    result = {}
+
+    def target():
+        try:
+            result["value"] = asyncio.run(coro)
+        except BaseException as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+def classify_with_llm(log_msg):
+    return classify_with_llm_batch([log_msg], messages_per_request=1)[0]
+
+
+def request_deadline(budget=LLM_BUDGET):
+    """One deadline for all the LLM calls of a request or job (None without a budget).
+
+    Pass it down to every classify() call of that request, so a chunked
+    upload shares one LLM_BUDGET instead of getting a fresh one per chunk.
+    """
+    return time.monotonic() + budget if budget else None
+
+
+def classify_with_llm_batch(log_messages, messages_per_request=LLM_MESSAGES_PER_REQUEST, tiers=None, deadline=None):
+    # Without a deadline, classify_with_llm_async starts an LLM_BUDGET of its own.
+    options = {} if deadline is None else {"deadline": deadline}
+    return _run(classify_with_llm_async(log_messages, messages_per_request, tiers=tiers, **options))
@@ -1,16 +1,162 @@
+import json
+import os
 import re
+from collections import Counter
+
+import metrics
+
+# promote_rules.py writes new rule versions; REGEX_RULES_FILE picks another file.
+RULES_FILE = os.environ.get('REGEX_RULES_FILE', 'Rules/regex_rules.json')
+
+_REGEX_META = set('.^$*+?{}[]\\|()')
+_QUANTIFIERS = set('*+?{')
+
+
+def _has_top_level_alternation(pattern):
+    # A | outside any group or character class: "a|b" has one, "x (a|b)" does not.
+    depth, i = 0, 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            i += 1
+        elif char == '[':
+            # Skip the class; a ] right after [ or [^ is a literal.
+            i += 1
+            if i < len(pattern) and pattern[i] == '^':
+                i += 1
+            if i < len(pattern) and pattern[i] == ']':
+                i += 1
+            while i < len(pattern) and pattern[i] != ']':
+                i += 2 if pattern[i] == '\\' else 1
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            return True
+        i += 1
+    return False
+
+
+def _literal_anchor(pattern):
+    # Leading literal text every match of the pattern must contain. Used as a
+    # cheap substring prefilter before running the rule's own regex. A leading
+    # ^ (as in the promoted rules) does not stop the anchor. With a top-level
+    # alternation no single text is shared by every match, so there is none.
+    if _has_top_level_alternation(pattern):
+        return None
+    if pattern.startswith('^'):
+        pattern = pattern[1:]
+    end = 0
+    while end < len(pattern) and pattern[end] not in _REGEX_META:
+        end += 1
+    if end < len(pattern) and pattern[end] in _QUANTIFIERS:
+        end -= 1
+    return pattern[:max(end, 0)] or None
+
+
+class RegexRuleEngine:
+    """Compiles all rules once and prefilters them on their literal anchors.
+
+    Every rule's leading literal text ("Backup ", "User User", "System ...")
+    goes into one alternation of plain strings, which the regex engine scans
+    in a single pass. A line containing none of the anchors is rejected
+    without running any rule. Otherwise only the rules whose anchor is present
+    are searched, in rule order, so the first rule that matches wins exactly
+    as in the old loop.
+    """
+
+    def __init__(self, rules, version=None):
+        self.version = version
+        self.rules = [(pattern, label) for pattern, label in rules]
+        self._compiled = [re.compile(pattern) for pattern, _ in self.rules]
+        self._anchors = [_literal_anchor(pattern) for pattern, _ in self.rules]
+        self._labels = [label for _, label in self.rules]
+        # Rules without a usable anchor have to be searched on every line.
+        self._unanchored = [i for i, anchor in enumerate(self._anchors) if anchor is None]
+        anchors = sorted({anchor for anchor in self._anchors if anchor is not None}, key=len, reverse=True)
+        self._prefilter = re.compile("|".join(re.escape(anchor) for anchor in anchors)) if anchors else None
+
+    def match_index(self, log_message):
+        if not isinstance(log_message, str):
+            return None
+        if self._prefilter is None or self._prefilter.search(log_message) is None:
+            candidates = self._unanchored
+        else:
+            candidates = range(len(self.rules))
+        return self._search(log_message, candidates)
+
+    def _search(self, log_message, candidates):
+        for i in candidates:
+            anchor = self._anchors[i]
+            if anchor is not None and anchor not in log_message:
+                continue
+            if self._compiled[i].search(log_message):
+                return i
+        return None
+
+    def match(self, log_message):
+        index = self.match_index(log_message)
+        return None if index is None else self._labels[index]
+
+    def match_series(self, log_messages):
+        """Labels of a pandas Series of lines (None on a miss), with the same index.
+
+        One Series.str.contains pass over the anchor alternation picks the
+        lines that can match at all, and only those are searched rule by rule.
+        With an unanchored rule every line is a candidate, as in match().
+        """
+        import pandas as pd
+        labels = pd.Series([None] * len(log_messages), index=log_messages.index, dtype=object)
+        if self._unanchored:
+            labels[:] = [self.match(message) for message in log_messages]
+            return labels
+        if self._prefilter is None or not len(log_messages):
+            return labels
+        try:
+            candidates = log_messages.str.contains(self._prefilter, na=False).to_numpy(dtype=bool)
+        except AttributeError:
+            # Not a single string in the Series.
+            return labels
+        every_rule = range(len(self.rules))
+        labels[candidates] = [
+            None if i is None else self._labels[i]
+            for i in (self._search(message, every_rule) for message in log_messages[candidates])
+        ]
+        return labels
+
+
+def load_rules(rules_file=RULES_FILE):
+    with open(rules_file, "r") as f:
+        data = json.load(f)
+    rules = [(rule["pattern"], rule["label"]) for rule in data["rules"]]
+    return RegexRuleEngine(rules, version=data.get("version"))
+
+
+Engine = load_rules()
+
+LINES = metrics.counter("log_classifier_regex_lines_total", "Lines checked against the regex rules")
+RULE_HITS = metrics.counter(
+    "log_classifier_regex_rule_hits_total", "Lines matched, by rule index and label", ["rule", "label"]
+)
+
+
+def _record(indices):
+    LINES.inc(len(indices))
+    for index, hits in Counter(i for i in indices if i is not None).items():
+        RULE_HITS.inc(hits, rule=index, label=Engine.rules[index][1])
+
+
 def classify_with_regex(log_message):
-    regex_patterns = {
-        r"User User\d+ logged (in|out).": "User Action",
-        r"Backup (started|ended) at .*": "System Notification",
-        r"Backup completed successfully.": "System Notification",
-        r"System updated to version .*": "System Notification",
-        r"File .* uploaded successfully by user .*": "System Notification",
-        r"Disk cleanup completed successfully.": "System Notification",
-        r"System reboot initiated by user .*": "System Notification",
-        r"Account with ID .* created by .*": "User Action"
-    }
-    for patern , label in regex_patterns.items():
-        if re.search(patern , log_message) :
-            return label
-    return None
\ No newline at end of file
+    return classify_with_regex_batch([log_message])[0]
+
+
+def classify_with_regex_batch(log_messages):
+    indices = [Engine.match_index(log_message) for log_message in log_messages]
+    _record(indices)
+    return [None if i is None else Engine.rules[i][1] for i in indices]
+
+
+def classify_with_regex_series(log_messages):
+    """Takes a pandas Series of lines, returns a Series of labels (None on miss); see RegexRuleEngine.match_series."""
+    return Engine.match_series(log_messages)
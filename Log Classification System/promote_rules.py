@@ -0,0 +1,217 @@
+"""Offline job: promote frequent, confidently BERT-labeled templates to regex rules.
+
+Run from the project root on the outputs (or inputs) of classification runs:
+    python promote_rules.py output.csv runs/*.parquet --min-count 50 --min-confidence 0.9
+    python promote_rules.py output.csv --dry-run
+
+Rows that no regex rule matches (the BERT tier's traffic) are mined into
+templates. A template becomes a rule when it covers at least --min-count
+rows and BERT labels a sample of its rows the same way with at least
+--min-confidence. The rule is the template with its masked and wildcard
+tokens turned back into regexes, anchored at both ends. Before it is kept,
+it is checked on held-out rows and on the training dataset: every row it
+would take over (i.e. not already taken by an earlier rule) must carry its
+label. Accepted rules are appended after the existing ones under a new
+version number. The previous file is kept in Rules/history/.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+
+from template_miner import MASKS, WILDCARD, TemplateMiner
+
+TRAINING_DATA = 'Training/dataset/synthetic_logs.csv'
+LLM_SOURCE = "LegacyCRM"
+
+# Regex for each mask token: the alternation of the patterns that produce it.
+MASK_REGEX = {}
+for _pattern, _token in MASKS:
+    MASK_REGEX.setdefault(_token, []).append(_pattern.pattern)
+MASK_REGEX = {token: f"(?:{'|'.join(patterns)})" for token, patterns in MASK_REGEX.items()}
+MASK_REGEX[WILDCARD] = r"\S+"
+_PLACEHOLDER = re.compile("(" + "|".join(re.escape(token) for token in MASK_REGEX) + ")")
+
+
+def template_regex(template):
+    """Anchored regex for a template: literal text escaped, placeholders expanded, any run of spaces."""
+    tokens = []
+    for token in template.split():
+        pieces = _PLACEHOLDER.split(token)
+        tokens.append("".join(MASK_REGEX.get(piece) or re.escape(piece) for piece in pieces if piece))
+    return "^" + r"\s+".join(tokens) + r"\s*$"
+
+
+def literal_tokens(template):
+    return sum(1 for token in template.split() if not _PLACEHOLDER.fullmatch(token))
+
+
+def read_rows(path):
+    """(source, log_message, label or None) rows of a CSV, Parquet or Arrow file."""
+    import pandas as pd
+    import columnar
+
+    fmt = columnar.format_for_path(path) or "csv"
+    if fmt == "parquet":
+        df = pd.read_parquet(path)
+    elif fmt in ("arrow", "arrow_stream"):
+        import pyarrow.ipc as ipc
+        df = (ipc.open_file if fmt == "arrow" else ipc.open_stream)(path).read_all().to_pandas()
+    else:
+        df = pd.read_csv(path)
+    labels = df["target_label"].astype(str) if "target_label" in df.columns else [None] * len(df)
+    return list(zip(df["source"].astype(str), df["log_message"].astype(str), labels))
+
+
+def _bert_labels(messages, batch_size):
+    from processor_bert import classify_with_bert_confidence
+    return classify_with_bert_confidence(messages, batch_size=batch_size)
+
+
+def mine_candidates(rows, min_count, sample_size, rng):
+    """Templates covering at least `min_count` rows, most frequent first, with a sample of their rows."""
+    miner = TemplateMiner()
+    samples = {}
+    for _, message, label in rows:
+        cluster_id = miner.add(message)
+        seen = miner.clusters[cluster_id].size
+        members = samples.setdefault(cluster_id, [])
+        # Reservoir sampling keeps a uniform sample of each cluster.
+        if len(members) < sample_size:
+            members.append((message, label))
+        else:
+            slot = rng.randrange(seen)
+            if slot < sample_size:
+                members[slot] = (message, label)
+    clusters = [(cluster_id, cluster) for cluster_id, cluster in enumerate(miner.clusters) if cluster.size >= min_count]
+    clusters.sort(key=lambda item: -item[1].size)
+    return [(cluster.template, cluster.size, samples[cluster_id]) for cluster_id, cluster in clusters]
+
+
+def promote(rows, engine, holdout_rows, min_count=50, min_confidence=0.9, min_literal_tokens=2,
+            sample_size=32, max_rules=50, batch_size=64, seed=0, report=print):
+    """Return the accepted rules as dicts, in priority order."""
+    rng = random.Random(seed)
+    candidates = mine_candidates(rows, min_count, sample_size, rng)
+    report(f"{len(rows)} rows without a regex match, {len(candidates)} templates with >= {min_count} rows")
+
+    # BERT labels for all sampled rows in one pass.
+    sampled = [message for _, _, members in candidates for message, _ in members]
+    predictions = iter(_bert_labels(sampled, batch_size))
+
+    proposals = []
+    for template, count, members in candidates:
+        scored = [(message, recorded, *next(predictions)) for message, recorded in members]
+        if literal_tokens(template) < min_literal_tokens:
+            report(f"  skip (too generic): {template}")
+            continue
+        labels = {label for _, _, label, _ in scored}
+        confidence = min(confidence for _, _, _, confidence in scored)
+        recorded = {label for _, label, _, _ in scored if label is not None}
+        label = next(iter(labels))
+        if len(labels) != 1 or confidence < min_confidence or (recorded and recorded != labels):
+            report(f"  skip (labels {sorted(labels | recorded)}, min confidence {confidence:.2f}): {template}")
+            continue
+        pattern = template_regex(template)
+        compiled = re.compile(pattern)
+        if not all(compiled.search(message) for message, _, _, _ in scored):
+            report(f"  skip (regex does not match its own rows): {template}")
+            continue
+        proposals.append({"pattern": pattern, "label": label, "compiled": compiled,
+                          "template": template, "count": count, "min_confidence": round(confidence, 4)})
+
+    # Holdout check, in priority order: a rule only answers the rows that
+    # neither the existing rules nor an earlier accepted rule already answer.
+    holdout = [(message, label) for source, message, label in holdout_rows
+               if source != LLM_SOURCE and engine.match(message) is None]
+    unlabeled = [message for message, label in holdout if label is None]
+    if unlabeled and proposals:
+        # Only held-out rows some proposal matches need a reference label.
+        matched = [m for m in unlabeled if any(p["compiled"].search(m) for p in proposals)]
+        reference = dict(zip(matched, (label for label, _ in _bert_labels(matched, batch_size))))
+        holdout = [(message, label if label is not None else reference.get(message)) for message, label in holdout]
+
+    accepted = []
+    remaining = holdout
+    for proposal in proposals:
+        if len(accepted) >= max_rules:
+            break
+        taken = [(message, label) for message, label in remaining if proposal["compiled"].search(message)]
+        conflicts = [(message, label) for message, label in taken if label is not None and label != proposal["label"]]
+        if conflicts:
+            message, label = conflicts[0]
+            report(f"  reject ({len(conflicts)}/{len(taken)} held-out rows disagree, e.g. {label!r}: {message!r}): "
+                   f"{proposal['template']}")
+            continue
+        remaining = [(message, label) for message, label in remaining if not proposal["compiled"].search(message)]
+        proposal["holdout_matches"] = len(taken)
+        accepted.append(proposal)
+        report(f"  accept {proposal['label']!r} ({proposal['count']} rows, {len(taken)} held out): "
+               f"{proposal['pattern']}")
+    return [
+        {"pattern": p["pattern"], "label": p["label"],
+         "promoted": {key: p[key] for key in ("template", "count", "min_confidence", "holdout_matches")}}
+        for p in accepted
+    ]
+
+
+def write_rules(rules_file, new_rules):
+    """Append `new_rules` under the next version number, keeping the old file in Rules/history/."""
+    with open(rules_file) as f:
+        data = json.load(f)
+    version = int(data.get("version", 0))
+    history = os.path.join(os.path.dirname(rules_file) or ".", "history")
+    os.makedirs(history, exist_ok=True)
+    shutil.copy(rules_file, os.path.join(history, f"{os.path.splitext(os.path.basename(rules_file))[0]}.v{version}.json"))
+    existing = {rule["pattern"] for rule in data["rules"]}
+    data["version"] = version + 1
+    data["rules"] = data["rules"] + [rule for rule in new_rules if rule["pattern"] not in existing]
+    tmp = rules_file + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=4)
+        f.write("\n")
+    os.replace(tmp, rules_file)
+    return data["version"]
+
+
+def main():
+    from processor_regex import RULES_FILE, load_rules
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("runs", nargs="+", help="CSV, Parquet or Arrow files with source and log_message "
+                                                "(and target_label, if they are classification outputs)")
+    parser.add_argument("--rules", default=RULES_FILE)
+    parser.add_argument("--min-count", type=int, default=50)
+    parser.add_argument("--min-confidence", type=float, default=0.9)
+    parser.add_argument("--min-literal-tokens", type=int, default=2, help="reject templates with fewer fixed words")
+    parser.add_argument("--sample-size", type=int, default=32, help="rows per template checked with BERT")
+    parser.add_argument("--holdout", type=float, default=0.2, help="share of rows held out for validation")
+    parser.add_argument("--max-rules", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dry-run", action="store_true", help="report, but do not write the rule file")
+    args = parser.parse_args()
+
+    engine = load_rules(args.rules)
+    rows = [row for path in args.runs for row in read_rows(path)]
+    rows = [row for row in rows if row[0] != LLM_SOURCE and engine.match(row[1]) is None]
+    random.Random(args.seed).shuffle(rows)
+    split = int(len(rows) * (1 - args.holdout))
+    holdout_rows = rows[split:] + (read_rows(TRAINING_DATA) if os.path.exists(TRAINING_DATA) else [])
+
+    new_rules = promote(
+        rows[:split], engine, holdout_rows, min_count=args.min_count, min_confidence=args.min_confidence,
+        min_literal_tokens=args.min_literal_tokens, sample_size=args.sample_size, max_rules=args.max_rules,
+        seed=args.seed,
+    )
+    if not new_rules:
+        print("no rules promoted")
+    elif args.dry_run:
+        print(f"{len(new_rules)} rules would be promoted (dry run)")
+    else:
+        print(f"{len(new_rules)} rules promoted, {args.rules} is now version {write_rules(args.rules, new_rules)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,152 @@
-from classify import classify
-from fastapi import FastAPI, UploadFile, HTTPException
-from fastapi.responses import FileResponse, RedirectResponse
+from classifier_registry import ModelValidationError
+from classify import classify, classify_frame, classify_with_tiers, route, shutdown_pools
+from fastapi import Depends, FastAPI, Header, Request, UploadFile, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import (
+    FileResponse, JSONResponse, PlainTextResponse, RedirectResponse, Response, StreamingResponse
+)
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from itertools import chain
+from jobs import JobQueue
+from micro_batcher import MicroBatcher
+from pydantic import BaseModel
+from typing import List, Optional, Union
+import asyncio
+import columnar
+import hmac
+import metrics
+import model_registry
+import os
 import pandas as pd
+import processor_bert
+import processor_llm
+import tempfile
+import time
+
+# Rows read, classified and sent back per step when streaming.
+CHUNK_ROWS = 5000
+# Worker processes for the regex/BERT tiers; 1 classifies in the server process.
+WORKERS = int(os.environ.get("CLASSIFY_WORKERS", "1"))
+
+
+# /classify/json gathers concurrent requests into batches of up to
+# MICRO_BATCH_SIZE records, waiting at most MICRO_BATCH_WAIT_MS for more.
+MICRO_BATCH_SIZE = int(os.environ.get("MICRO_BATCH_SIZE", "64"))
+MICRO_BATCH_WAIT_MS = float(os.environ.get("MICRO_BATCH_WAIT_MS", "5"))
+# Threads that classify the LegacyCRM records of /classify/json. They can wait
+# on the LLM for up to LLM_BUDGET seconds, so they do not borrow threads from
+# Starlette's pool, which also runs the uploads and streamed responses.
+LLM_REQUEST_THREADS = int(os.environ.get("LLM_REQUEST_THREADS", "4"))
+
+# Background jobs (/jobs): where their files live, how many run at once and
+# how long finished jobs are kept.
+JOBS_DIR = os.environ.get("JOBS_DIR", os.path.join(tempfile.gettempdir(), "log_classifier_jobs"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "1"))
+JOB_TTL = float(os.environ.get("JOB_TTL", str(24 * 3600)))
+
+# Exact duplicate (source, log_message) rows of an upload are classified once; DEDUPE=0 turns that off.
+DEDUPE = os.environ.get("DEDUPE", "1") != "0"
+
+# Set WARM_UP=0 to skip loading the models at startup; they then load on first use.
+WARM_UP = os.environ.get("WARM_UP", "1") != "0"
+
+# Seconds between checks of MODEL_PATH for a new classifier file; 0 turns the
+# watcher off, leaving POST /admin/models/reload. Classifier files can only be
+# loaded from MODEL_PATH's directory.
+MODEL_WATCH_INTERVAL = float(os.environ.get("MODEL_WATCH_INTERVAL", "10"))
+MODELS_DIR = os.path.dirname(os.path.abspath(processor_bert.MODEL_PATH))
+
+# Bearer token for the /admin endpoints; without one they answer 403.
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+
+REQUEST_ROWS = metrics.counter("log_classifier_request_rows_total", "Rows received, by endpoint", ["endpoint"])
+REQUEST_ROWS_PER_SECOND = metrics.histogram(
+    "log_classifier_request_rows_per_second", "Classification throughput of each request, by endpoint",
+    (10, 100, 1000, 5000, 10000, 50000, 100000, 500000), ["endpoint"],
+)
+
+
+def _record_request(endpoint, rows, start):
+    seconds = time.perf_counter() - start
+    REQUEST_ROWS.inc(rows, endpoint=endpoint)
+    if rows and seconds > 0:
+        REQUEST_ROWS_PER_SECOND.observe(rows / seconds, endpoint=endpoint)
+
+
+def _classify_records(records):
+    tiers = []
+    labels = classify([(r.source, r.log_message) for r in records], batch_size=MICRO_BATCH_SIZE, tiers=tiers)
+    return list(zip(labels, tiers))
+
+
+batcher = MicroBatcher(
+    _classify_records,
+    max_batch_size=MICRO_BATCH_SIZE,
+    max_wait=MICRO_BATCH_WAIT_MS / 1000,
+)
+llm_executor = ThreadPoolExecutor(max_workers=LLM_REQUEST_THREADS, thread_name_prefix="llm-request")
+
+
+async def _classify_batch(batch):
+    # Only regex/BERT records are micro-batched. LegacyCRM records can wait on
+    # the LLM for up to LLM_BUDGET seconds, so they are classified on their
+    # own instead of holding up every record batched with them.
+    llm_rows = [i for i, r in enumerate(batch) if route(r.source) == "llm"]
+    if not llm_rows:
+        return await batcher.submit(batch)
+    llm_set = set(llm_rows)
+    other_rows = [i for i in range(len(batch)) if i not in llm_set]
+    other_results, llm_results = await asyncio.gather(
+        batcher.submit([batch[i] for i in other_rows]),
+        asyncio.get_running_loop().run_in_executor(llm_executor, _classify_records, [batch[i] for i in llm_rows]),
+    )
+    results = [None] * len(batch)
+    for rows, row_results in ((other_rows, other_results), (llm_rows, llm_results)):
+        for i, result in zip(rows, row_results):
+            results[i] = result
+    return results
+
+
+def _job_classifier():
+    # Every chunk of one job shares a single LLM budget.
+    deadline = processor_llm.request_deadline()
+    return lambda logs: classify_with_tiers(logs, WORKERS, dedupe=DEDUPE, deadline=deadline)
+
+
+job_queue = JobQueue(
+    JOBS_DIR, lambda logs: classify_with_tiers(logs, WORKERS, dedupe=DEDUPE), workers=JOB_WORKERS, ttl=JOB_TTL,
+    job_classifier=_job_classifier,
+)
+
+
+def _start_models():
+    model_registry.warm_up()
+    processor_bert.Model.get().watch(MODEL_WATCH_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Warm up in the background so the process starts serving (and answering
+    # /ready with 503) right away instead of blocking on the model load.
+    # The classifier file is watched once it has been loaded.
+    warm_up = asyncio.create_task(run_in_threadpool(_start_models)) if WARM_UP else None
+    batcher.start()
+    job_queue.start()
+    yield
+    job_queue.stop()
+    await batcher.stop()
+    if warm_up is not None and not warm_up.done():
+        warm_up.cancel()
+    if processor_bert.Model.loaded:
+        processor_bert.Model.get().stop()
+    shutdown_pools()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,6 +156,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def model_version_header(request: Request, call_next):
+    response = await call_next(request)
+    version = processor_bert.model_version()
+    if version is not None:
+        response.headers["X-Model-Version"] = version
+    return response
+
+
 # Serve static files from Front_End directory
 app.mount("/static", StaticFiles(directory="Front_End"), name="static")
 
@@ -22,70 +173,292 @@ app.mount("/static", StaticFiles(directory="Front_End"), name="static")
 async def read_root():
     return RedirectResponse(url="/static/app.html")
 
-@app.post("/classify/")
-async def classify_logs(file: UploadFile):
-    if not file.filename.endswith(".csv"):
-        raise HTTPException(status_code=400, detail="File must be a CSV")
+@app.get("/ready")
+async def ready():
+    # Without a warm-up the models load on first use, so there is nothing to wait for.
+    is_ready = model_registry.is_ready() or not WARM_UP
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={
+            "ready": is_ready,
+            # Tells the workers apart when several serve the same port.
+            "pid": os.getpid(),
+            "models": model_registry.status(),
+            "classifier_version": processor_bert.model_version(),
+        }
+    )
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
+
+class ModelFile(BaseModel):
+    # A file name in MODEL_PATH's directory; reload defaults to MODEL_PATH itself.
+    path: Optional[str] = None
+
+
+def _model_path(name):
+    path = os.path.abspath(os.path.join(MODELS_DIR, name))
+    if os.path.dirname(path) != MODELS_DIR:
+        raise HTTPException(status_code=400, detail=f"Classifier files must be in {MODELS_DIR}")
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail=f"No classifier file {name}")
+    return path
+
+
+def _require_admin(authorization: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set ADMIN_TOKEN to enable them")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token", headers={"WWW-Authenticate": "Bearer"})
+
+
+# The admin endpoints act on the worker process that happens to receive the
+# call. Under gunicorn with several workers the others keep their version, so
+# roll out a new classifier by replacing MODEL_PATH: every worker's watcher
+# picks it up. Responses carry the pid of the worker that answered.
+admin = [Depends(_require_admin)]
+
+
+async def _load_model(load, path):
+    # Loading and validating take a while, so they run off the event loop;
+    # requests keep being served by the active version meanwhile.
     try:
-        df = pd.read_csv(file.file)
+        return await run_in_threadpool(load, path)
+    except ModelValidationError as e:
+        raise HTTPException(status_code=422, detail=f"Classifier rejected: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Could not load classifier: {e}")
 
-        if "source" not in df.columns or "log_message" not in df.columns:
-            raise HTTPException(
-                status_code=400,
-                detail="CSV must contain 'source' and 'log_message' columns"
-            )
 
-        df["target_label"] = classify(
-            list(zip(df["source"], df["log_message"]))
-        )
+@app.get("/admin/models", dependencies=admin)
+async def list_models():
+    registry = await run_in_threadpool(processor_bert.Model.get)
+    return {**registry.describe(), "pid": os.getpid()}
 
-        output_file = "output.csv"
-        df.to_csv(output_file, index=False)
 
-        return FileResponse(
-            output_file,
-            media_type="text/csv",
-            filename="output.csv"
-        )
+@app.post("/admin/models/reload", dependencies=admin)
+async def reload_model(body: Optional[ModelFile] = None):
+    registry = await run_in_threadpool(processor_bert.Model.get)
+    path = _model_path(body.path) if body is not None and body.path else registry.path
+    active = await _load_model(registry.reload, path)
+    return {"active": active.describe(), "pid": os.getpid()}
 
-    except HTTPException:
-        raise
+
+@app.post("/admin/models/shadow", dependencies=admin)
+async def add_shadow_model(body: ModelFile):
+    if not body.path:
+        raise HTTPException(status_code=400, detail="path is required")
+    registry = await run_in_threadpool(processor_bert.Model.get)
+    shadow = await _load_model(registry.add_shadow, _model_path(body.path))
+    return {"shadow": shadow.describe(), "shadow_rate": registry.shadow_rate, "pid": os.getpid()}
+
+
+@app.delete("/admin/models/shadow/{version}", dependencies=admin)
+async def remove_shadow_model(version: str):
+    registry = await run_in_threadpool(processor_bert.Model.get)
+    if not registry.remove_shadow(version):
+        raise HTTPException(status_code=404, detail="Unknown shadow version")
+    return {"deleted": version, "pid": os.getpid()}
+
+
+class LogRecord(BaseModel):
+    source: str
+    log_message: str
+
+
+class LabeledLogRecord(LogRecord):
+    target_label: str
+    # regex, bert, llm, llm_cache, llm_index, fallback_index or fallback_bert
+    label_tier: str
+
+
+@app.post("/classify/json")
+async def classify_json(records: Union[LogRecord, List[LogRecord]]):
+    single = isinstance(records, LogRecord)
+    batch = [records] if single else records
+    start = time.perf_counter()
+    try:
+        results = await _classify_batch(batch)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    _record_request("json", len(batch), start)
+    labeled = [
+        LabeledLogRecord(source=r.source, log_message=r.log_message, target_label=label, label_tier=tier)
+        for r, (label, tier) in zip(batch, results)
+    ]
+    return labeled[0] if single else labeled
+
+
+def _check_columns(df):
+    if "source" not in df.columns or "log_message" not in df.columns:
+        raise HTTPException(
+            status_code=400,
+            detail="CSV must contain 'source' and 'log_message' columns"
+        )
+
+
+def _label(df, deadline=None):
+    return classify_frame(df, WORKERS, dedupe=DEDUPE, deadline=deadline)
+
+
+def _label_csv(upload):
+    # Reads, classifies and serializes the whole upload; runs in the threadpool
+    # so the event loop keeps serving /ready, /metrics and /classify/json.
+    start = time.perf_counter()
+    df = pd.read_csv(upload)
+    _check_columns(df)
+    df = _label(df, processor_llm.request_deadline())
+    _record_request("csv", len(df), start)
+    return df.to_csv(index=False), df.attrs.get("dedupe_ratio")
+
+
+def _stream_csv(first_chunk, chunks, upload):
+    # Runs in Starlette's threadpool while the response is being sent, so
+    # only one chunk of the upload is held in memory at a time.
+    start = time.perf_counter()
+    rows = 0
+    # One LLM budget for the whole upload, not one per chunk.
+    deadline = processor_llm.request_deadline()
+    try:
+        header = True
+        for chunk in chain([first_chunk], chunks):
+            rows += len(chunk)
+            yield _label(chunk, deadline).to_csv(index=False, header=header)
+            header = False
     finally:
-        file.file.close()
+        upload.file.close()
+        _record_request("csv", rows, start)
+
+
+def _classify_pairs(logs, deadline=None):
+    return classify_with_tiers(logs, WORKERS, dedupe=DEDUPE, deadline=deadline)
+
+
+def _stream_columnar(batches, upload, output_format):
+    # Like _stream_csv: pyarrow decodes, and the tiers classify, one batch at a time.
+    start = time.perf_counter()
+    rows = 0
+    deadline = processor_llm.request_deadline()
+
+    def classify_and_count(logs):
+        nonlocal rows
+        rows += len(logs)
+        return _classify_pairs(logs, deadline)
+
+    try:
+        yield from columnar.stream_labeled(batches, classify_and_count, output_format)
+    finally:
+        upload.file.close()
+        _record_request(output_format, rows, start)
 
-@app.post("/classify/")
-async def classify_logs(file: UploadFile):
-    if not file.filename.endswith(".csv"):
-        raise HTTPException(status_code=400, detail="File must be a CSV")
 
+async def _classify_columnar(file, input_format, output_format, stream):
+    headers = {
+        "Content-Disposition": f'attachment; filename="output{columnar.EXTENSIONS[output_format]}"'
+    }
+    media_type = columnar.MEDIA_TYPES[output_format]
     try:
-        df = pd.read_csv(file.file)
+        batches = columnar.iter_batches(file.file, input_format, CHUNK_ROWS)
+        first_batch = next(batches, None)
+    except Exception as e:
+        # Missing columns or a file pyarrow cannot read.
+        file.file.close()
+        raise HTTPException(status_code=400, detail=f"Could not read {input_format} upload: {e}")
+    batches = chain([first_batch], batches) if first_batch is not None else iter(())
+    body = _stream_columnar(batches, file, output_format)
+    if not stream:
+        # The whole classification happens while joining, so not on the event loop.
+        return Response(await run_in_threadpool(b"".join, body), media_type=media_type, headers=headers)
+    return StreamingResponse(body, media_type=media_type, headers=headers)
 
-        if "source" not in df.columns or "log_message" not in df.columns:
-            raise HTTPException(
-                status_code=400,
-                detail="CSV must contain 'source' and 'log_message' columns"
-            )
 
-        df["target_label"] = classify(
-            list(zip(df["source"], df["log_message"]))
-        )
+@app.post("/classify/")
+async def classify_logs(file: UploadFile, stream: bool = True, accept: str = Header(None)):
+    input_format = columnar.format_for_path(file.filename)
+    if input_format is None:
+        raise HTTPException(status_code=400, detail="File must be a CSV, Parquet or Arrow file")
+    # The Accept header picks the output format; by default it matches the upload.
+    output_format = columnar.format_for_media_type(accept) or input_format
+    if (input_format, output_format) != ("csv", "csv"):
+        return await _classify_columnar(file, input_format, output_format, stream)
 
-        output_file = "output.csv"
-        df.to_csv(output_file, index=False)
+    headers = {"Content-Disposition": 'attachment; filename="output.csv"'}
+    streaming = False
+    try:
+        if not stream:
+            content, dedupe_ratio = await run_in_threadpool(_label_csv, file.file)
+            if dedupe_ratio is not None:
+                headers["X-Dedupe-Ratio"] = f"{dedupe_ratio:.4f}"
+            return Response(content, media_type="text/csv", headers=headers)
 
-        return FileResponse(
-            output_file,
+        chunks = pd.read_csv(file.file, chunksize=CHUNK_ROWS)
+        # A header-only file still yields one empty chunk.
+        first_chunk = next(chunks)
+        _check_columns(first_chunk)
+        # Errors past this point can only cut the stream short, the status is already sent.
+        streaming = True
+        return StreamingResponse(
+            _stream_csv(first_chunk, chunks, file),
             media_type="text/csv",
-            filename="output.csv"
+            headers=headers
         )
 
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if not streaming:
+            file.file.close()
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(file: UploadFile, accept: str = Header(None)):
+    input_format = columnar.format_for_path(file.filename)
+    if input_format is None:
+        raise HTTPException(status_code=400, detail="File must be a CSV, Parquet or Arrow file")
+    output_format = columnar.format_for_media_type(accept) or input_format
+    try:
+        # Only stores the upload; classification runs in the job pool.
+        job_id = await run_in_threadpool(job_queue.submit, file.file, file.filename, input_format, output_format)
     finally:
         file.file.close()
+    return {"job_id": job_id, "status_url": f"/jobs/{job_id}", "result_url": f"/jobs/{job_id}/result"}
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    status = job_queue.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return status
+
+
+@app.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    status = job_queue.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    if status["status"] == "failed":
+        raise HTTPException(status_code=500, detail=status["error"])
+    path = job_queue.result_path(job_id)
+    if path is None:
+        raise HTTPException(status_code=409, detail=f"Job is {status['status']}")
+    output_format = status["output_format"]
+    return FileResponse(
+        path,
+        media_type=columnar.MEDIA_TYPES[output_format],
+        filename=f"output{columnar.EXTENSIONS[output_format]}",
+    )
+
+
+@app.delete("/jobs/{job_id}")
+async def delete_job(job_id: str):
+    if job_queue.status(job_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    if not job_queue.delete(job_id):
+        raise HTTPException(status_code=409, detail="Job is running")
+    return {"deleted": job_id}
@@ -0,0 +1,129 @@
+import re
+
+# Variable parts of a log line, masked before clustering. Order matters: the
+# more specific shapes have to be replaced before the bare-number rule.
+MASKS = [
+    (re.compile(r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b'), '<UUID>'),
+    (re.compile(r'\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b'), '<IP>'),
+    (re.compile(r'\b\d{4}-\d{2}-\d{2}(?:[ T]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?\b'), '<TS>'),
+    (re.compile(r'\b\d{1,2}/\d{1,2}/\d{2,4}(?: \d{1,2}:\d{2}(?::\d{2})?)?\b'), '<TS>'),
+    (re.compile(r'\b[0-9a-fA-F]{16,}\b'), '<HEX>'),
+    (re.compile(r'\b[\w\-]+\.(?:csv|txt|log|json|xml|pdf|zip|gz|tar|xlsx?|docx?|png|jpe?g)\b', re.IGNORECASE), '<FILE>'),
+    (re.compile(r'\bv?\d+(?:\.\d+)+\b'), '<VERSION>'),
+    (re.compile(r'\d+'), '<NUM>'),
+]
+
+WILDCARD = '<*>'
+
+
+def mask_variables(log_message):
+    for pattern, token in MASKS:
+        log_message = pattern.sub(token, log_message)
+    return log_message
+
+
+class LogCluster:
+    __slots__ = ('template_tokens', 'size', 'representative')
+
+    def __init__(self, template_tokens, representative):
+        self.template_tokens = template_tokens
+        self.size = 0
+        self.representative = representative
+
+    @property
+    def template(self):
+        return ' '.join(self.template_tokens)
+
+
+class TemplateMiner:
+    """Drain-style online template miner.
+
+    Lines are masked, tokenized and routed to a leaf keyed on token count and
+    first token. Inside the leaf a line joins the most similar cluster if at
+    least `sim_threshold` of its tokens agree with the cluster template; the
+    differing positions become wildcards. Identical masked lines skip the
+    tree search entirely.
+
+    The threshold is deliberately higher than Drain's usual 0.4. Every member
+    of a cluster inherits its representative's label, so a merge that is too
+    eager is a misclassification rather than just a coarser template.
+    """
+
+    def __init__(self, sim_threshold=0.8):
+        self.sim_threshold = sim_threshold
+        self.clusters = []
+        self._leaves = {}
+        self._seen = {}
+
+    def add(self, log_message):
+        masked = mask_variables(log_message)
+        cluster_id = self._seen.get(masked)
+        if cluster_id is None:
+            cluster_id = self._match_or_create(masked.split(), log_message)
+            self._seen[masked] = cluster_id
+        self.clusters[cluster_id].size += 1
+        return cluster_id
+
+    def _match_or_create(self, tokens, log_message):
+        leaf = self._leaves.setdefault((len(tokens), tokens[0] if tokens else ''), [])
+        best_id, best_sim, best_params = None, -1.0, -1
+        for cluster_id in leaf:
+            sim, params = self._similarity(self.clusters[cluster_id].template_tokens, tokens)
+            if sim > best_sim or (sim == best_sim and params > best_params):
+                best_id, best_sim, best_params = cluster_id, sim, params
+
+        if best_id is not None and best_sim >= self.sim_threshold:
+            cluster = self.clusters[best_id]
+            cluster.template_tokens = [
+                old if old == new else WILDCARD for old, new in zip(cluster.template_tokens, tokens)
+            ]
+            return best_id
+
+        self.clusters.append(LogCluster(list(tokens), log_message))
+        leaf.append(len(self.clusters) - 1)
+        return len(self.clusters) - 1
+
+    @staticmethod
+    def _similarity(template_tokens, tokens):
+        if not tokens:
+            return 1.0, 0
+        same, params = 0, 0
+        for old, new in zip(template_tokens, tokens):
+            if old == WILDCARD:
+                params += 1
+            elif old == new:
+                same += 1
+        return same / len(tokens), params
+
+    def template_counts(self):
+        return sorted(((cluster.template, cluster.size) for cluster in self.clusters), key=lambda item: -item[1])
+
+
+def group_logs(logs, route, sim_threshold=0.8):
+    """Group (source, log_message) rows by (route, template).
+
+    `route(source)` names the tier family a row belongs to; rows of different
+    routes never share a template, so a LegacyCRM line and an identical line
+    from another source are labeled independently.
+
+    Returns the representative row of each group, the group index of every
+    input row, and the template counts per route.
+    """
+    miners = {}
+    groups = {}
+    representatives = []
+    assignments = []
+    for source, log_message in logs:
+        key = route(source)
+        miner = miners.get(key)
+        if miner is None:
+            miner = miners[key] = TemplateMiner(sim_threshold)
+        group_key = (key, miner.add(log_message))
+        group = groups.get(group_key)
+        if group is None:
+            group = groups[group_key] = len(representatives)
+            representatives.append((source, log_message))
+        assignments.append(group)
+
+    template_counts = {key: miner.template_counts() for key, miner in miners.items()}
+    return representatives, assignments, template_counts
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The modules read Rules/ and Models/ relative to the project root, like the server does.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
@@ -0,0 +1,104 @@
+import pytest
+
+import classify
+
+
+def fake_tiers(monkeypatch, calls):
+    # Every tier labels a message with its own name, so the output shows which tier each row went to.
+    def llm_batch(messages, tiers=None, deadline=None):
+        calls.append(("llm", list(messages)))
+        tiers.extend(["llm"] * len(messages))
+        return [f"llm:{m}" for m in messages]
+
+    def regex_batch(messages):
+        calls.append(("regex", list(messages)))
+        return [f"regex:{m}" if m.startswith("rx") else None for m in messages]
+
+    def bert_batch(messages, batch_size=None):
+        calls.append(("bert", list(messages)))
+        return [f"bert:{m}" for m in messages]
+
+    monkeypatch.setattr(classify, "classify_with_llm_batch", llm_batch)
+    monkeypatch.setattr(classify, "classify_with_regex_batch", regex_batch)
+    monkeypatch.setattr(classify, "classify_with_bert_batch", bert_batch)
+
+
+LOGS = [
+    ("ModernCRM", "rx one"),
+    ("LegacyCRM", "legacy one"),
+    ("BillingSystem", "plain one"),
+    ("ModernHR", "rx two"),
+    ("LegacyCRM", "legacy two"),
+    ("AnalyticsEngine", "plain two"),
+]
+
+
+def test_classify_batches_each_tier_once_and_keeps_row_order(monkeypatch):
+    calls = []
+    fake_tiers(monkeypatch, calls)
+    tiers = []
+    labels = classify.classify(LOGS, mine_templates=False, tiers=tiers)
+    assert labels == [
+        "regex:rx one", "llm:legacy one", "bert:plain one", "regex:rx two", "llm:legacy two", "bert:plain two",
+    ]
+    assert tiers == ["regex", "llm", "bert", "regex", "llm", "bert"]
+    assert calls == [
+        ("llm", ["legacy one", "legacy two"]),
+        ("regex", ["rx one", "plain one", "rx two", "plain two"]),
+        ("bert", ["plain one", "plain two"]),
+    ]
+
+
+def test_classify_skips_tiers_without_rows(monkeypatch):
+    calls = []
+    fake_tiers(monkeypatch, calls)
+    assert classify.classify([("ModernCRM", "rx only")], mine_templates=False) == ["regex:rx only"]
+    assert [tier for tier, _ in calls] == ["regex"]
+
+
+def test_dedupe_pairs_matches_on_source_and_message():
+    first, inverse = classify.dedupe_pairs(
+        ["ModernCRM", "ModernCRM", "LegacyCRM", "ModernCRM", None, None],
+        ["disk full", "disk full", "disk full", "cpu hot", None, None],
+    )
+    assert list(first) == [0, 2, 3, 4]
+    assert list(inverse) == [0, 0, 1, 2, 3, 3]
+
+
+def test_classify_with_tiers_classifies_each_distinct_pair_once(monkeypatch):
+    seen = []
+
+    def classify_parallel(logs, workers, batch_size=None, tiers=None, deadline=None):
+        seen.extend(logs)
+        tiers.extend(["regex"] * len(logs))
+        return [message.upper() for _, message in logs]
+
+    monkeypatch.setattr(classify, "classify_parallel", classify_parallel)
+    before = classify.DEDUPE_ROWS.value(kind="input"), classify.DEDUPE_ROWS.value(kind="unique")
+    logs = [("ModernCRM", "disk full"), ("LegacyCRM", "disk full"), ("ModernCRM", "disk full"), ("ModernHR", "hi")]
+    report = {}
+    labels, tiers = classify.classify_with_tiers(logs, report=report)
+    assert labels == ["DISK FULL", "DISK FULL", "DISK FULL", "HI"]
+    assert tiers == ["regex"] * 4
+    assert seen == [logs[0], logs[1], logs[3]]
+    assert report == {"rows": 4, "unique_rows": 3, "dedupe_ratio": 0.25}
+    after = classify.DEDUPE_ROWS.value(kind="input"), classify.DEDUPE_ROWS.value(kind="unique")
+    assert (after[0] - before[0], after[1] - before[1]) == (4, 3)
+
+    seen.clear()
+    classify.classify_with_tiers(logs, dedupe=False)
+    assert seen == logs
+
+
+def test_classify_frame_reports_the_dedupe_ratio(monkeypatch):
+    pd = pytest.importorskip("pandas")
+
+    def classify_parallel(logs, workers, batch_size=None, tiers=None, deadline=None):
+        tiers.extend(["bert"] * len(logs))
+        return ["Label"] * len(logs)
+
+    monkeypatch.setattr(classify, "classify_parallel", classify_parallel)
+    df = pd.DataFrame({"source": ["A", "A", "A", "B"], "log_message": ["x", "x", "x", "x"], "host": [1, 2, 3, 4]})
+    df = classify.classify_frame(df)
+    assert list(df["target_label"]) == ["Label"] * 4 and list(df["label_tier"]) == ["bert"] * 4
+    assert df.attrs == {"rows": 4, "unique_rows": 2, "dedupe_ratio": 0.5}
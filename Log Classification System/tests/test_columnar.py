@@ -0,0 +1,113 @@
+import io
+
+import pytest
+
+import columnar
+
+pa = pytest.importorskip("pyarrow")
+
+ROWS = [
+    ("ModernCRM", "disk full"),
+    ("LegacyCRM", "case 5 stuck"),
+    ("BillingSystem", "payment failed"),
+    ("ModernHR", "user 7 logged in"),
+    ("LegacyCRM", "old api used"),
+]
+LABELS = {
+    "disk full": ("Error", "regex"),
+    "case 5 stuck": ("Workflow Error", "llm"),
+    "payment failed": ("Error", "bert"),
+    "user 7 logged in": ("User Action", "regex"),
+    "old api used": ("Deprecation Warning", "llm_cache"),
+}
+
+
+def classify_logs(logs):
+    return [LABELS[message][0] for _, message in logs], [LABELS[message][1] for _, message in logs]
+
+
+def write_input(path, fmt, rows=ROWS):
+    table = pa.table({
+        "host": [f"h{i}" for i in range(len(rows))],
+        "source": [source for source, _ in rows],
+        "log_message": [message for _, message in rows],
+    })
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        pq.write_table(table, path)
+    else:
+        import pyarrow.ipc as ipc
+        with ipc.new_file(path, table.schema) as writer:
+            writer.write_table(table)
+
+
+def read_output(path, fmt):
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        return pq.read_table(path)
+    import pyarrow.ipc as ipc
+    return ipc.open_file(path).read_all() if fmt == "arrow" else ipc.open_stream(path).read_all()
+
+
+@pytest.mark.parametrize("input_format", ["parquet", "arrow"])
+@pytest.mark.parametrize("output_format", ["parquet", "arrow", "arrow_stream"])
+def test_labels_come_back_in_order_across_batches(tmp_path, input_format, output_format):
+    source = tmp_path / ("input" + columnar.EXTENSIONS[input_format])
+    target = tmp_path / ("output" + columnar.EXTENSIONS[output_format])
+    write_input(str(source), input_format)
+    done = []
+    columnar.classify_file(source, target, classify_logs, batch_rows=2, input_format=input_format,
+                           output_format=output_format, progress=done.append)
+    table = read_output(str(target), output_format)
+    assert table.column_names == ["source", "log_message", "target_label", "label_tier"]
+    assert table.column("target_label").to_pylist() == [LABELS[m][0] for _, m in ROWS]
+    assert table.column("label_tier").to_pylist() == [LABELS[m][1] for _, m in ROWS]
+    assert sum(done) == len(ROWS) == columnar.count_rows(str(source), input_format)
+
+
+@pytest.mark.parametrize("output_format", ["arrow", "arrow_stream"])
+def test_labels_are_one_dictionary_extended_by_deltas(tmp_path, output_format):
+    source = tmp_path / "input.parquet"
+    target = tmp_path / ("output" + columnar.EXTENSIONS[output_format])
+    write_input(str(source), "parquet")
+    columnar.classify_file(source, target, classify_logs, batch_rows=2, output_format=output_format)
+    table = read_output(str(target), output_format)
+    labels = table.column("target_label")
+    assert pa.types.is_dictionary(labels.type)
+    # A label keeps the index it got in the first batch it appeared in.
+    dictionary = labels.chunks[-1].dictionary.to_pylist()
+    assert dictionary == ["Error", "Workflow Error", "User Action", "Deprecation Warning"]
+    for chunk in labels.chunks:
+        assert chunk.dictionary.to_pylist() == dictionary[:len(chunk.dictionary)]
+
+
+def test_csv_output_is_plain_strings(tmp_path):
+    source = tmp_path / "input.parquet"
+    write_input(str(source), "parquet")
+    target = tmp_path / "output.csv"
+    columnar.classify_file(source, target, classify_logs, batch_rows=2)
+    lines = target.read_text().splitlines()
+    assert lines[0] == '"source","log_message","target_label","label_tier"'
+    assert lines[2] == '"LegacyCRM","case 5 stuck","Workflow Error","llm"'
+
+
+def test_stream_labeled_yields_a_readable_arrow_stream():
+    table = pa.table({"source": [s for s, _ in ROWS], "log_message": [m for _, m in ROWS]})
+    pieces = list(columnar.stream_labeled(table.to_batches(max_chunksize=2), classify_logs, "arrow_stream"))
+    assert len(pieces) > 1
+    import pyarrow.ipc as ipc
+    result = ipc.open_stream(io.BytesIO(b"".join(pieces))).read_all()
+    assert result.column("target_label").to_pylist() == [LABELS[m][0] for _, m in ROWS]
+
+
+@pytest.mark.parametrize("name, fmt", [
+    ("logs.PARQUET", "parquet"), ("logs.arrows", "arrow_stream"), ("logs.txt", None),
+])
+def test_format_for_path(name, fmt):
+    assert columnar.format_for_path(name) == fmt
+
+
+def test_format_for_media_type():
+    assert columnar.format_for_media_type("text/html, application/vnd.apache.arrow.stream;q=0.9") == "arrow_stream"
+    assert columnar.format_for_media_type("application/x-parquet") == "parquet"
+    assert columnar.format_for_media_type(None) is None
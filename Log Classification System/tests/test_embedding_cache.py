@@ -0,0 +1,96 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from embedding_cache import EmbeddingCache, message_key
+
+
+@pytest.fixture
+def model_file(tmp_path):
+    path = tmp_path / "classifier.joblib"
+    path.write_bytes(b"v1")
+    return path
+
+
+def embedding(value):
+    return np.full(3, value, dtype=np.float32)
+
+
+def test_lookup_hits_after_store_and_ignores_whitespace(tmp_path, model_file):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), "encoder", model_file)
+    keys, entries = cache.lookup(["disk full", "cpu hot"])
+    assert entries == [None, None]
+    cache.store(keys, [embedding(1), embedding(2)], ["Alert", "Alert"])
+    _, entries = cache.lookup(["disk   full"])
+    assert entries[0][1] == "Alert"
+    np.testing.assert_array_equal(entries[0][0], embedding(1))
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_disk_tier_survives_a_restart(tmp_path, model_file):
+    path = str(tmp_path / "cache.sqlite")
+    cache = EmbeddingCache(path, "encoder", model_file)
+    cache.store([message_key("disk full")], [embedding(1)], ["Alert"])
+    _, entries = EmbeddingCache(path, "encoder", model_file).lookup(["disk full"])
+    assert entries[0][1] == "Alert"
+
+
+def test_new_classifier_drops_labels_and_keeps_embeddings(tmp_path, model_file):
+    path = str(tmp_path / "cache.sqlite")
+    cache = EmbeddingCache(path, "encoder", model_file)
+    cache.store([message_key("disk full")], [embedding(1)], ["Alert"])
+    model_file.write_bytes(b"v2")
+    for reopened in (EmbeddingCache(path, "encoder", model_file), cache):
+        reopened.set_model(model_file)
+        _, entries = reopened.lookup(["disk full"])
+        assert entries[0][1] is None
+        np.testing.assert_array_equal(entries[0][0], embedding(1))
+
+
+def test_new_encoder_drops_everything(tmp_path, model_file):
+    path = str(tmp_path / "cache.sqlite")
+    EmbeddingCache(path, "encoder", model_file).store([message_key("disk full")], [embedding(1)], ["Alert"])
+    _, entries = EmbeddingCache(path, "other-encoder", model_file).lookup(["disk full"])
+    assert entries == [None]
+
+
+def test_labels_of_a_swapped_out_classifier_are_not_stored(tmp_path, model_file):
+    cache = EmbeddingCache(None, "encoder", model_file)
+    cache.store([message_key("disk full")], [embedding(1)], ["Alert"], model_fingerprint="stale")
+    _, entries = cache.lookup(["disk full"])
+    assert entries[0][1] is None
+
+
+def test_memory_tier_is_an_lru(model_file):
+    cache = EmbeddingCache(None, "encoder", model_file, max_entries=2)
+    keys = [message_key(m) for m in ("a", "b", "c")]
+    cache.store(keys[:2], [embedding(1), embedding(2)], ["A", "B"])
+    cache.lookup(["a"])
+    cache.store(keys[2:], [embedding(3)], ["C"])
+    _, entries = cache.lookup(["a", "b", "c"])
+    assert [entry and entry[1] for entry in entries] == ["A", None, "C"]
+
+
+def test_disk_tier_evicts_the_least_recently_used_rows(tmp_path, model_file):
+    path = str(tmp_path / "cache.sqlite")
+    cache = EmbeddingCache(path, "encoder", model_file, max_entries=1, disk_max_entries=2)
+    cache.store([message_key("a")], [embedding(1)], ["A"])
+    cache.store([message_key("b")], [embedding(2)], ["B"])
+    cache._db.execute("UPDATE cache SET last_used = 0 WHERE key = ?", (message_key("a"),))
+    cache.store([message_key("c")], [embedding(3)], ["C"])
+    stored = {key for key, in cache._db.execute("SELECT key FROM cache")}
+    assert stored == {message_key("b"), message_key("c")}
+    assert cache.stats()["evictions"] == 1 and cache.stats()["disk_entries"] == 2
+
+
+def test_cache_files_without_last_used_are_upgraded(tmp_path, model_file):
+    path = str(tmp_path / "cache.sqlite")
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE cache (key TEXT PRIMARY KEY, embedding BLOB NOT NULL, label TEXT)")
+    db.commit()
+    db.close()
+    cache = EmbeddingCache(path, "encoder", model_file)
+    cache.store([message_key("a")], [embedding(1)], ["A"])
+    assert cache._db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert cache.stats()["disk_entries"] == 1
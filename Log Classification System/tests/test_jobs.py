@@ -0,0 +1,117 @@
+import io
+import time
+
+import pytest
+
+from jobs import JobQueue
+
+pd = pytest.importorskip("pandas")
+
+CSV = b"source,log_message,host\nModernCRM,disk full,a\nLegacyCRM,case stuck,b\nModernHR,disk full,c\n"
+
+
+def label_logs(logs):
+    return [message.upper() for _, message in logs], ["regex"] * len(logs)
+
+
+def wait_for(queue, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = queue.status(job_id)
+        if status["status"] in ("done", "failed"):
+            return status
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} still {status['status']}")
+
+
+@pytest.fixture
+def queues():
+    started = []
+
+    def make(root, classify_logs=label_logs, run=True, **options):
+        queue = JobQueue(str(root), classify_logs, **options)
+        if not run:
+            # Jobs stay queued until _run is called, like on a server killed before getting to them.
+            queue._pool.submit = lambda *args: None
+        started.append(queue)
+        return queue
+
+    yield make
+    for queue in started:
+        queue.stop()
+
+
+def test_a_job_labels_every_chunk_and_keeps_the_other_columns(tmp_path, queues):
+    queue = queues(tmp_path, chunk_rows=2)
+    job_id = queue.submit(io.BytesIO(CSV), "logs.csv", "csv", "csv")
+    status = wait_for(queue, job_id)
+    assert status["status"] == "done" and status["rows_done"] == status["rows_total"] == 3
+    output = pd.read_csv(queue.result_path(job_id))
+    assert list(output["target_label"]) == ["DISK FULL", "CASE STUCK", "DISK FULL"]
+    assert list(output["host"]) == ["a", "b", "c"]
+
+
+def test_each_job_gets_one_classifier_for_all_its_chunks(tmp_path, queues):
+    made = []
+
+    def job_classifier():
+        made.append(object())
+        return label_logs
+
+    queue = queues(tmp_path, chunk_rows=1, job_classifier=job_classifier)
+    wait_for(queue, queue.submit(io.BytesIO(CSV), "logs.csv", "csv", "csv"))
+    assert len(made) == 1
+
+
+def test_a_failing_job_records_its_error(tmp_path, queues):
+    def broken(logs):
+        raise RuntimeError("no model")
+
+    queue = queues(tmp_path, broken)
+    status = wait_for(queue, queue.submit(io.BytesIO(CSV), "logs.csv", "csv", "csv"))
+    assert status["status"] == "failed" and status["error"] == "RuntimeError: no model"
+    assert queue.result_path(status["job_id"]) is None
+
+
+def test_a_restart_reruns_jobs_left_running_by_the_earlier_server(tmp_path, queues):
+    earlier = queues(tmp_path, run=False)
+    job_id = earlier.submit(io.BytesIO(CSV), "logs.csv", "csv", "csv")
+    earlier._execute("UPDATE jobs SET status = 'running', started = ?, rows_done = 2 WHERE id = ?",
+                     (time.time() - 60, job_id))
+
+    restarted = queues(tmp_path)
+    restarted.start()
+    status = wait_for(restarted, job_id)
+    assert status["status"] == "done" and status["rows_done"] == 3
+
+
+def test_a_job_running_in_another_live_worker_is_left_alone(tmp_path, queues):
+    calls = []
+
+    def counting(logs):
+        calls.append(len(logs))
+        return label_logs(logs)
+
+    other = queues(tmp_path, run=False)
+    job_id = other.submit(io.BytesIO(CSV), "logs.csv", "csv", "csv")
+    worker = queues(tmp_path, counting)
+    other._execute("UPDATE jobs SET status = 'running', started = ? WHERE id = ?", (time.time(), job_id))
+
+    worker.start()
+    worker._run(job_id)
+    assert calls == [] and worker.status(job_id)["status"] == "running"
+
+
+def test_a_queued_job_is_claimed_once(tmp_path, queues):
+    calls = []
+
+    def counting(logs):
+        calls.append(len(logs))
+        return label_logs(logs)
+
+    first = queues(tmp_path, counting, run=False)
+    job_id = first.submit(io.BytesIO(CSV), "logs.csv", "csv", "csv")
+    second = queues(tmp_path, counting, run=False)
+    first._run(job_id)
+    second._run(job_id)
+    assert calls == [3] and first.status(job_id)["status"] == "done"
@@ -0,0 +1,98 @@
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+
+from label_index import LabelIndex, fcntl
+
+DIM = 8
+
+
+def vector(seed):
+    return np.random.default_rng(seed).normal(size=(1, DIM))
+
+
+def test_lookup_needs_k_agreeing_close_neighbors(tmp_path):
+    index = LabelIndex(str(tmp_path), "encoder", DIM, k=2, threshold=0.9)
+    first, second, other = np.zeros((3, 1, DIM))
+    first[0, 0] = 1
+    second[0, :2] = 1, 0.3
+    other[0, 2] = 1
+    assert index.lookup(first) == [None]
+    index.add(np.vstack([first, second]), ["Workflow Error", "Workflow Error"])
+    assert index.lookup(first + second) == ["Workflow Error"]
+    index.add(other, ["Deprecation Warning"])
+    assert index.lookup(first + other) == [None]
+    assert index.nearest(other + 0.01, threshold=0.9) == ["Deprecation Warning"]
+    assert index.stats() == {"hits": 1, "misses": 2, "hit_rate": 1 / 3, "entries": 3}
+
+
+def test_near_duplicates_with_the_same_label_are_skipped(tmp_path):
+    index = LabelIndex(str(tmp_path), "encoder", DIM)
+    base = vector(0)
+    assert index.add(np.vstack([base, base * 2]), ["A", "A"]) == 1
+    assert index.add(base, ["A"]) == 0
+    assert index.add(base, ["B"]) == 1
+    assert index.count == 2
+
+
+def test_rows_persist_and_grow_past_the_initial_capacity(tmp_path):
+    index = LabelIndex(str(tmp_path), "encoder", DIM, k=1)
+    vectors = np.vstack([vector(i) for i in range(1500)])
+    labels = [f"L{i}" for i in range(1500)]
+    assert index.add(vectors, labels) == 1500
+    reopened = LabelIndex(str(tmp_path), "encoder", DIM, k=1)
+    assert reopened.count == 1500
+    assert reopened.lookup(vectors[[7, 1400]]) == ["L7", "L1400"]
+
+
+def test_a_new_encoder_starts_over(tmp_path):
+    LabelIndex(str(tmp_path), "encoder", DIM).add(vector(0), ["A"])
+    assert LabelIndex(str(tmp_path), "other-encoder", DIM).count == 0
+
+
+def test_rows_added_by_another_instance_are_picked_up(tmp_path):
+    reader = LabelIndex(str(tmp_path), "encoder", DIM, k=1)
+    writer = LabelIndex(str(tmp_path), "encoder", DIM, k=1)
+    writer.add(vector(0), ["A"])
+    assert reader.lookup(vector(0)) == ["A"]
+    reader.add(vector(1), ["B"])
+    writer.add(vector(2), ["C"])
+    assert writer.labels == reader.labels[:2] + ["C"]
+
+
+def test_a_torn_append_is_cut_off(tmp_path):
+    index = LabelIndex(str(tmp_path), "encoder", DIM, k=1)
+    index.add(vector(0), ["A"])
+    with open(os.path.join(str(tmp_path), "labels.jsonl"), "a") as f:
+        f.write('"stray"\n')
+    index.add(vector(1), ["B"])
+    reopened = LabelIndex(str(tmp_path), "encoder", DIM, k=1)
+    assert reopened.labels == ["A", "B"]
+    assert reopened.lookup(vector(1)) == ["B"]
+
+
+def _append_rows(path, worker, rows):
+    index = LabelIndex(path, "encoder", DIM, k=1, duplicate_threshold=0.99999)
+    for j in range(rows):
+        seed = worker * 100000 + j
+        index.add(vector(seed), [f"L{seed}"])
+
+
+@pytest.mark.skipif(fcntl is None, reason="no cross-process file lock on this platform")
+def test_concurrent_appends_from_several_processes_keep_rows_and_labels_aligned(tmp_path):
+    path = str(tmp_path)
+    LabelIndex(path, "encoder", DIM)
+    processes = [multiprocessing.Process(target=_append_rows, args=(path, worker, 100)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert all(process.exitcode == 0 for process in processes)
+
+    index = LabelIndex(path, "encoder", DIM, k=1)
+    assert index.count == len(index.labels) == 400
+    expected = np.vstack([vector(int(label[1:])) for label in index.labels])
+    expected /= np.linalg.norm(expected, axis=1, keepdims=True)
+    np.testing.assert_allclose(index._matrix[:index.count], expected, atol=1e-5)
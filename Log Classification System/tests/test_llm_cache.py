@@ -0,0 +1,48 @@
+import llm_cache
+from llm_cache import LLMResponseCache
+
+
+def test_masked_variants_share_an_entry(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "llm.sqlite"), "v1", "model")
+    assert cache.key("Case 123 escalated by user 9") == cache.key("Case  4567 escalated by user 10")
+    cache.put_many([(cache.key("Case 123 escalated"), "Workflow Error")])
+    assert cache.get_many([cache.key("Case 9 escalated")]) == {cache.key("Case 9 escalated"): "Workflow Error"}
+
+
+def test_prompt_version_and_model_are_part_of_the_key(tmp_path):
+    path = str(tmp_path / "llm.sqlite")
+    cache = LLMResponseCache(path, "v1", "model")
+    cache.put_many([(cache.key("Case 1 escalated"), "Workflow Error")])
+    for other in (LLMResponseCache(path, "v2", "model"), LLMResponseCache(path, "v1", "other-model")):
+        assert other.get_many([other.key("Case 1 escalated")]) == {}
+
+
+def test_expired_entries_are_misses_and_purged(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+    cache = LLMResponseCache(str(tmp_path / "llm.sqlite"), "v1", "model", ttl=60)
+    key = cache.key("Case 1 escalated")
+    cache.put_many([(key, "Workflow Error")])
+    now[0] += 30
+    assert cache.get_many([key]) == {key: "Workflow Error"}
+    now[0] += 61
+    assert cache.get_many([key]) == {}
+    stats = cache.stats()
+    assert stats["expired"] == 1 and stats["entries"] == 0
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+    cache = LLMResponseCache(str(tmp_path / "llm.sqlite"), "v1", "model", ttl=0, max_entries=2)
+    a, b, c = (cache.key(f"message {name}") for name in "abc")
+    cache.put_many([(a, "A")])
+    now[0] += 1
+    cache.put_many([(b, "B")])
+    now[0] += 1
+    cache.get_many([a])
+    now[0] += 1
+    cache.put_many([(c, "C")])
+    assert cache.get_many([a, b, c]) == {a: "A", c: "C"}
+    assert cache.stats()["evictions"] == 1
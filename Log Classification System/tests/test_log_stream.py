@@ -0,0 +1,107 @@
+import os
+import threading
+
+import pytest
+
+from log_stream import IDLE, batches, buffered, follow_file, parse_records
+
+
+@pytest.mark.parametrize("line, record", [
+    ('{"source": "LegacyCRM", "log_message": "case 5 stuck"}', ("LegacyCRM", "case 5 stuck")),
+    ('{"log_message": "disk full"}', ("app", "disk full")),
+    ("ModernCRM,disk full", ("ModernCRM", "disk full")),
+    ('BillingSystem,"payment failed, retrying"', ("BillingSystem", "payment failed, retrying")),
+    ("User 12 logged in, session 5", ("app", "User 12 logged in, session 5")),
+    ("plain message", ("app", "plain message")),
+    ('{"not": "a record"}', ("app", '{"not": "a record"}')),
+])
+def test_auto_format(line, record):
+    assert list(parse_records([line + "\n"], default_source="app")) == [record]
+
+
+def test_forced_formats():
+    assert list(parse_records(["User 12 logged in, session 5"], record_format="csv")) == [
+        ("User 12 logged in", "session 5")
+    ]
+    assert list(parse_records(["ModernCRM,disk full"], "app", record_format="raw")) == [("app", "ModernCRM,disk full")]
+    with pytest.raises(ValueError):
+        list(parse_records([], record_format="xml"))
+
+
+def test_header_blank_lines_and_idle():
+    lines = ["source,log_message\n", "\n", IDLE, "ModernCRM,disk full\n"]
+    assert list(parse_records(lines)) == [IDLE, ("ModernCRM", "disk full")]
+
+
+def take_lines(follower, count, limit=500):
+    lines = []
+    for _ in range(limit):
+        line = next(follower)
+        if line is not IDLE:
+            lines.append(line)
+            if len(lines) == count:
+                return lines
+    raise AssertionError(f"got {lines}, expected {count} lines")
+
+
+def test_follow_file_joins_partial_lines(tmp_path):
+    path = tmp_path / "app.log"
+    path.write_text("")
+    follower = follow_file(str(path), poll=0.01)
+    assert next(follower) is IDLE
+    with open(path, "a") as f:
+        f.write("par")
+        f.flush()
+        assert next(follower) is IDLE
+        f.write("tial\n")
+    assert take_lines(follower, 1) == ["partial\n"]
+
+
+def test_follow_file_survives_rotation(tmp_path):
+    path = tmp_path / "app.log"
+    path.write_text("old line\n")
+    follower = follow_file(str(path), from_start=True, poll=0.01)
+    assert take_lines(follower, 1) == ["old line\n"]
+    with open(path, "a") as f:
+        f.write("written before the rotation\n")
+    os.rename(path, tmp_path / "app.log.1")
+    path.write_text("first line of the new file\n")
+    assert take_lines(follower, 2) == ["written before the rotation\n", "first line of the new file\n"]
+
+
+def test_follow_file_starts_over_after_truncation(tmp_path):
+    path = tmp_path / "app.log"
+    path.write_text("one\ntwo\n")
+    follower = follow_file(str(path), from_start=True, poll=0.01)
+    assert take_lines(follower, 2) == ["one\n", "two\n"]
+    path.write_text("new\n")
+    assert take_lines(follower, 1) == ["new\n"]
+
+
+def test_follow_file_stops_on_request(tmp_path):
+    path = tmp_path / "app.log"
+    path.write_text("a\n")
+    stop = threading.Event()
+    follower = follow_file(str(path), from_start=True, poll=0.01, stop=stop)
+    assert next(follower) == "a\n"
+    stop.set()
+    assert list(follower) in ([], [IDLE])
+
+
+def test_batches_flush_when_full_or_on_idle_after_max_wait():
+    assert list(batches(iter(range(5)), batch_size=2, max_wait=60)) == [[0, 1], [2, 3], [4]]
+    records = iter([1, IDLE, 2])
+    assert list(batches(records, batch_size=10, max_wait=0)) == [[1], [2]]
+
+
+def test_buffered_keeps_order_and_reraises_reader_errors():
+    items = buffered(iter(range(100)), max_buffer=3, poll=0.01)
+    assert [item for item in items if item is not IDLE] == list(range(100))
+
+    def failing():
+        yield 1
+        raise OSError("gone")
+
+    items = buffered(failing(), max_buffer=3, poll=0.01)
+    with pytest.raises(OSError):
+        list(items)
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from micro_batcher import MicroBatcher
+
+
+def run_batcher(handler, callers, **options):
+    async def main():
+        batcher = MicroBatcher(handler, **options)
+        batcher.start()
+        try:
+            return await asyncio.gather(*(batcher.submit(records) for records in callers), return_exceptions=True)
+        finally:
+            await batcher.stop()
+
+    return asyncio.run(main())
+
+
+def test_concurrent_callers_share_a_batch_and_get_their_own_labels_back():
+    batches = []
+
+    def handler(records):
+        batches.append(list(records))
+        return [record.upper() for record in records]
+
+    results = run_batcher(handler, [["a", "b"], ["c"], ["d", "e", "f"]], max_batch_size=64, max_wait=0.05)
+    assert results == [["A", "B"], ["C"], ["D", "E", "F"]]
+    assert batches == [["a", "b", "c", "d", "e", "f"]]
+
+
+def test_a_full_batch_is_sent_without_waiting_and_callers_are_not_split():
+    batches = []
+
+    def handler(records):
+        batches.append(list(records))
+        return records
+
+    results = run_batcher(handler, [["a", "b"], ["c", "d"], ["e"]], max_batch_size=3, max_wait=0.2)
+    assert results == [["a", "b"], ["c", "d"], ["e"]]
+    assert batches == [["a", "b", "c", "d"], ["e"]]
+
+
+def test_a_failing_batch_fails_every_caller_in_it():
+    def handler(records):
+        raise RuntimeError("model not loaded")
+
+    results = run_batcher(handler, [["a"], ["b"]], max_wait=0.05)
+    assert [type(result) for result in results] == [RuntimeError, RuntimeError]
+
+
+def test_empty_submissions_return_at_once():
+    assert run_batcher(pytest.fail, [[]]) == [[]]
@@ -0,0 +1,214 @@
+import asyncio
+import threading
+import time
+import types
+
+import processor_llm
+from processor_llm import CircuitBreaker, ConcurrencyLimit, LLMTier, TokenBucket
+
+
+class FakeClient:
+    """Stands in for AsyncGroq: answers every prompt with `answer(prompt)` after `delay` seconds."""
+
+    def __init__(self, answer=lambda prompt: "<category>Workflow Error</category>", delay=0.0):
+        self.prompts = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+        async def create(messages, **kwargs):
+            prompt = messages[0]["content"]
+            with self._lock:
+                self.prompts.append(prompt)
+                self.active += 1
+                self.max_active = max(self.max_active, self.active)
+            try:
+                await asyncio.sleep(delay)
+                content = answer(prompt)
+            finally:
+                with self._lock:
+                    self.active -= 1
+            message = types.SimpleNamespace(content=content)
+            return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=create))
+
+
+def make_tier(client, **options):
+    options.setdefault("concurrency", ConcurrencyLimit(8))
+    options.setdefault("rate_limit", TokenBucket(1000))
+    options.setdefault("breaker", CircuitBreaker(failures=5, cooldown=60))
+    return LLMTier(client, max_retries=0, call_timeout=5, **options)
+
+
+def test_token_bucket_spaces_requests_after_the_burst():
+    bucket = TokenBucket(rate=50, capacity=2)
+
+    async def take(n):
+        start = time.monotonic()
+        for _ in range(n):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    # Two tokens are there at once, the other eight come at 50 per second.
+    assert 0.14 <= asyncio.run(take(10)) < 0.5
+
+
+def test_concurrency_limit_is_shared_by_event_loops_in_several_threads():
+    limit = ConcurrencyLimit(2)
+    state = {"active": 0, "max": 0}
+    lock = threading.Lock()
+
+    async def call():
+        async with limit:
+            with lock:
+                state["active"] += 1
+                state["max"] = max(state["max"], state["active"])
+            await asyncio.sleep(0.01)
+            with lock:
+                state["active"] -= 1
+
+    async def batch():
+        await asyncio.gather(*(call() for _ in range(5)))
+
+    threads = [threading.Thread(target=asyncio.run, args=(batch(),)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert state["max"] == 2
+    assert limit._active == 0 and not limit._waiters
+
+
+def test_concurrency_limit_bounds_calls_of_a_batch():
+    client = FakeClient(delay=0.02)
+    categories = asyncio.run(make_tier(client, concurrency=ConcurrencyLimit(3)).classify(
+        [f"case {i} stuck" for i in range(12)], messages_per_request=1
+    ))
+    assert categories == ["Workflow Error"] * 12
+    assert client.max_active == 3
+
+
+def test_messages_are_batched_into_prompts_in_order():
+    def answer(prompt):
+        # A numbered line per message, or one "Log message:" line in a single-message prompt.
+        lines = [line for line in prompt.splitlines() if line[:1].isdigit() or "Log message:" in line]
+        return "\n".join(
+            "<category>Deprecation Warning</category>" if "old" in line else "<category>Workflow Error</category>"
+            for line in lines
+        )
+
+    client = FakeClient(answer)
+    messages = ["old api used", "case 1 stuck", "old sdk", "case 2 stuck", "old client"]
+    categories = asyncio.run(make_tier(client).classify(messages, messages_per_request=2))
+    assert len(client.prompts) == 3
+    assert categories == [
+        "Deprecation Warning", "Workflow Error", "Deprecation Warning", "Workflow Error", "Deprecation Warning",
+    ]
+
+
+def test_malformed_multi_answer_is_asked_one_message_at_a_time():
+    def answer(prompt):
+        # One tag for a prompt of several messages.
+        return "<category>Workflow Error</category>"
+
+    client = FakeClient(answer)
+    categories = asyncio.run(make_tier(client).classify(["a", "b", "c"], messages_per_request=3))
+    assert categories == ["Workflow Error"] * 3
+    assert len(client.prompts) == 4
+
+
+def test_process_wide_limits_are_shared():
+    tier = LLMTier(FakeClient(), max_retries=0)
+    assert tier._semaphore is processor_llm.CONCURRENCY
+    assert tier._bucket is processor_llm.RATE_LIMIT
+
+
+def test_breaker_opens_then_lets_one_trial_through_after_the_cooldown(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(processor_llm.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failures=2, cooldown=10)
+    breaker.record_failure()
+    assert breaker.state() == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state() == "open" and not breaker.allow()
+    now[0] += 10
+    assert breaker.state() == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow(), "only one trial call at a time"
+    breaker.record_success()
+    assert breaker.state() == "closed" and breaker.allow()
+
+
+def test_failed_trial_reopens_and_released_trial_frees_the_slot(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(processor_llm.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failures=1, cooldown=10)
+    breaker.record_failure()
+    now[0] += 10
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state() == "open"
+    now[0] += 10
+    assert breaker.allow()
+    # A call cut short by the budget is neither a success nor a failure.
+    breaker.release()
+    assert breaker.state() == "half_open" and breaker.allow()
+
+
+def test_open_breaker_fails_calls_fast():
+    breaker = CircuitBreaker(failures=1, cooldown=60)
+    breaker.record_failure()
+    client = FakeClient()
+    assert asyncio.run(make_tier(client, breaker=breaker).classify(["a", "b"], messages_per_request=1)) == [None, None]
+    assert client.prompts == []
+
+
+def test_budget_leaves_late_groups_unanswered_and_counts_each_once():
+    before = processor_llm.ERRORS.value(error="BudgetExceeded")
+    client = FakeClient(delay=0.3)
+    tier = make_tier(client, concurrency=ConcurrencyLimit(1), deadline=time.monotonic() + 0.1)
+    start = time.monotonic()
+    assert asyncio.run(tier.classify(["a", "b", "c"], messages_per_request=1)) == [None, None, None]
+    assert time.monotonic() - start < 0.3
+    assert processor_llm.ERRORS.value(error="BudgetExceeded") - before == 3
+    assert tier.breaker.state() == "closed", "running out of budget is not an LLM failure"
+
+
+def test_messages_the_llm_leaves_unanswered_fall_back_to_bert(monkeypatch):
+    import processor_bert
+
+    class NoClient:
+        async def __aenter__(self):
+            return FakeClient(delay=1.0)
+
+        async def __aexit__(self, *exc_info):
+            return False
+
+    monkeypatch.setattr(processor_llm.Cache, "get", lambda: None)
+    monkeypatch.setattr(processor_llm.Index, "get", lambda: None)
+    monkeypatch.setattr(processor_llm, "make_client", NoClient)
+    monkeypatch.setattr(processor_bert, "classify_with_bert_batch", lambda messages: ["Workflow Error"] * len(messages))
+    tiers = []
+    deadline = processor_llm.request_deadline(0.05)
+    categories = processor_llm.classify_with_llm_batch(["case 1 stuck", "case 2 stuck"], tiers=tiers, deadline=deadline)
+    assert categories == ["Workflow Error", "Workflow Error"]
+    assert tiers == ["fallback_bert", "fallback_bert"]
+
+
+def test_a_shared_deadline_is_not_renewed_per_call(monkeypatch):
+    seen = []
+
+    async def classify_uncached(log_msgs, messages_per_request, deadline=None, **options):
+        seen.append(deadline)
+        return ["Workflow Error"] * len(log_msgs), ["llm"] * len(log_msgs)
+
+    monkeypatch.setattr(processor_llm.Cache, "get", lambda: None)
+    monkeypatch.setattr(processor_llm, "_classify_uncached", classify_uncached)
+    deadline = processor_llm.request_deadline(30)
+    for chunk in (["a"], ["b"]):
+        processor_llm.classify_with_llm_batch(chunk, deadline=deadline)
+    processor_llm.classify_with_llm_batch(["c"])
+    assert seen[:2] == [deadline, deadline]
+    assert seen[2] != deadline
+    assert processor_llm.request_deadline(0) is None
@@ -0,0 +1,71 @@
+import pytest
+
+from benchmarks.regex_engine import legacy_classify_with_regex, sample_lines, synthetic_rules
+from processor_regex import RegexRuleEngine, _literal_anchor, load_rules
+
+ALTERNATION_RULES = [
+    ("Login failed|Password expired", "Security Alert"),
+    ("^Disk (full|almost full) on .*", "System Notification"),
+    ("Backup [a-z]+ at|restore started", "System Notification"),
+    (r"Token \|? rejected|\(audit\) denied", "Security Alert"),
+    ("User User\\d+ logged (in|out).", "User Action"),
+]
+
+ALTERNATION_LINES = [
+    "Login failed for admin",
+    "Password expired for admin",
+    "Disk full on node-3",
+    "Disk almost full on node-3",
+    "restore started by operator",
+    "Backup done at 10:00",
+    "Token | rejected",
+    "(audit) denied for user 12",
+    "User User42 logged out.",
+    "Nothing to see here",
+    "",
+]
+
+
+def assert_same_as_legacy(rules, lines):
+    engine = RegexRuleEngine(rules)
+    patterns = dict(rules)
+    for line in lines:
+        assert engine.match(line) == legacy_classify_with_regex(line, patterns), line
+
+
+def test_shipped_rules_match_legacy_loop():
+    rules = load_rules().rules + synthetic_rules(50)
+    assert_same_as_legacy(rules, sample_lines(5000))
+
+
+def test_alternation_rules_match_legacy_loop():
+    assert_same_as_legacy(ALTERNATION_RULES, ALTERNATION_LINES + sample_lines(500))
+
+
+def test_top_level_alternation_matches_either_branch():
+    engine = RegexRuleEngine([("Login failed|Password expired", "Security Alert")])
+    assert engine.match("Password expired for admin") == "Security Alert"
+    assert engine.match("Login failed for admin") == "Security Alert"
+
+
+@pytest.mark.parametrize("pattern, anchor", [
+    ("Login failed|Password expired", None),
+    ("^Backup (started|ended) at .*", "Backup "),
+    ("Disk [|] full", "Disk "),
+    (r"Token \| rejected", "Token "),
+    ("System updated to version .*", "System updated to version "),
+    ("Files? uploaded", "File"),
+])
+def test_literal_anchor(pattern, anchor):
+    assert _literal_anchor(pattern) == anchor
+
+
+@pytest.mark.parametrize("rules", [ALTERNATION_RULES[1:], ALTERNATION_RULES])
+def test_match_series_matches_match(rules):
+    pd = pytest.importorskip("pandas")
+    engine = RegexRuleEngine(rules)
+    lines = ALTERNATION_LINES + sample_lines(500) + [None, float("nan")]
+    series = pd.Series(lines, index=range(10, 10 + len(lines)))
+    labels = engine.match_series(series)
+    assert list(labels.index) == list(series.index)
+    assert list(labels) == [engine.match(line) for line in lines]
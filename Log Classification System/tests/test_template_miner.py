@@ -0,0 +1,54 @@
+import classify
+from template_miner import TemplateMiner, group_logs, mask_variables
+
+
+def test_mask_variables():
+    assert mask_variables("User User123 logged in from 10.0.0.1:8080") == "User User<NUM> logged in from <IP>"
+    assert mask_variables("Backup report_2024.csv done at 2024-05-01 10:00:00") == "Backup <FILE> done at <TS>"
+
+
+def test_lines_differing_in_variables_share_a_cluster():
+    miner = TemplateMiner()
+    first = miner.add("User User123 logged in.")
+    assert miner.add("User User9 logged in.") == first
+    assert miner.add("Disk 3 is full") != first
+    assert miner.template_counts()[0] == ("User User<NUM> logged in.", 2)
+
+
+def test_differing_tokens_become_wildcards():
+    miner = TemplateMiner()
+    cluster = miner.add("job alpha finished in time without errors")
+    assert miner.add("job beta finished in time without errors") == cluster
+    assert miner.clusters[cluster].template == "job <*> finished in time without errors"
+
+
+def test_dissimilar_lines_of_the_same_length_stay_apart():
+    miner = TemplateMiner(sim_threshold=0.8)
+    assert miner.add("job alpha finished cleanly") != miner.add("job beta crashed badly")
+
+
+def test_group_logs_keeps_routes_apart():
+    logs = [
+        ("ModernCRM", "User User1 logged in."),
+        ("LegacyCRM", "User User2 logged in."),
+        ("BillingSystem", "User User3 logged in."),
+    ]
+    representatives, assignments, template_counts = group_logs(logs, classify.route)
+    assert representatives == logs[:2]
+    assert assignments == [0, 1, 0]
+    assert set(template_counts) == {"regex_bert", "llm"}
+
+
+def test_classify_labels_one_representative_per_template(monkeypatch):
+    seen = []
+
+    def regex_batch(messages):
+        seen.extend(messages)
+        return ["User Action"] * len(messages)
+
+    monkeypatch.setattr(classify, "classify_with_regex_batch", regex_batch)
+    logs = [("ModernCRM", f"User User{i} logged in.") for i in range(50)]
+    report = {}
+    assert classify.classify(logs, report=report) == ["User Action"] * 50
+    assert seen == ["User User0 logged in."]
+    assert report["rows"] == 50 and report["unique_templates"] == 1
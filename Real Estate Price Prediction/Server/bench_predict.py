@@ -0,0 +1,67 @@
+"""Per-prediction cost of util.get_estimated_price, before and after the location index.
+
+Run from the Server directory:
+    python bench_predict.py --calls 20000
+
+"before" is the previous implementation: a list.index scan over the data
+columns and a fresh dense row for every call, passed to model.predict.
+"after" is util.get_estimated_price. Both price the same random houses, and
+the largest difference between their answers is printed as well.
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+import util
+
+
+def legacy_estimated_price(bundle, location , total_sqft , bath , balcony , bedroom):
+    data_columns = list(bundle.data_columns)
+    try :
+        loc_ind = data_columns.index(location.lower())
+    except :
+        loc_ind = -1
+
+    x = np.zeros(len(data_columns))
+
+    x[0] = total_sqft
+    x[1] = bath
+    x[2] = balcony
+    x[3] = bedroom
+
+    if loc_ind >= 0 :
+        x[loc_ind] = 1
+
+    return round(bundle.model.predict([x])[0] , 2)
+
+
+def time_calls(fn, houses):
+    start = time.perf_counter()
+    prices = [fn(*house) for house in houses]
+    return (time.perf_counter() - start) / len(houses) * 1e6, prices
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    bundle = util.load_save_artifacts()
+    rng = random.Random(args.seed)
+    houses = [
+        (rng.choice(bundle.locations), rng.uniform(500, 4000), rng.randint(1, 4), rng.randint(0, 3), rng.randint(1, 5))
+        for _ in range(args.calls)
+    ]
+
+    before_us, before = time_calls(lambda *house: legacy_estimated_price(bundle, *house), houses)
+    after_us, after = time_calls(lambda *house: util.get_estimated_price(*house, bundle=bundle), houses)
+    print(f'before: {before_us:8.2f} us per prediction')
+    print(f'after:  {after_us:8.2f} us per prediction ({before_us / after_us:.1f}x)')
+    print(f'largest price difference: {max(abs(a - b) for a, b in zip(before, after)):.4f}')
+
+
+if __name__ == '__main__':
+    main()
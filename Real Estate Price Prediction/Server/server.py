@@ -1,12 +1,19 @@
-from fastapi import FastAPI , Path , HTTPException , Query 
+from fastapi import FastAPI , Path , HTTPException , Query , Header , Depends
 from fastapi.responses import JSONResponse
 from fastapi.requests import Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
 import sys 
 import os 
 import json 
+import threading
+import hmac
+import io
+import numpy as np
+import pandas as pd
 import util
-from typing import Annotated   
+from typing import Annotated , Optional
 from pydantic import BaseModel , Field
 
 class House(BaseModel) : 
@@ -16,12 +23,37 @@ class House(BaseModel) :
     bath:Annotated[int , Field(... , description = "The number of bathroom")]
     location:Annotated[str , Field(... , description="The House's location")]
 
-app = FastAPI()
+# Seconds between checks of the artifact files for changes; 0 turns the watcher off.
+ARTIFACTS_WATCH_INTERVAL = float(os.environ.get('ARTIFACTS_WATCH_INTERVAL', '5'))
+# Most rows /predict_home_price/batch takes in one request.
+BATCH_MAX_ROWS = int(os.environ.get('BATCH_MAX_ROWS', '100000'))
+# Bearer token of the /admin endpoints; they answer 403 while it is unset.
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
 
-def load_data():
+# In the order util.get_estimated_prices expects them.
+NUMERIC_FIELDS = ('total_sqft', 'bath', 'balcony', 'bedroom')
+INTEGER_FIELDS = ('bath', 'balcony', 'bedroom')
+HOUSE_FIELDS = NUMERIC_FIELDS + ('location',)
+CSV_TYPES = {'text/csv', 'application/csv'}
+PARQUET_TYPES = {'application/vnd.apache.parquet', 'application/parquet', 'application/x-parquet'}
+UPLOAD_TYPES = {'.json': 'application/json', '.csv': 'text/csv', '.parquet': 'application/vnd.apache.parquet'}
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Loaded once here instead of on every request.
     util.load_save_artifacts()
+    stop = threading.Event()
+    if ARTIFACTS_WATCH_INTERVAL > 0:
+        threading.Thread(
+            target=util.watch_artifacts, args=(stop, ARTIFACTS_WATCH_INTERVAL), daemon=True
+        ).start()
+    yield
+    stop.set()
 
 
+app = FastAPI(lifespan=lifespan)
+
 
 app.add_middleware(
     CORSMiddleware,
@@ -33,16 +65,39 @@ app.add_middleware(
 
 
 
+@app.get('/ready')
+def ready():
+    if not util.is_loaded():
+        return JSONResponse(status_code=503, content={'ready': False})
+    bundle = util.get_bundle()
+    return {'ready': True, 'artifact_version': bundle.version, 'loaded_at': bundle.loaded_at}
+
+
+def _require_admin(authorization: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set ADMIN_TOKEN to enable them")
+    scheme, _, token = (authorization or '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token", headers={'WWW-Authenticate': 'Bearer'})
+
+
+@app.post('/admin/reload_artifacts', dependencies=[Depends(_require_admin)])
+async def reload_artifacts():
+    try:
+        bundle = await run_in_threadpool(util.load_save_artifacts)
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Reload failed, the previous artifacts are still served: {e}")
+    return {'artifact_version': bundle.version, 'loaded_at': bundle.loaded_at}
+
+
 @app.get('/get_location_names')
 def get_location_names():
-    load_data()
     return {
         'message' : util.get_location_names()
     }
 
 @app.post('/predict_home_price')
 async def predict_home_price(request: Request):
-    load_data()
     payload = House(**await request.json())
     try:
         total_sqft = payload.total_sqft
@@ -52,9 +107,117 @@ async def predict_home_price(request: Request):
         location = payload.location
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid input: {e}")
-    print(f"Here {payload}")
+    bundle = util.get_bundle()
+    try:
+        estimated_price = util.get_estimated_price(location, total_sqft, bath, balcony, bedroom, bundle)
+    except util.UnknownLocationError as e:
+        raise HTTPException(status_code=400, detail=f"{e}; see /get_location_names")
     return JSONResponse(
         content={
-            'estimated_price': util.get_estimated_price(location, total_sqft, bath, balcony, bedroom)
-        }
-    )
\ No newline at end of file
+            'estimated_price': estimated_price
+        },
+        headers={'X-Artifact-Version': bundle.version}
+    )
+
+
+def _json_batch(records):
+    if not isinstance(records, list):
+        raise HTTPException(status_code=400, detail="Expected a JSON array of houses")
+    errors = {}
+    rows = []
+    for i, record in enumerate(records):
+        if not isinstance(record, dict):
+            errors[i] = ['expected an object']
+            record = {}
+        rows.append(record)
+    # A field missing from a record is that record's error, not the batch's.
+    return pd.DataFrame.from_records(rows).reindex(columns=list(HOUSE_FIELDS)), errors
+
+
+async def _read_batch(request):
+    """The batch as a DataFrame in input order, plus the errors of rows that are not even records."""
+    content_type = request.headers.get('content-type', '').split(';')[0].strip().lower()
+    if content_type == 'multipart/form-data':
+        form = await request.form()
+        upload = form.get('file')
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Expected the houses in a 'file' form field")
+        body = await upload.read()
+        extension = os.path.splitext(upload.filename or '')[1].lower()
+        content_type = UPLOAD_TYPES.get(extension, (upload.content_type or '').lower())
+    else:
+        body = await request.body()
+
+    try:
+        if content_type == 'application/json':
+            return _json_batch(json.loads(body))
+        if content_type in CSV_TYPES:
+            frame = pd.read_csv(io.BytesIO(body))
+        elif content_type in PARQUET_TYPES:
+            frame = pd.read_parquet(io.BytesIO(body))
+        else:
+            raise HTTPException(
+                status_code=415,
+                detail=f"Send JSON, CSV or Parquet, not {content_type or 'an unspecified type'}",
+            )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not read the houses: {e}")
+    missing = [field for field in HOUSE_FIELDS if field not in frame.columns]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Missing columns: {', '.join(missing)}")
+    return frame, {}
+
+
+def _price_batch(frame, errors, bundle):
+    """Validate every row the way House does, then price the valid ones in a single pass."""
+    n = len(frame)
+    rejected = set(errors)
+
+    def reject(rows, detail):
+        # Rows that were not records at all keep just that one error.
+        for i in rows:
+            if i not in rejected:
+                errors.setdefault(i, []).append(detail(i))
+
+    numeric = np.empty((n, len(NUMERIC_FIELDS)))
+    for j, field in enumerate(NUMERIC_FIELDS):
+        missing = frame[field].isna().to_numpy()
+        values = pd.to_numeric(frame[field], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+        if field in INTEGER_FIELDS:
+            invalid, expected = ~np.isfinite(values) | (values != np.floor(values)), 'an integer'
+        else:
+            invalid, expected = ~(np.isfinite(values) & (values > 0)), 'a number greater than 0'
+        numeric[:, j] = values
+        reject(np.flatnonzero(invalid),
+               lambda i: f'{field}: ' + ('field required' if missing[i] else f'expected {expected}'))
+
+    reject(np.flatnonzero(frame['location'].isna().to_numpy()), lambda i: 'location: field required')
+    locations = frame['location'].astype(str).to_numpy()
+
+    valid = np.ones(n, dtype=bool)
+    valid[list(errors)] = False
+    prices = np.full(n, np.nan)
+    prices[valid], unknown = util.get_estimated_prices(locations[valid], numeric[valid], bundle)
+    for i in np.flatnonzero(valid)[unknown]:
+        errors[i] = [f'Unknown location {locations[i]!r}; see /get_location_names']
+
+    estimated = prices.astype(object)
+    estimated[np.isnan(prices)] = None
+    return {
+        'estimated_prices': estimated.tolist(),
+        'errors': [{'row': int(i), 'detail': '; '.join(errors[i])} for i in sorted(errors)],
+        'rows': n,
+        'priced': n - len(errors),
+    }
+
+
+@app.post('/predict_home_price/batch')
+async def predict_home_price_batch(request: Request):
+    frame, errors = await _read_batch(request)
+    if len(frame) > BATCH_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_ROWS} houses per batch")
+    bundle = util.get_bundle()
+    result = await run_in_threadpool(_price_batch, frame, errors, bundle)
+    return JSONResponse(content=result, headers={'X-Artifact-Version': bundle.version})
\ No newline at end of file
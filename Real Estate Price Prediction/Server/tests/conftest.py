@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The server imports util from its own directory, like uvicorn run from Server/.
+SERVER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER)
@@ -0,0 +1,80 @@
+import pytest
+
+pytest.importorskip('fastapi')
+pd = pytest.importorskip('pandas')
+
+import server  # noqa: E402
+import util  # noqa: E402
+from test_util import DATA_COLUMNS, LinearModel, bundle_for  # noqa: E402
+
+
+@pytest.fixture
+def bundle():
+    return bundle_for(LinearModel(len(DATA_COLUMNS)))
+
+
+def price(bundle, location, total_sqft, bath, balcony, bedroom):
+    return util.get_estimated_price(location, total_sqft, bath, balcony, bedroom, bundle)
+
+
+def test_every_valid_row_is_priced_in_input_order(bundle):
+    frame = pd.DataFrame({
+        'total_sqft': [1200, 850.5], 'bath': [2, 1], 'balcony': [1, 0], 'bedroom': [2, 1],
+        'location': ['Whitefield', 'r t nagar'],
+    })
+    result = server._price_batch(frame, {}, bundle)
+    assert result == {
+        'estimated_prices': [price(bundle, 'whitefield', 1200, 2, 1, 2), price(bundle, 'r t nagar', 850.5, 1, 0, 1)],
+        'errors': [],
+        'rows': 2,
+        'priced': 2,
+    }
+
+
+def test_invalid_rows_get_null_and_an_error_and_the_rest_is_priced(bundle):
+    frame = pd.DataFrame({
+        'total_sqft': [1200, -5, 1000, 900, None, 700],
+        'bath': [2, 1, 1.5, 1, 1, 'two'],
+        'balcony': [1, 0, 0, 1, 0, 0],
+        'bedroom': [2, 1, 1, 1, 1, 1],
+        'location': ['whitefield', 'whitefield', 'whitefield', 'atlantis', 'whitefield', None],
+    })
+    result = server._price_batch(frame, {}, bundle)
+    assert result['estimated_prices'] == [price(bundle, 'whitefield', 1200, 2, 1, 2), None, None, None, None, None]
+    assert result['errors'] == [
+        {'row': 1, 'detail': 'total_sqft: expected a number greater than 0'},
+        {'row': 2, 'detail': 'bath: expected an integer'},
+        {'row': 3, 'detail': "Unknown location 'atlantis'; see /get_location_names"},
+        {'row': 4, 'detail': 'total_sqft: field required'},
+        {'row': 5, 'detail': 'bath: expected an integer; location: field required'},
+    ]
+    assert (result['rows'], result['priced']) == (6, 1)
+
+
+def test_json_records_that_are_not_objects_keep_their_own_error(bundle):
+    frame, errors = server._json_batch([
+        {'total_sqft': 1200, 'bath': 2, 'balcony': 1, 'bedroom': 2, 'location': 'whitefield'},
+        'not a house',
+        {'total_sqft': 1200, 'bath': 2, 'balcony': 1, 'location': 'whitefield'},
+    ])
+    result = server._price_batch(frame, errors, bundle)
+    assert result['estimated_prices'][1:] == [None, None]
+    assert result['errors'] == [
+        {'row': 1, 'detail': 'expected an object'},
+        {'row': 2, 'detail': 'bedroom: field required'},
+    ]
+
+
+
+def test_admin_token(monkeypatch):
+    monkeypatch.setattr(server, 'ADMIN_TOKEN', '')
+    with pytest.raises(server.HTTPException) as disabled:
+        server._require_admin('Bearer anything')
+    assert disabled.value.status_code == 403
+
+    monkeypatch.setattr(server, 'ADMIN_TOKEN', 'secret')
+    for authorization in (None, 'Bearer wrong', 'Basic secret'):
+        with pytest.raises(server.HTTPException) as rejected:
+            server._require_admin(authorization)
+        assert rejected.value.status_code == 401
+    server._require_admin('Bearer secret')
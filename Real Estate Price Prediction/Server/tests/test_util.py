@@ -0,0 +1,101 @@
+import json
+import pickle
+
+import numpy as np
+import pytest
+from scipy import sparse
+
+import util
+from bench_predict import legacy_estimated_price
+
+DATA_COLUMNS = ('total_sqft', 'bath', 'balcony', 'bedroom',
+                'location_whitefield', 'location_r.t. nagar', 'location_1st phase jp nagar')
+
+
+class LinearModel:
+    """Just enough of a scikit-learn linear regression: coef_, intercept_ and predict on dense or sparse rows."""
+
+    def __init__(self, n_features, seed=0):
+        rng = np.random.default_rng(seed)
+        self.coef_ = rng.normal(size=n_features)
+        self.intercept_ = 12.5
+        self.n_features_in_ = n_features
+
+    def predict(self, features):
+        return np.asarray(features @ self.coef_).ravel() + self.intercept_
+
+
+class TreeModel(LinearModel):
+    """No coef_, so FeatureBuilder has to go through predict with dense rows."""
+
+    def __init__(self, n_features):
+        self._linear = LinearModel(n_features)
+        self.n_features_in_ = n_features
+
+    def predict(self, features):
+        assert not sparse.issparse(features), 'dense rows only'
+        return self._linear.predict(np.asarray(features))
+
+
+def bundle_for(model, data_columns=DATA_COLUMNS):
+    return util.ArtifactBundle(
+        data_columns=data_columns, locations=data_columns[util.NUMERIC_COLUMNS:], model=model,
+        features=util.FeatureBuilder(data_columns, model), version='test', loaded_at=0.0,
+    )
+
+
+HOUSES = [
+    ('location_whitefield', 1200, 2, 1, 2),
+    ('location_r.t. nagar', 850.5, 1, 0, 1),
+    ('location_1st phase jp nagar', 3000, 4, 3, 5),
+]
+
+
+@pytest.mark.parametrize('model', [LinearModel(len(DATA_COLUMNS)), TreeModel(len(DATA_COLUMNS))])
+def test_prices_match_the_dense_row_implementation(model):
+    bundle = bundle_for(model)
+    for house in HOUSES * 2:
+        assert util.get_estimated_price(*house, bundle=bundle) == pytest.approx(legacy_estimated_price(bundle, *house))
+
+
+@pytest.mark.parametrize('location', ['Whitefield', 'WHITEFIELD', ' whitefield ', 'location_whitefield'])
+def test_location_aliases(location):
+    bundle = bundle_for(LinearModel(len(DATA_COLUMNS)))
+    assert util.get_estimated_price(location, 1200, 2, 1, 2, bundle) == util.get_estimated_price(
+        'location_whitefield', 1200, 2, 1, 2, bundle)
+
+
+def test_punctuation_and_spacing_are_ignored():
+    features = util.FeatureBuilder(DATA_COLUMNS, LinearModel(len(DATA_COLUMNS)))
+    assert features.location_column('r t nagar') == features.location_column('R.T.  Nagar') == 5
+
+
+def test_unknown_location_raises():
+    bundle = bundle_for(LinearModel(len(DATA_COLUMNS)))
+    with pytest.raises(util.UnknownLocationError):
+        util.get_estimated_price('atlantis', 1200, 2, 1, 2, bundle)
+
+
+@pytest.mark.parametrize('model', [LinearModel(len(DATA_COLUMNS)), TreeModel(len(DATA_COLUMNS))])
+def test_batch_prices_match_single_prices(model):
+    bundle = bundle_for(model)
+    locations = [house[0] for house in HOUSES] + ['atlantis']
+    numeric = np.array([house[1:] for house in HOUSES] + [(1000, 1, 1, 1)], dtype=float)
+    prices, unknown = util.get_estimated_prices(locations, numeric, bundle)
+    assert list(unknown) == [False, False, False, True]
+    assert np.isnan(prices[3])
+    assert list(prices[:3]) == [util.get_estimated_price(*house, bundle=bundle) for house in HOUSES]
+
+
+def test_load_artifacts_rejects_a_model_that_does_not_fit_the_columns(tmp_path):
+    with open(tmp_path / util.COLUMNS_FILE, 'w') as f:
+        json.dump({'data_columns': list(DATA_COLUMNS)}, f)
+    with open(tmp_path / util.MODEL_FILE, 'wb') as f:
+        pickle.dump(LinearModel(len(DATA_COLUMNS) + 1), f)
+    with pytest.raises(ValueError, match='expects 8 features'):
+        util.load_artifacts(str(tmp_path))
+
+    with open(tmp_path / util.MODEL_FILE, 'wb') as f:
+        pickle.dump(LinearModel(len(DATA_COLUMNS)), f)
+    bundle = util.load_artifacts(str(tmp_path))
+    assert bundle.locations == DATA_COLUMNS[4:] and len(bundle.version) == 12
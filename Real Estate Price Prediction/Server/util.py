@@ -1,48 +1,246 @@
 
-import json 
+import hashlib
+import json
+import os
 import pickle
-import numpy as np 
-__locations = None
-__data_columns = None
-__model = None
-
-def get_estimated_price(location , total_sqft , bath , balcony , bedroom):
-    try :
-        loc_ind = __data_columns.index(location.lower())
-    except :
-        loc_ind = -1
-    
-    x = np.zeros(len(__data_columns))
-
-    x[0] = total_sqft
-    x[1] = bath
-    x[2] = balcony
-    x[3] = bedroom 
-    
-    if loc_ind >= 0 :
-        x[loc_ind] = 1
-    
-    return round(__model.predict([x])[0] , 2)
-
-
-def get_location_names():
-    return __locations
-
-def get_data_columns():
-    return __data_columns
-
-def load_save_artifacts():
-    global  __data_columns
-    global __locations
-    global __model
+import re
+import threading
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+import numpy as np
+from scipy import sparse
+
+ARTIFACTS_DIR = os.environ.get('ARTIFACTS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'artifacts'))
+COLUMNS_FILE = 'columns.json'
+MODEL_FILE = 'banglore_home_prices_model.pickle'
+
+
+NUMERIC_COLUMNS = 4
+LOCATION_PREFIX = 'location_'
+
+
+class UnknownLocationError(ValueError):
+    def __init__(self, location):
+        super().__init__(f'Unknown location {location!r}')
+        self.location = location
+
+
+def normalize_location(name):
+    """'location_R.T. Nagar', 'r t nagar' and ' R.T.  NAGAR ' all become 'r t nagar'."""
+    name = str(name).strip().lower()
+    if name.startswith(LOCATION_PREFIX):
+        name = name[len(LOCATION_PREFIX):]
+    return ' '.join(re.sub(r'[^0-9a-z]+', ' ', name).split())
+
+
+class FeatureBuilder:
+    """Feature rows for one set of data columns.
+
+    Locations are found in a dict built once, keyed by both the exact
+    lower-cased column name (what the model was trained on and what
+    /get_location_names returns) and its normalized alias. A row has at most
+    five non-zero entries: the four numeric features and one location.
+    Linear models are evaluated on just those entries; other models get a
+    per-thread buffer that is reused from call to call.
+    """
+
+    def __init__(self, data_columns, model):
+        index = {}
+        for column, name in enumerate(data_columns[NUMERIC_COLUMNS:], start=NUMERIC_COLUMNS):
+            index.setdefault(name.lower(), column)
+            index.setdefault(normalize_location(name), column)
+        self.location_index = MappingProxyType(index)
+        self.n_features = len(data_columns)
+        self.model = model
+        coef = getattr(model, 'coef_', None)
+        self._linear = coef is not None and np.ndim(coef) == 1 and hasattr(model, 'intercept_')
+        if self._linear:
+            self._coef = np.asarray(coef, dtype=float)
+            self._intercept = float(model.intercept_)
+        self._local = threading.local()
+
+    def location_column(self, location):
+        column = self.location_index.get(str(location).lower())
+        if column is None:
+            column = self.location_index.get(normalize_location(location))
+        if column is None:
+            raise UnknownLocationError(location)
+        return column
+
+    def row(self, location , total_sqft , bath , balcony , bedroom):
+        """The dense feature row in this thread's buffer; valid until the next call on the same thread."""
+        column = self.location_column(location)
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = self._local.buffer = np.zeros((1, self.n_features))
+        else:
+            buffer[0, self._local.column] = 0
+        buffer[0, :NUMERIC_COLUMNS] = (total_sqft, bath, balcony, bedroom)
+        buffer[0, column] = 1
+        self._local.column = column
+        return buffer
+
+    def predict(self, location , total_sqft , bath , balcony , bedroom):
+        if self._linear:
+            column = self.location_column(location)
+            coef = self._coef
+            return (self._intercept + coef[0] * total_sqft + coef[1] * bath + coef[2] * balcony
+                    + coef[3] * bedroom + coef[column])
+        return self.model.predict(self.row(location, total_sqft, bath, balcony, bedroom))[0]
+
+    def location_columns(self, locations):
+        """Column of each location, -1 where it is unknown; each distinct name is looked up once."""
+        names, inverse = np.unique(np.asarray(locations, dtype=str), return_inverse=True)
+        columns = np.empty(len(names), dtype=np.int64)
+        for i, name in enumerate(names):
+            try:
+                columns[i] = self.location_column(name)
+            except UnknownLocationError:
+                columns[i] = -1
+        return columns[inverse.reshape(-1)]
+
+    def matrix(self, numeric, columns):
+        """Sparse feature matrix for an (n, 4) array of numeric features and n location columns."""
+        n = len(columns)
+        indices = np.empty((n, NUMERIC_COLUMNS + 1), dtype=np.int64)
+        indices[:, :NUMERIC_COLUMNS] = np.arange(NUMERIC_COLUMNS)
+        indices[:, NUMERIC_COLUMNS] = columns
+        data = np.ones((n, NUMERIC_COLUMNS + 1))
+        data[:, :NUMERIC_COLUMNS] = numeric
+        indptr = np.arange(0, indices.size + 1, NUMERIC_COLUMNS + 1)
+        return sparse.csr_matrix((data.ravel(), indices.ravel(), indptr), shape=(n, self.n_features))
+
+    def predict_many(self, numeric, columns):
+        """One model.predict call for the whole batch; every column must be a known location."""
+        if not len(columns):
+            return np.empty(0)
+        features = self.matrix(numeric, columns)
+        # scikit-learn's linear models take the sparse matrix as is; other
+        # models may not, and get it densified.
+        return self.model.predict(features if self._linear else features.toarray())
+
+
+@dataclass(frozen=True)
+class ArtifactBundle:
+    # Everything a prediction needs, loaded together and never modified, so
+    # a request that took a bundle keeps a consistent view across a reload.
+    data_columns: tuple
+    locations: tuple
+    model: object
+    features: FeatureBuilder
+    version: str
+    loaded_at: float
+
+
+__bundle = None
+__lock = threading.Lock()
+
+
+def _fingerprint(paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+def load_artifacts(artifacts_dir=ARTIFACTS_DIR):
+    columns_path = os.path.join(artifacts_dir, COLUMNS_FILE)
+    model_path = os.path.join(artifacts_dir, MODEL_FILE)
+    with open(columns_path , "r") as f :
+        data_columns = tuple(json.load(f)['data_columns'])
+
+    with open(model_path , 'rb') as f :
+        model = pickle.load(f)
+
+    if not hasattr(model, 'predict'):
+        raise ValueError(f'{model_path} does not hold a model with predict()')
+    n_features = getattr(model, 'n_features_in_', len(data_columns))
+    if n_features != len(data_columns):
+        raise ValueError(f'the model expects {n_features} features, {columns_path} lists {len(data_columns)}')
+    return ArtifactBundle(
+        data_columns=data_columns,
+        locations=data_columns[NUMERIC_COLUMNS:],
+        model=model,
+        features=FeatureBuilder(data_columns, model),
+        version=_fingerprint([columns_path, model_path]),
+        loaded_at=time.time(),
+    )
+
+
+def get_bundle():
+    if __bundle is None:
+        raise RuntimeError('artifacts are not loaded, call load_save_artifacts() first')
+    return __bundle
+
+
+def is_loaded():
+    return __bundle is not None
+
+
+def get_estimated_price(location , total_sqft , bath , balcony , bedroom, bundle=None):
+    """Raises UnknownLocationError for a location that is neither a data column nor an alias of one."""
+    bundle = bundle or get_bundle()
+    return round(float(bundle.features.predict(location, total_sqft, bath, balcony, bedroom)) , 2)
+
+
+def get_estimated_prices(locations, numeric, bundle=None):
+    """Prices for n houses given n locations and an (n, 4) array of total_sqft, bath, balcony and bedroom.
+
+    Returns the prices (NaN where the location is unknown) and a boolean mask of the unknown rows.
+    """
+    bundle = bundle or get_bundle()
+    columns = bundle.features.location_columns(locations)
+    unknown = columns < 0
+    prices = np.full(len(columns), np.nan)
+    prices[~unknown] = np.round(bundle.features.predict_many(numeric[~unknown], columns[~unknown]), 2)
+    return prices, unknown
+
+
+def get_location_names(bundle=None):
+    return list((bundle or get_bundle()).locations)
+
+def get_data_columns(bundle=None):
+    return list((bundle or get_bundle()).data_columns)
+
+def load_save_artifacts(artifacts_dir=ARTIFACTS_DIR):
+    """Load the artifacts into a new bundle and swap it in; the old bundle serves until then."""
+    global __bundle
 
     print("Loading saved artifacts...start")
-    with open('./artifacts/columns.json' , "r") as f :
-        __data_columns = json.load(f)['data_columns']
-        __locations = __data_columns[4:]
+    # Only one reload at a time; readers never wait, they just take the current bundle.
+    with __lock:
+        bundle = load_artifacts(artifacts_dir)
+        __bundle = bundle
+    print(f'Loading save artifacts is done, version {bundle.version}')
+    return bundle
+
+
+def _artifact_stamp(artifacts_dir):
+    stamp = []
+    for name in (COLUMNS_FILE, MODEL_FILE):
+        try:
+            stat = os.stat(os.path.join(artifacts_dir, name))
+            stamp.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            return None
+    return tuple(stamp)
 
-    with open('./artifacts/banglore_home_prices_model.pickle' , 'rb') as f :
-        __model = pickle.load(f)
 
-    print('Loading save artifacts is done')
-    
+def watch_artifacts(stop, interval, artifacts_dir=ARTIFACTS_DIR):
+    """Reload whenever the artifact files change, checking every `interval` seconds until `stop` is set."""
+    seen = _artifact_stamp(artifacts_dir)
+    while not stop.wait(interval):
+        current = _artifact_stamp(artifacts_dir)
+        if current is None or current == seen:
+            continue
+        # Both files are usually replaced together; wait until they stop changing.
+        time.sleep(interval / 2)
+        if _artifact_stamp(artifacts_dir) != current:
+            continue
+        seen = current
+        try:
+            load_save_artifacts(artifacts_dir)
+        except Exception as e:
+            print(f'Reloading artifacts failed, keeping version {__bundle.version if __bundle else None}: {e}')